@@ -1,9 +1,12 @@
 from app import create_app
 import os
 
-app = create_app()
+# flask --app app.py 使用模块级的app（gunicorn使用wsgi.py）；
+# PDF提取进程池以spawn启动子进程，子进程会以__mp_main__重新导入本文件，此时不创建应用
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
-    app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=debug)
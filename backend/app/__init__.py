@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, Request
 from flask_cors import CORS
 from pymongo import MongoClient
 import os
@@ -6,10 +6,28 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+class UploadRequest(Request):
+    """上传的PDF在Werkzeug解析multipart、写入临时文件时即计算内容哈希，不需要再完整读取一遍"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        from app.services.pdf_service import upload_stream_factory
+        return upload_stream_factory(total_content_length, content_type, filename, content_length)
+
 def create_app():
     app = Flask(__name__)
+    app.request_class = UploadRequest
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
     
+    # 上传大小限制：没有Content-Length的请求在读取超过限制时由Werkzeug中止（预留1MB给表单其他部分）
+    app.config['PDF_MAX_SIZE'] = int(os.getenv('PDF_MAX_SIZE', 50 * 1024 * 1024))
+    app.config['MAX_CONTENT_LENGTH'] = app.config['PDF_MAX_SIZE'] + 1024 * 1024
+    app.config['PDF_BULK_MAX_SIZE'] = int(os.getenv('PDF_BULK_MAX_SIZE', 500 * 1024 * 1024))
+    # 批量上传解压后的总大小同样受PDF_BULK_MAX_SIZE限制，PDF_BULK_MAX_FILES限制zip条目数与PDF总数
+    app.config['PDF_BULK_MAX_FILES'] = int(os.getenv('PDF_BULK_MAX_FILES', 1000))
+    
+    # 数据目录：相对路径按backend目录解析，不依赖启动时的工作目录
+    app.config['DATA_DIR'] = os.path.join(os.path.dirname(app.root_path), os.getenv('DATA_DIR', 'data'))
+    
     # 启用CORS
     CORS(app)
     
@@ -23,9 +41,13 @@ def create_app():
         db = client[os.getenv('MONGODB_DB_NAME', 'rag_learning_advisor')]
         app.db = db
         print("MongoDB连接成功")
+        
     except Exception as e:
         print(f"MongoDB连接失败: {e}")
     
+    # 服务在首次使用时创建，避免worker启动时导入sklearn、google.generativeai等重量级依赖
+    app.extensions['services'] = _create_service_registry(app)
+    
     # 注册蓝图
     from app.routes.pdf_routes import pdf_bp
     from app.routes.student_routes import student_bp
@@ -40,4 +62,160 @@ def create_app():
     def health_check():
         return {'status': 'healthy', 'message': 'RAG学习建议系统运行正常'}
     
-    return app
\ No newline at end of file
+    return app
+
+def _create_service_registry(app):
+    """注册应用使用的服务工厂"""
+    from app.services.registry import ServiceRegistry
+    
+    registry = ServiceRegistry()
+    db = getattr(app, 'db', None)
+    
+    def create_pdf_service():
+        from app.services.pdf_service import PDFService
+        extract_workers = os.getenv('PDF_EXTRACT_WORKERS')
+        return PDFService(
+            max_file_size=app.config['PDF_MAX_SIZE'],
+            extract_workers=int(extract_workers) if extract_workers else None,
+            parallel_min_pages=int(os.getenv('PDF_PARALLEL_MIN_PAGES', 32))
+        )
+    
+    def create_rag_service():
+        from app.services.rag_service import RAGService
+        return RAGService()
+    
+    def create_retrieval_index():
+        # 课程资料检索索引（首次检索时从MongoDB加载）
+        if db is None:
+            return None
+        from app.services.retrieval_service import RetrievalIndex
+        return RetrievalIndex(db)
+    
+    def create_course_relations():
+        # 课程相关度索引，索引为空时根据已有课程构建一次
+        if db is None:
+            return None
+        from app.services.course_relations import CourseRelationIndex
+        course_relations = CourseRelationIndex(
+            db,
+            k=int(os.getenv('COURSE_RELATIONS_TOP_K', 10)),
+            prereq_weight=float(os.getenv('COURSE_RELATIONS_PREREQ_WEIGHT', 0.5))
+        )
+        try:
+            course_relations.ensure_built()
+        except Exception as e:
+            print(f"构建课程相关度索引失败: {e}")
+        return course_relations
+    
+    def create_course_similarity():
+        # 课程相似度矩阵（内存映射文件，各worker共享），相似度来自课程相关度索引的课程向量，为空时构建一次
+        course_relations = registry.get('course_relations')
+        if course_relations is None:
+            return None
+        from app.services.course_similarity import CourseSimilarityMatrix
+        course_similarity = CourseSimilarityMatrix(
+            os.path.join(app.config['DATA_DIR'], os.getenv('COURSE_SIMILARITY_DIR', 'course_similarity')),
+            course_relations,
+            k=int(os.getenv('COURSE_SIMILARITY_TOP_K', 20))
+        )
+        if course_similarity.is_empty():
+            try:
+                course_similarity.rebuild(list(db.courses.find({}, {
+                    'course_code': 1, 'course_name': 1, 'description': 1, 'objectives': 1, 'topics': 1
+                })))
+            except Exception as e:
+                print(f"构建课程相似度矩阵失败: {e}")
+        return course_similarity
+    
+    def create_extraction_cache():
+        # PDF解析结果缓存（按文件内容哈希），PDF_CACHE_STORE_RAW为true时原始文件存入GridFS
+        if db is None:
+            return None
+        from app.services.extraction_cache import ExtractionCache
+        return ExtractionCache(db, store_raw=os.getenv('PDF_CACHE_STORE_RAW', 'false').lower() == 'true')
+    
+    def create_pdf_pipeline():
+        # 后台PDF导入流水线（上传时指定async=1），失败的导入保留上传的文件以便重试，超过PDF_INGEST_FAILED_TTL秒后删除
+        if db is None:
+            return None
+        from app.services.pdf_pipeline import IngestionPipeline
+        return IngestionPipeline(
+            db,
+            registry.get,
+            os.path.join(app.config['DATA_DIR'], os.getenv('PDF_INGEST_DIR', 'pdf_ingest')),
+            workers=int(os.getenv('PDF_INGEST_WORKERS', 2)),
+            max_pending=int(os.getenv('PDF_INGEST_MAX_PENDING', 32)),
+            failed_ttl=int(os.getenv('PDF_INGEST_FAILED_TTL', 7 * 24 * 3600))
+        )
+    
+    def create_advice_cache():
+        # 学习建议缓存
+        from app.services.advice_cache import AdviceCache
+        return AdviceCache(
+            db,
+            maxsize=int(os.getenv('ADVICE_CACHE_SIZE', 512)),
+            ttl_seconds=int(os.getenv('ADVICE_CACHE_TTL', 86400)),
+            memory_ttl_seconds=int(os.getenv('ADVICE_CACHE_MEMORY_TTL', 300))
+        )
+    
+    def create_cohort_analytics():
+        # 学生群体成绩分析
+        if db is None:
+            return None
+        from app.services.analytics_service import CohortAnalytics
+        return CohortAnalytics(db)
+    
+    def create_job_queue():
+        # 异步学习建议任务队列，创建时恢复重启前中断的任务
+        if db is None:
+            return None
+        from app.services.job_queue import JobQueue
+        from app.models.student import Student
+        from app.models.course import Course
+        
+        def run_advice_job(payload):
+            student_data = Student(db).get_student(payload['student_id'], include_grades=False)
+            if not student_data:
+                raise ValueError('学生不存在')
+            course_data = Course(db).get_course(payload['course_id'])
+            if not course_data:
+                raise ValueError('课程不存在')
+            
+            advice_result = registry.get('rag_service').generate_learning_advice(
+                student_data,
+                course_data,
+                retrieval_index=registry.get('retrieval_index'),
+                advice_cache=registry.get('advice_cache'),
+                course_relations=registry.get('course_relations'),
+                course_similarity=registry.get('course_similarity')
+            )
+            return {
+                'student_name': student_data['name'],
+                'course_name': course_data.get('course_name', ''),
+                'advice_result': advice_result
+            }
+        
+        job_queue = JobQueue(
+            db,
+            run_advice_job,
+            name='advice-jobs',
+            max_concurrency=int(os.getenv('ADVICE_JOB_CONCURRENCY', 4)),
+            stale_after=int(os.getenv('ADVICE_JOB_STALE_SECONDS', 300))
+        )
+        # 学生、课程数据变更时按载荷查找需解除去重的建议任务
+        db.jobs.create_index('payload.student_id', sparse=True)
+        db.jobs.create_index('payload.course_id', sparse=True)
+        job_queue.recover_stale()
+        return job_queue
+    
+    registry.register('pdf_service', create_pdf_service)
+    registry.register('rag_service', create_rag_service)
+    registry.register('retrieval_index', create_retrieval_index)
+    registry.register('course_relations', create_course_relations)
+    registry.register('course_similarity', create_course_similarity)
+    registry.register('extraction_cache', create_extraction_cache)
+    registry.register('pdf_pipeline', create_pdf_pipeline)
+    registry.register('advice_cache', create_advice_cache)
+    registry.register('cohort_analytics', create_cohort_analytics)
+    registry.register('job_queue', create_job_queue)
+    return registry
\ No newline at end of file
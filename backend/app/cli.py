@@ -0,0 +1,154 @@
+"""
+命令行工具
+
+用法:
+    cd backend && python -m app.cli ingest <目录> [--recursive] [--workers 4] [--batch-size 50]
+    cd backend && python -m app.cli migrate-grades
+    cd backend && python -m app.cli import-grades <文件> [--format csv|ndjson] [--batch-size 1000]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+
+def find_pdfs(directory: str, recursive: bool = False):
+    """目录中的PDF文件 [(相对路径, 绝对路径)]，按路径排序"""
+    paths = []
+    if recursive:
+        for root, _, names in os.walk(directory):
+            paths.extend(os.path.join(root, name) for name in names if name.lower().endswith('.pdf'))
+    else:
+        paths = [
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.lower().endswith('.pdf') and os.path.isfile(os.path.join(directory, name))
+        ]
+    return [(os.path.relpath(path, directory), os.path.abspath(path)) for path in sorted(paths)]
+
+
+def ingest(args) -> int:
+    from app import create_app
+    from app.services.pdf_ingest import PDFIngestor
+
+    if not os.path.isdir(args.directory):
+        print(f"目录不存在: {args.directory}", file=sys.stderr)
+        return 2
+
+    files = find_pdfs(args.directory, args.recursive)
+    if not files:
+        print(f"目录中没有PDF文件: {args.directory}", file=sys.stderr)
+        return 1
+
+    app = create_app()
+    registry = app.extensions['services']
+    with app.app_context():
+        pdf_service = registry.get('pdf_service')
+        ingestor = PDFIngestor(
+            app.db,
+            pdf_service,
+            extraction_cache=registry.get('extraction_cache'),
+            retrieval_index=registry.get('retrieval_index'),
+            course_relations=registry.get('course_relations'),
+            course_similarity=registry.get('course_similarity'),
+            workers=args.workers,
+            batch_size=args.batch_size
+        )
+
+        failed = 0
+        parsed = set()  # 已解析的文件序号，写入结果行不再计入进度
+        for line in ingestor.ingest(files):
+            if args.json:
+                print(json.dumps(line, ensure_ascii=False, default=str), flush=True)
+            elif 'summary' in line:
+                summary = line['summary']
+                print(f"完成: 共{summary['total']}个文件，成功{summary['succeeded']}个"
+                      f"（缓存{summary['cached']}个），失败{summary['failed']}个，涉及{summary['courses']}门课程")
+            elif line['status'] == 'parsed':
+                parsed.add(line['index'])
+                print(f"[{len(parsed)}/{len(files)}] {line['filename']}: 已解析 {line['course_code']}", flush=True)
+            elif line['status'] == 'ok':
+                print(f"{line['filename']}: 已写入 {line['course_code']} {line['course_name']}", flush=True)
+            elif line['index'] in parsed:
+                print(f"{line['filename']}: 写入失败 - {line['error']}", flush=True)
+            else:
+                parsed.add(line['index'])
+                print(f"[{len(parsed)}/{len(files)}] {line['filename']}: 失败 - {line['error']}", flush=True)
+            if line.get('status') == 'error':
+                failed += 1
+    return 1 if failed else 0
+
+
+def migrate_grades(args) -> int:
+    from app import create_app
+    from app.models.student import Student
+
+    app = create_app()
+    with app.app_context():
+        student_model = Student(app.db)
+        students, grades = student_model.migrate_grades()
+        courses = student_model.grade_buckets.normalize_courses()
+    print(f"完成: 迁移{students}名学生的{grades}条成绩到grade_buckets集合，规范化{courses}条成绩的课程代码")
+    return 0
+
+
+def import_grades(args) -> int:
+    from app import create_app
+    from app.services.grade_import import GradeImporter, grade_format
+
+    if not os.path.isfile(args.file):
+        print(f"文件不存在: {args.file}", file=sys.stderr)
+        return 2
+
+    app = create_app()
+    with app.app_context(), open(args.file, 'rb') as stream:
+        importer = GradeImporter(app.db, batch_size=args.batch_size)
+        try:
+            lines = importer.import_file(stream, args.format or grade_format(args.file))
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+
+        failed = 0
+        for line in lines:
+            if args.json:
+                print(json.dumps(line, ensure_ascii=False, default=str), flush=True)
+            elif 'summary' in line:
+                summary = line['summary']
+                print(f"完成: 共{summary['total']}行，导入{summary['imported']}行，"
+                      f"失败{summary['failed']}行，涉及{summary['students']}名学生")
+            else:
+                print(f"第{line['line']}行: {line['error']}", flush=True)
+            if line.get('status') == 'error':
+                failed += 1
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m app.cli', description='RAG学习建议系统命令行工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help='批量导入目录中的课程PDF')
+    ingest_parser.add_argument('directory', help='PDF所在目录')
+    ingest_parser.add_argument('--recursive', action='store_true', help='包含子目录')
+    ingest_parser.add_argument('--workers', type=int, default=None, help='解析进程数（默认取PDF_EXTRACT_WORKERS或CPU核数，最多4）')
+    ingest_parser.add_argument('--batch-size', type=int, default=50, help='每次bulk_write写入的课程数')
+    ingest_parser.add_argument('--json', action='store_true', help='以NDJSON输出每个文件的结果')
+    ingest_parser.set_defaults(handler=ingest)
+
+    migrate_parser = subparsers.add_parser('migrate-grades', help='把学生文档中内嵌的成绩迁移到分桶集合、规范化课程代码并创建索引')
+    migrate_parser.set_defaults(handler=migrate_grades)
+
+    import_parser = subparsers.add_parser('import-grades', help='从CSV或NDJSON文件批量导入成绩')
+    import_parser.add_argument('file', help='成绩文件，每行包含student_id、course、score，可选semester、year')
+    import_parser.add_argument('--format', choices=('csv', 'ndjson'), default=None, help='文件格式（默认按扩展名判断）')
+    import_parser.add_argument('--batch-size', type=int, default=1000, help='每次bulk_write写入的行数')
+    import_parser.add_argument('--json', action='store_true', help='以NDJSON输出失败的行与汇总')
+    import_parser.set_defaults(handler=import_grades)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
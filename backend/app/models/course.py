@@ -1,8 +1,19 @@
 from datetime import datetime
 from bson import ObjectId
+from app.services.advice_cache import invalidate_advice_cache
+from app.services.job_queue import expire_advice_jobs
+from app.models.listing import DEFAULT_PAGE_SIZE, build_projection, find_page, iter_documents
 
 class Course:
+    # 列表接口默认只返回的字段，以及可以通过fields参数请求的字段
+    LIST_FIELDS = ('course_code', 'course_name')
+    FIELDS = (
+        'course_code', 'course_name', 'description', 'objectives', 'topics', 'prerequisites', 'assessment',
+        'textbooks', 'source_sha256', 'created_at', 'updated_at'
+    )
+    
     def __init__(self, db):
+        self.db = db
         self.collection = db.courses
     
     def create_course(self, course_data):
@@ -29,6 +40,21 @@ class Course:
             course['_id'] = str(course['_id'])
         return course
     
+    def get_courses_by_ids(self, course_ids):
+        """批量获取课程信息（一次$in查询），返回 {id: course}"""
+        object_ids = []
+        for course_id in set(course_ids):
+            try:
+                object_ids.append(ObjectId(course_id))
+            except:
+                continue
+        
+        courses = {}
+        for course in self.collection.find({'_id': {'$in': object_ids}}):
+            course['_id'] = str(course['_id'])
+            courses[course['_id']] = course
+        return courses
+    
     def get_all_courses(self):
         """获取所有课程"""
         courses = list(self.collection.find())
@@ -36,6 +62,22 @@ class Course:
             course['_id'] = str(course['_id'])
         return courses
     
+    def list_courses(self, course_codes=None, fields=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        """按_id分页获取课程，可按课程代码筛选，返回(课程列表, 下一页游标)"""
+        projection = build_projection(fields, self.LIST_FIELDS, self.FIELDS)
+        return find_page(self.collection, self._list_query(course_codes), projection, after, limit)
+    
+    def iter_courses(self, course_codes=None, fields=None, after=None, limit=None):
+        """逐个产生课程（从游标读取，不构建完整列表）"""
+        projection = build_projection(fields, self.LIST_FIELDS, self.FIELDS)
+        return iter_documents(self.collection, self._list_query(course_codes), projection, after, limit)
+    
+    def _list_query(self, course_codes):
+        course_codes = [code.strip().upper() for code in (course_codes or []) if code.strip()]
+        if not course_codes:
+            return {}
+        return {'course_code': course_codes[0] if len(course_codes) == 1 else {'$in': course_codes}}
+    
     def update_course(self, course_id, update_data):
         """更新课程信息"""
         try:
@@ -44,10 +86,52 @@ class Course:
                 {'_id': ObjectId(course_id)},
                 {'$set': update_data}
             )
+            if result.modified_count > 0:
+                invalidate_advice_cache(self.db, course_id=course_id)
+                expire_advice_jobs(self.db, course_id=course_id)
             return result.modified_count > 0
         except:
             return False
     
+    def bulk_upsert(self, course_infos):
+        """按course_code批量新增或更新课程（一次bulk_write），返回 {course_code: course_id}
+        
+        同一批中重复的课程代码只保留最后一条，避免无序写入时同一课程被插入两次。
+        """
+        from pymongo import UpdateOne
+        
+        latest = {}
+        for course_info in course_infos:
+            if course_info.get('course_code'):
+                latest[course_info['course_code']] = course_info
+        if not latest:
+            return {}
+        
+        now = datetime.utcnow()
+        operations = []
+        for course_code, course_info in latest.items():
+            update_data = {key: value for key, value in course_info.items() if key not in ('_id', 'created_at')}
+            update_data['updated_at'] = now
+            operations.append(UpdateOne(
+                {'course_code': course_code},
+                {'$set': update_data, '$setOnInsert': {'created_at': now}},
+                upsert=True
+            ))
+        result = self.collection.bulk_write(operations, ordered=False)
+        
+        codes = list(latest)
+        inserted = {codes[index] for index in result.upserted_ids}
+        course_ids = {
+            course['course_code']: str(course['_id'])
+            for course in self.collection.find({'course_code': {'$in': codes}}, {'course_code': 1})
+        }
+        # 已有课程的内容被更新，相关的学习建议缓存失效
+        for course_code, course_id in course_ids.items():
+            if course_code not in inserted:
+                invalidate_advice_cache(self.db, course_id=course_id)
+                expire_advice_jobs(self.db, course_id=course_id)
+        return course_ids
+    
     def delete_course(self, course_id):
         """删除课程"""
         try:
@@ -0,0 +1,224 @@
+import threading
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError
+from app.services.grade_stats import normalize_course_code, score_value
+
+DUPLICATE_KEY = 11000
+EPOCH = datetime(1970, 1, 1)
+SEQUENCES_PER_MS = 1000000  # 同一毫秒内可分配的写入序号数
+
+_sequence_lock = threading.Lock()
+_sequence_counter = 0
+
+
+def next_sequences(count):
+    """为一次写入的count条成绩分配递增的写入序号：写入时间的毫秒数 × 10^6 + 进程内计数
+    
+    成绩分散在各学期的分桶中，按序号排序即可还原写入顺序（grade_stats.recent、成绩明细的顺序都依赖它）。
+    """
+    global _sequence_counter
+    written_ms = (datetime.utcnow() - EPOCH) // timedelta(milliseconds=1)
+    with _sequence_lock:
+        start = _sequence_counter
+        _sequence_counter = (_sequence_counter + count) % SEQUENCES_PER_MS
+    return [written_ms * SEQUENCES_PER_MS + (start + index) % SEQUENCES_PER_MS for index in range(count)]
+
+
+def _normalize_course(grade):
+    # 课程代码统一为大写、无首尾空白，按课程统计分布时可直接精确匹配索引
+    if 'course' in grade:
+        grade['course'] = normalize_course_code(grade['course'])
+    return grade
+
+
+def _grade_order(grade):
+    # 没有序号的成绩（早于序号引入时迁移的数据）保持读取顺序，排在最前
+    return grade.get('seq', -1)
+
+class GradeBuckets:
+    """成绩分桶存储：每个学生每个学期一个文档，学生文档中不再内嵌成绩明细
+    
+    文档结构: {student_id, year, semester, grades: [...], count, created_at, updated_at}，
+    student_id为学生文档_id的字符串，每条成绩带有写入序号seq（见next_sequences）。
+    按学生读取成绩是 (student_id, year, semester) 上的范围查询，读取后按seq还原写入顺序；
+    按课程统计成绩分布走 (grades.course, grades.score) 索引，不扫描学生集合。
+    """
+    
+    def __init__(self, db):
+        self.collection = db.grade_buckets
+    
+    def ensure_indexes(self):
+        self.collection.create_index([('student_id', 1), ('year', 1), ('semester', 1)], unique=True)
+        self.collection.create_index([('grades.course', 1), ('grades.score', 1)])
+    
+    @staticmethod
+    def bucket_key(grade):
+        """成绩所属的分桶 (year, semester)，缺失时为空字符串"""
+        return str(grade.get('year') or ''), str(grade.get('semester') or '')
+    
+    def add(self, student_id, grade):
+        """追加一条成绩到所在学期的分桶（不存在时创建），成绩需已带有seq"""
+        year, semester = self.bucket_key(grade)
+        _normalize_course(grade)
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {'student_id': student_id, 'year': year, 'semester': semester},
+            {
+                '$push': {'grades': grade},
+                '$inc': {'count': 1},
+                '$set': {'updated_at': now},
+                '$setOnInsert': {'created_at': now}
+            },
+            upsert=True
+        )
+    
+    def add_many(self, grades_by_student):
+        """批量追加成绩 {student_id: [成绩]}（成绩需已带有seq）：每个学生每个学期一条$push $each，一次无序bulk_write"""
+        from pymongo import UpdateOne
+        
+        buckets = {}
+        for student_id, grades in grades_by_student.items():
+            for grade in grades:
+                buckets.setdefault((student_id,) + self.bucket_key(grade), []).append(_normalize_course(grade))
+        if not buckets:
+            return
+        
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {'student_id': student_id, 'year': year, 'semester': semester},
+                {
+                    '$push': {'grades': {'$each': grades}},
+                    '$inc': {'count': len(grades)},
+                    '$set': {'updated_at': now},
+                    '$setOnInsert': {'created_at': now}
+                },
+                upsert=True
+            )
+            for (student_id, year, semester), grades in buckets.items()
+        ]
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # 并发创建同一分桶时upsert可能因唯一索引冲突失败，这时分桶已存在，重试即为追加
+            errors = e.details.get('writeErrors', [])
+            if not errors or any(error.get('code') != DUPLICATE_KEY for error in errors):
+                raise
+            self.collection.bulk_write([operations[error['index']] for error in errors], ordered=False)
+    
+    def remove(self, student_id, grades):
+        """按seq从分桶中撤回已写入的成绩（写入后更新聚合失败时使用，部分分桶未写入时也可调用）"""
+        buckets = {}
+        for grade in grades:
+            buckets.setdefault(self.bucket_key(grade), []).append(grade['seq'])
+        for (year, semester), sequences in buckets.items():
+            # 同一分桶的成绩由一条$push写入，要么都在要么都不在；未写入的分桶不会被多减计数
+            self.collection.update_one(
+                {'student_id': student_id, 'year': year, 'semester': semester, 'grades.seq': {'$in': sequences}},
+                {'$pull': {'grades': {'seq': {'$in': sequences}}}, '$inc': {'count': -len(sequences)}}
+            )
+            # 撤回后为空的分桶（本次写入时创建）一并删除
+            self.collection.delete_one({'student_id': student_id, 'year': year, 'semester': semester, 'count': {'$lte': 0}})
+    
+    def replace(self, student_id, grades):
+        """用完整成绩列表替换学生的所有分桶（创建学生、整体更新成绩或迁移旧数据时使用），按列表顺序分配seq"""
+        self.collection.delete_many({'student_id': student_id})
+        buckets = {}
+        for grade, seq in zip(grades, next_sequences(len(grades))):
+            buckets.setdefault(self.bucket_key(grade), []).append(_normalize_course(dict(grade, seq=seq)))
+        
+        now = datetime.utcnow()
+        documents = [
+            {
+                'student_id': student_id,
+                'year': year,
+                'semester': semester,
+                'grades': bucket,
+                'count': len(bucket),
+                'created_at': now,
+                'updated_at': now
+            }
+            for (year, semester), bucket in sorted(buckets.items())
+        ]
+        if documents:
+            self.collection.insert_many(documents)
+    
+    def normalize_courses(self):
+        """把已有分桶中未规范化的课程代码（小写、带空白）改为规范形式，返回修改的成绩数"""
+        updated = 0
+        for bucket in self.collection.find({'grades.course': {'$regex': r'[a-z]|^\s|\s$'}}, {'grades': 1}):
+            grades = bucket['grades']
+            normalized = [_normalize_course(dict(grade)) for grade in grades]
+            changed = sum(1 for old, new in zip(grades, normalized) if old.get('course') != new.get('course'))
+            # 以原成绩数组为条件，期间有新写入的分桶留到下次处理
+            if changed and self.collection.update_one(
+                {'_id': bucket['_id'], 'grades': grades}, {'$set': {'grades': normalized}}
+            ).modified_count:
+                updated += changed
+        return updated
+    
+    def delete(self, student_id):
+        self.collection.delete_many({'student_id': student_id})
+    
+    def get_grades(self, student_id, year_from=None, year_to=None):
+        """学生的成绩明细，按写入顺序排列；可用year_from/year_to限定学年范围"""
+        return self.grades_by_student([student_id], year_from, year_to).get(student_id, [])
+    
+    def grades_by_student(self, student_ids, year_from=None, year_to=None):
+        """批量读取多个学生的成绩（一次$in查询，只投影成绩数组），返回 {student_id: [按写入顺序排列的成绩]}"""
+        query = {'student_id': {'$in': list(student_ids)}}
+        year_range = {}
+        if year_from is not None:
+            year_range['$gte'] = str(year_from)
+        if year_to is not None:
+            year_range['$lte'] = str(year_to)
+        if year_range:
+            query['year'] = year_range
+        
+        grades = {student_id: [] for student_id in student_ids}
+        cursor = self.collection.find(query, {'_id': 0, 'student_id': 1, 'grades': 1}).sort(
+            [('student_id', 1), ('year', 1), ('semester', 1)]
+        )
+        for bucket in cursor:
+            grades[bucket['student_id']].extend(bucket.get('grades', []))
+        for student_grades in grades.values():
+            student_grades.sort(key=_grade_order)
+            for grade in student_grades:
+                grade.pop('seq', None)
+        return grades
+    
+    def course_distribution(self, course_code, bin_width=10):
+        """某门课程的成绩分布：匹配阶段使用grades.course索引，只展开命中的分桶"""
+        course_code = normalize_course_code(course_code)
+        pipeline = [
+            {'$match': {'grades.course': course_code}},
+            {'$unwind': '$grades'},
+            {'$match': {'grades.course': course_code}},
+            {'$project': {'_id': 0, 'student_id': 1, 'score': '$grades.score'}}
+        ]
+        scores = []
+        students = set()
+        for row in self.collection.aggregate(pipeline):
+            scores.append(score_value(row))
+            students.add(row['student_id'])
+        
+        histogram = {}
+        for score in scores:
+            lower = int(score // bin_width) * bin_width
+            histogram[lower] = histogram.get(lower, 0) + 1
+        
+        count = len(scores)
+        average = sum(scores) / count if count else None
+        return {
+            'course_code': course_code,
+            'count': count,
+            'students': len(students),
+            'average': average,
+            'min': min(scores) if scores else None,
+            'max': max(scores) if scores else None,
+            'std': (sum((score - average) ** 2 for score in scores) / count) ** 0.5 if count else None,
+            'histogram': [
+                {'min': lower, 'max': lower + bin_width, 'count': histogram[lower]}
+                for lower in sorted(histogram)
+            ]
+        }
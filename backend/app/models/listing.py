@@ -0,0 +1,63 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+ALL_FIELDS = '*'
+
+
+def build_projection(fields: Optional[Iterable[str]], default_fields: Tuple[str, ...],
+                     allowed_fields: Tuple[str, ...]) -> Optional[Dict]:
+    """列表接口的字段投影：未指定时使用精简的默认字段，'*'表示返回完整文档（返回None）"""
+    fields = [field for field in (fields or []) if field]
+    if not fields:
+        fields = list(default_fields)
+    if ALL_FIELDS in fields:
+        return None
+
+    unknown = [field for field in fields if field not in allowed_fields and field != '_id']
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+    return {field: 1 for field in fields}
+
+
+def keyset_find(collection, query: Dict, projection: Optional[Dict], after: Optional[str] = None,
+                limit: Optional[int] = None):
+    """按_id升序查找after之后的文档（键集分页，不使用skip）"""
+    if after:
+        try:
+            query = {'$and': [query, {'_id': {'$gt': ObjectId(after)}}]} if query else {'_id': {'$gt': ObjectId(after)}}
+        except (InvalidId, TypeError):
+            raise ValueError('无效的分页游标')
+
+    cursor = collection.find(query, projection).sort('_id', 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def find_page(collection, query: Dict, projection: Optional[Dict], after: Optional[str] = None,
+              limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict], Optional[str]]:
+    """返回一页文档与下一页的游标（没有更多文档时为None），多取一条判断是否还有下一页"""
+    documents = list(keyset_find(collection, query, projection, after, limit + 1))
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = str(documents[-1]['_id'])
+    for document in documents:
+        document['_id'] = str(document['_id'])
+    return documents, next_cursor
+
+
+def iter_documents(collection, query: Dict, projection: Optional[Dict], after: Optional[str] = None,
+                   limit: Optional[int] = None, batch_size: int = 500) -> Iterator[Dict]:
+    """逐个产生文档，从游标按批读取，不构建完整列表（参数错误在调用时即抛出ValueError）"""
+    cursor = keyset_find(collection, query, projection, after, limit).batch_size(batch_size)
+    return (_with_string_id(document) for document in cursor)
+
+
+def _with_string_id(document: Dict) -> Dict:
+    document['_id'] = str(document['_id'])
+    return document
@@ -1,62 +1,359 @@
 from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from app.services.advice_cache import invalidate_advice_cache
+from app.services.job_queue import expire_advice_jobs
+from app.services.grade_stats import GRADE_STATS_VERSION, compute_grade_stats, grade_stats_update, grades_stats_update
+from app.models.grade import GradeBuckets, next_sequences
+from app.models.listing import DEFAULT_PAGE_SIZE, build_projection, find_page, iter_documents
+
+# 查询学生时的成绩投影：不传输内嵌的成绩数组，只用来识别尚未迁移到分桶集合的旧文档
+LEGACY_GRADES = {'$slice': 0}
+# 可以直接写入成绩的学生：成绩已迁移到分桶集合，且聚合为当前版本
+READY_FOR_GRADES = {'grades': {'$exists': False}, 'grade_stats.version': GRADE_STATS_VERSION}
 
 class Student:
+    # 列表接口默认只返回的字段，以及可以通过fields参数请求的字段
+    LIST_FIELDS = ('name', 'student_id', 'major', 'grade')
+    FIELDS = ('name', 'student_id', 'major', 'grade', 'email', 'phone', 'grades', 'grade_stats', 'created_at', 'updated_at')
+    
     def __init__(self, db):
+        self.db = db
         self.collection = db.students
+        self.grade_buckets = GradeBuckets(db)
     
     def create_student(self, student_data):
-        """创建新学生"""
+        """创建新学生，成绩明细写入分桶集合"""
+        grades = student_data.pop('grades', None) or []
         student_data['created_at'] = datetime.utcnow()
         student_data['updated_at'] = datetime.utcnow()
+        student_data['grade_stats'] = compute_grade_stats(grades)
         result = self.collection.insert_one(student_data)
+        if grades:
+            self.grade_buckets.replace(str(result.inserted_id), grades)
         return str(result.inserted_id)
     
-    def get_student(self, student_id):
-        """获取学生信息"""
+    def get_student(self, student_id, include_grades=True):
+        """获取学生信息；include_grades为False时不加载成绩明细，只返回grade_stats聚合"""
         try:
-            student = self.collection.find_one({'_id': ObjectId(student_id)})
+            student = self.collection.find_one({'_id': ObjectId(student_id)}, {'grades': LEGACY_GRADES})
             if student:
+                self._load_grades([student], include_grades)
                 student['_id'] = str(student['_id'])
             return student
         except:
             return None
     
+    def get_students_by_ids(self, student_ids, include_grades=True):
+        """批量获取学生信息（一次$in查询），返回 {id: student}"""
+        object_ids = []
+        for student_id in set(student_ids):
+            try:
+                object_ids.append(ObjectId(student_id))
+            except:
+                continue
+        
+        found = list(self.collection.find({'_id': {'$in': object_ids}}, {'grades': LEGACY_GRADES}))
+        self._load_grades(found, include_grades)
+        students = {}
+        for student in found:
+            student['_id'] = str(student['_id'])
+            students[student['_id']] = student
+        return students
+    
     def get_all_students(self):
         """获取所有学生"""
         students = list(self.collection.find())
         for student in students:
             student['_id'] = str(student['_id'])
-        return students
+        return self._attach_grades(students)
+    
+    def list_students(self, major=None, grade=None, fields=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        """按_id分页获取学生，可按专业、年级筛选，返回(学生列表, 下一页游标)"""
+        projection, with_grades = self._list_projection(fields)
+        students, next_cursor = find_page(self.collection, self._list_query(major, grade), projection, after, limit)
+        if with_grades:
+            self._attach_grades(students)
+        return students, next_cursor
+    
+    def iter_students(self, major=None, grade=None, fields=None, after=None, limit=None):
+        """逐个产生学生（从游标读取，不构建完整列表）"""
+        projection, with_grades = self._list_projection(fields)
+        students = iter_documents(self.collection, self._list_query(major, grade), projection, after, limit)
+        return self._iter_with_grades(students) if with_grades else students
+    
+    def _list_projection(self, fields):
+        """列表投影，以及是否需要从分桶集合附加成绩明细"""
+        projection = build_projection(fields, self.LIST_FIELDS, self.FIELDS)
+        if projection is None:
+            return None, True
+        if 'grades' in projection:
+            projection['grades'] = LEGACY_GRADES
+            return projection, True
+        return projection, False
+    
+    def _iter_with_grades(self, students, batch_size=100):
+        """按批为流式读取的学生附加成绩明细，每批一次$in查询"""
+        batch = []
+        for student in students:
+            batch.append(student)
+            if len(batch) >= batch_size:
+                yield from self._attach_grades(batch)
+                batch = []
+        if batch:
+            yield from self._attach_grades(batch)
+    
+    def _list_query(self, major, grade):
+        query = {}
+        if major:
+            query['major'] = major
+        if grade:
+            query['grade'] = grade
+        return query
     
     def update_student(self, student_id, update_data):
-        """更新学生信息"""
+        """更新学生信息；包含grades时整体替换分桶集合中的成绩"""
         try:
+            object_id = ObjectId(student_id)
             update_data['updated_at'] = datetime.utcnow()
-            result = self.collection.update_one(
-                {'_id': ObjectId(student_id)},
-                {'$set': update_data}
-            )
+            replace_grades = 'grades' in update_data
+            grades = update_data.pop('grades', None) or []
+            update = {'$set': update_data}
+            if replace_grades:
+                update_data['grade_stats'] = compute_grade_stats(grades)
+                update['$unset'] = {'grades': ''}
+            result = self.collection.update_one({'_id': object_id}, update)
+            if result.matched_count > 0 and replace_grades:
+                self.grade_buckets.replace(student_id, grades)
+            if result.modified_count > 0:
+                invalidate_advice_cache(self.db, student_id=student_id)
+                expire_advice_jobs(self.db, student_ids=[student_id])
             return result.modified_count > 0
         except:
             return False
     
     def delete_student(self, student_id):
-        """删除学生"""
+        """删除学生及其成绩分桶"""
         try:
             result = self.collection.delete_one({'_id': ObjectId(student_id)})
+            if result.deleted_count > 0:
+                self.grade_buckets.delete(student_id)
             return result.deleted_count > 0
         except:
             return False
     
     def add_grade(self, student_id, grade_data):
-        """添加成绩记录"""
+        """添加成绩记录：成绩明细写入所在学期的分桶，并原子地更新grade_stats聚合"""
         try:
             grade_data['timestamp'] = datetime.utcnow()
-            result = self.collection.update_one(
-                {'_id': ObjectId(student_id)},
-                {'$push': {'grades': grade_data}}
-            )
-            return result.modified_count > 0
+            object_id = ObjectId(student_id)
+            
+            # 旧文档先迁移成绩、回填聚合；之后聚合为当前版本，回填不会再与下面的写入交错
+            if not self._ready_for_grades(object_id):
+                return False
+            
+            # 先写分桶再更新聚合，聚合更新失败时撤回分桶中的成绩，客户端重试不会重复计入聚合
+            grade_data['seq'] = next_sequences(1)[0]
+            self.grade_buckets.add(str(object_id), grade_data)
+            try:
+                applied = self.collection.update_one(
+                    dict(READY_FOR_GRADES, _id=object_id), grade_stats_update(grade_data)
+                ).modified_count > 0
+            except Exception:
+                applied = False
+            if not applied:
+                self.grade_buckets.remove(str(object_id), [grade_data])
+                return False
+            
+            invalidate_advice_cache(self.db, student_id=student_id)
+            expire_advice_jobs(self.db, student_ids=[student_id])
+            return True
         except:
-            return False
\ No newline at end of file
+            return False
+    
+    def bulk_add_grades(self, grades_by_student):
+        """批量添加成绩 {学生_id: [成绩]}，返回写入了成绩的学生_id列表
+        
+        每个学生每个学期一条$push $each、每个学生一条grade_stats更新，均为无序bulk_write；
+        与add_grade相同，先写分桶再更新聚合，聚合未更新的学生撤回分桶中的成绩，建议缓存整批失效一次。
+        聚合更新未匹配的学生（聚合在此期间变为旧版本）撤回成绩、回填聚合后逐个重试一次，
+        仍未写入的（学生已被删除）不在返回的列表中。
+        """
+        from pymongo import UpdateOne
+        
+        grades_by_student = {ObjectId(str(object_id)): grades for object_id, grades in grades_by_student.items() if grades}
+        if not grades_by_student:
+            return []
+        
+        # 未迁移或聚合版本过旧的学生先迁移成绩、回填聚合
+        stale = self.collection.find(
+            {'_id': {'$in': list(grades_by_student)}, '$nor': [READY_FOR_GRADES]},
+            {'_id': 1}
+        )
+        for student in stale:
+            self._backfill_grade_stats(student['_id'])
+        
+        # 写入序号在迁移之后分配，迁移的旧成绩排在本批成绩之前
+        sequences = iter(next_sequences(sum(len(grades) for grades in grades_by_student.values())))
+        for grades in grades_by_student.values():
+            for grade in grades:
+                grade['seq'] = next(sequences)
+        
+        students = list(grades_by_student)
+        try:
+            self.grade_buckets.add_many({str(object_id): grades for object_id, grades in grades_by_student.items()})
+        except Exception:
+            self._withdraw_grades(grades_by_student, students)
+            raise
+        
+        try:
+            matched = self.collection.bulk_write([
+                UpdateOne(dict(READY_FOR_GRADES, _id=object_id), grades_stats_update(grades_by_student[object_id]))
+                for object_id in students
+            ], ordered=False).matched_count
+            failed = set()
+        except BulkWriteError as e:
+            matched = e.details.get('nMatched', 0)
+            failed = {students[error['index']] for error in e.details.get('writeErrors', [])}
+        except Exception:
+            self._withdraw_grades(grades_by_student, students)
+            raise
+        
+        written = students
+        if matched < len(students):
+            # 聚合仍为当前版本且未报错的学生已更新；其余学生撤回成绩，回填聚合（不含本批成绩）后重试
+            ready = {
+                student['_id'] for student in self.collection.find(
+                    dict(READY_FOR_GRADES, _id={'$in': students}), {'_id': 1}
+                )
+            } - failed
+            written = [object_id for object_id in students if object_id in ready]
+            retry = [object_id for object_id in students if object_id not in ready]
+            self._withdraw_grades(grades_by_student, retry)
+            for object_id in retry:
+                if self._add_student_grades(object_id, grades_by_student[object_id]):
+                    written.append(object_id)
+        
+        if written:
+            student_ids = [str(object_id) for object_id in written]
+            invalidate_advice_cache(self.db, student_ids=student_ids)
+            expire_advice_jobs(self.db, student_ids=student_ids)
+        return written
+    
+    def _add_student_grades(self, object_id, grades):
+        """为一个学生写入多条成绩（批量写入的重试路径），顺序与撤回方式同add_grade"""
+        try:
+            if not self._ready_for_grades(object_id):
+                return False
+            self.grade_buckets.add_many({str(object_id): grades})
+        except Exception:
+            self._withdraw_grades({object_id: grades}, [object_id])
+            return False
+        try:
+            applied = self.collection.update_one(
+                dict(READY_FOR_GRADES, _id=object_id), grades_stats_update(grades)
+            ).modified_count > 0
+        except Exception:
+            applied = False
+        if not applied:
+            self._withdraw_grades({object_id: grades}, [object_id])
+        return applied
+    
+    def _withdraw_grades(self, grades_by_student, object_ids):
+        """从分桶中撤回这些学生本批写入的成绩（只撤回确实写入了的分桶）"""
+        for object_id in object_ids:
+            self.grade_buckets.remove(str(object_id), grades_by_student[object_id])
+    
+    def grade_distribution(self, course_code, bin_width=10):
+        """课程的成绩分布（分桶集合上的索引查询）"""
+        return self.grade_buckets.course_distribution(course_code, bin_width)
+    
+    def migrate_grades(self):
+        """把所有旧文档中内嵌的成绩迁移到分桶集合，返回(迁移的学生数, 成绩数)"""
+        self.grade_buckets.ensure_indexes()
+        students = grades = 0
+        for student in self.collection.find({'grades': {'$exists': True}}, {'_id': 1}):
+            migrated = self._migrate_grades(student['_id'])
+            if migrated is not None:
+                students += 1
+                grades += migrated
+        return students, grades
+    
+    def _ready_for_grades(self, object_id):
+        """学生可以直接写入成绩时返回True，否则先迁移成绩、回填聚合，学生不存在返回False"""
+        if self.collection.count_documents(dict(READY_FOR_GRADES, _id=object_id), limit=1):
+            return True
+        return self._backfill_grade_stats(object_id) is not None
+    
+    def _load_grades(self, students, include_grades):
+        """迁移旧文档、补齐grade_stats，include_grades为True时附加成绩明细"""
+        if include_grades:
+            self._attach_grades(students)
+        else:
+            self._migrate_embedded(students)
+        for student in students:
+            self._ensure_grade_stats(student, include_grades)
+    
+    def _attach_grades(self, students):
+        """从分桶集合为一批学生附加成绩明细（一次$in查询）"""
+        self._migrate_embedded(students)
+        grades = self.grade_buckets.grades_by_student([str(student['_id']) for student in students])
+        for student in students:
+            student['grades'] = grades[str(student['_id'])]
+        return students
+    
+    def _migrate_embedded(self, students):
+        """查询结果中仍带有grades字段的是未迁移的旧文档，迁移后从结果中移除"""
+        for student in students:
+            if 'grades' in student:
+                self._migrate_grades(ObjectId(str(student['_id'])))
+                del student['grades']
+    
+    def _migrate_grades(self, object_id):
+        """把旧文档内嵌的成绩写入分桶集合并从学生文档删除，返回迁移的成绩数，没有需要迁移的成绩返回None
+        
+        文档仍内嵌成绩时其他写入不会进入该学生的分桶（add_grade会先迁移），因此整体替换分桶后再删除内嵌成绩，
+        中途失败时再次迁移结果相同；删除时以成绩未变作为条件。
+        """
+        student = self.collection.find_one({'_id': object_id, 'grades': {'$exists': True}}, {'grades': 1})
+        if not student:
+            return None
+        grades = student['grades'] or []
+        try:
+            self.grade_buckets.replace(str(object_id), grades)
+        except BulkWriteError:
+            # 并发迁移同一学生时唯一索引冲突，由先写入的一方完成
+            return None
+        self.collection.update_one({'_id': object_id, 'grades': student['grades']}, {'$unset': {'grades': ''}})
+        return len(grades)
+    
+    def _ensure_grade_stats(self, student, include_grades):
+        """旧文档缺少grade_stats（或版本过旧）时补齐：已加载成绩则直接计算，否则回填到数据库"""
+        if (student.get('grade_stats') or {}).get('version') == GRADE_STATS_VERSION:
+            return
+        if include_grades:
+            student['grade_stats'] = compute_grade_stats(student.get('grades', []))
+        else:
+            student['grade_stats'] = self._backfill_grade_stats(student['_id']) or compute_grade_stats([])
+    
+    def _backfill_grade_stats(self, object_id):
+        """根据分桶中的成绩计算并写入grade_stats，返回写入后的聚合，学生不存在返回None
+        
+        聚合版本过旧时add_grade不会写入分桶，计算期间成绩不会变化；旧文档先迁移内嵌的成绩。
+        分桶中的成绩按写入顺序读取，recent窗口与迁移前的顺序一致。
+        """
+        object_id = ObjectId(str(object_id))
+        student = self.collection.find_one({'_id': object_id}, {'grade_stats': 1, 'grades': LEGACY_GRADES})
+        if not student:
+            return None
+        if 'grades' in student:
+            self._migrate_grades(object_id)
+        current = student.get('grade_stats')
+        if current and current.get('version') == GRADE_STATS_VERSION:
+            return current
+        
+        stats = compute_grade_stats(self.grade_buckets.get_grades(str(object_id)))
+        query = {'_id': object_id, 'grade_stats.version': {'$ne': GRADE_STATS_VERSION}}
+        if self.collection.update_one(query, {'$set': {'grade_stats': stats}}).modified_count > 0:
+            return stats
+        return (self.collection.find_one({'_id': object_id}, {'grade_stats': 1}) or {}).get('grade_stats')
@@ -0,0 +1,51 @@
+import json
+from typing import Dict, Iterable
+
+from flask import Response, stream_with_context
+
+from app.models.listing import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+NDJSON_CHUNK_SIZE = 100  # 每次写出的行数
+
+
+def listing_args(args) -> Dict:
+    """解析列表接口的通用参数
+
+    - limit: 每页条数（默认100，最多1000）；流式返回时不指定则返回全部
+    - after: 上一页响应中的next_cursor
+    - fields: 逗号分隔的返回字段，'*'表示完整文档
+    - format=ndjson: 以NDJSON逐行流式返回
+    """
+    stream = args.get('format') == 'ndjson'
+    limit = args.get('limit')
+    if limit is None:
+        limit = None if stream else DEFAULT_PAGE_SIZE
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('limit必须是整数')
+        if limit < 1 or (not stream and limit > MAX_PAGE_SIZE):
+            raise ValueError(f'limit必须在1到{MAX_PAGE_SIZE}之间')
+
+    return {
+        'fields': [field.strip() for field in args.get('fields', '').split(',') if field.strip()],
+        'after': args.get('after') or None,
+        'limit': limit,
+        'stream': stream
+    }
+
+
+def ndjson_response(documents: Iterable[Dict]) -> Response:
+    """从游标逐行写出NDJSON，不构建完整列表"""
+    def generate():
+        lines = []
+        for document in documents:
+            lines.append(json.dumps(document, ensure_ascii=False, default=str))
+            if len(lines) >= NDJSON_CHUNK_SIZE:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -1,16 +1,38 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from werkzeug.utils import secure_filename
-from app.services.pdf_service import PDFService
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.services.registry import get_service
+from app.services.pdf_service import PDFUploadError, content_sha256
+from app.services.pdf_ingest import PDFIngestor
+from app.services.pdf_pipeline import IngestionQueueFull
 from app.models.course import Course
+import json
+import logging
 import os
+import shutil
+import tempfile
+import zipfile
 
 pdf_bp = Blueprint('pdf', __name__)
-pdf_service = PDFService()
 
 @pdf_bp.route('/upload', methods=['POST'])
 def upload_pdf():
-    """上传并解析PDF文件"""
+    """上传并解析PDF文件（async=1时保存文件后立即返回导入ID，由后台流水线处理）"""
     try:
+        pdf_service = get_service('pdf_service')
+        
+        # 在解析请求体之前根据Content-Length拒绝过大的上传
+        pdf_service.check_upload_size(request.content_length)
+        
+        # 异步模式：导入队列已满时在读取请求体之前拒绝
+        pipeline = None
+        if request.args.get('async') in ('1', 'true'):
+            pipeline = get_service('pdf_pipeline')
+            if pipeline is None:
+                return jsonify({'error': 'PDF导入流水线不可用'}), 503
+            if pipeline.is_full():
+                return _queue_full_response()
+        
         if 'file' not in request.files:
             return jsonify({'error': '没有上传文件'}), 400
         
@@ -21,45 +43,281 @@ def upload_pdf():
         if not file.filename.lower().endswith('.pdf'):
             return jsonify({'error': '只支持PDF文件'}), 400
         
-        # 读取文件内容
-        file_content = file.read()
-        
-        # 验证PDF文件
-        if not pdf_service.validate_pdf_file(file_content):
-            return jsonify({'error': 'PDF文件格式无效'}), 400
+        if pipeline is not None:
+            ingestion = pipeline.submit(file.filename, file.stream)
+            return jsonify(ingestion), 202
         
-        # 提取文本
-        text = pdf_service.extract_text_from_pdf(file_content)
+        # 检查文件头与大小，PyPDF2直接从临时文件按需读取，不把整个文件读入内存；内容哈希在写入临时文件时已计算
+        pdf_file = pdf_service.spool_upload(file.stream)
+        content_hash = content_sha256(pdf_file)
         
-        # 解析课程信息
-        course_info = pdf_service.parse_course_description(text)
+        # 同一文件已用当前版本的解析逻辑处理过时，直接使用缓存的文本与课程信息
+        extraction_cache = get_service('extraction_cache')
+        cached = extraction_cache.get(content_hash) if extraction_cache is not None else None
+        if cached is not None:
+            text = cached['text']
+            course_info = dict(cached['course_info'])
+            document_summary = cached.get('document', {})
+        else:
+            # 打开一次PDF，验证与提取文本共用同一次解析结果
+            document = pdf_service.open_pdf(pdf_file)
+            if not document.is_valid:
+                return jsonify({'error': 'PDF文件格式无效'}), 400
+            
+            # 提取文本
+            text = pdf_service.extract_text_from_pdf(document)
+            
+            # 解析课程信息
+            course_info = pdf_service.parse_course_description(text)
+            document_summary = document.summary()
+            
+            if extraction_cache is not None:
+                extraction_cache.put(content_hash, text, dict(course_info), document=document_summary, pdf_file=pdf_file)
         
         # 保存到数据库
         course_model = Course(current_app.db)
         
         # 检查课程是否已存在
         existing_course = course_model.get_course_by_code(course_info['course_code'])
+        if cached is not None and existing_course and existing_course.get('source_sha256') == content_hash:
+            # 重复上传的文件与课程当前的来源文件相同：课程记录与各索引都已是最新
+            return jsonify({
+                'message': 'PDF解析成功',
+                'course_id': existing_course['_id'],
+                'course_info': course_info,
+                'document': document_summary,
+                'cached': True
+            }), 200
+        
+        course_info['source_sha256'] = content_hash
         if existing_course:
             # 更新现有课程
             course_id = existing_course['_id']
             course_model.update_course(course_id, course_info)
         else:
-            # 创建新课程
-            course_id = course_model.create_course(course_info)
+            # 创建新课程（传入副本，insert_one写入的ObjectId不会出现在响应中）
+            course_id = course_model.create_course(dict(course_info))
+        
+        # 增量更新检索索引（仅处理本次上传的课程）
+        retrieval_index = get_service('retrieval_index')
+        if retrieval_index is not None:
+            try:
+                retrieval_index.add_document(course_info['course_code'], text, course_id=course_id)
+            except Exception as e:
+                logging.error(f"更新检索索引失败: {e}")
+        
+        # 增量更新课程相关度索引（仅重新计算本课程及受影响课程的相关列表）
+        course_relations = get_service('course_relations')
+        if course_relations is not None:
+            try:
+                course_relations.update_course(course_info)
+            except Exception as e:
+                logging.error(f"更新课程相关度索引失败: {e}")
+        
+        # 增量更新课程相似度矩阵
+        course_similarity = get_service('course_similarity')
+        if course_similarity is not None:
+            try:
+                course_similarity.update_course(course_info, course_id=course_id)
+            except Exception as e:
+                logging.error(f"更新课程相似度矩阵失败: {e}")
         
         return jsonify({
             'message': 'PDF解析成功',
             'course_id': course_id,
-            'course_info': course_info
+            'course_info': course_info,
+            'document': document_summary,
+            'cached': cached is not None
         }), 200
         
+    except PDFUploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'PDF文件超过大小限制'}), 413
+    except IngestionQueueFull:
+        return _queue_full_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@pdf_bp.route('/ingestions/<ingestion_id>', methods=['GET'])
+def get_ingestion(ingestion_id):
+    """查询后台导入的进度与各阶段耗时"""
+    try:
+        pipeline = get_service('pdf_pipeline')
+        if pipeline is None:
+            return jsonify({'error': 'PDF导入流水线不可用'}), 503
+        
+        ingestion = pipeline.get(ingestion_id)
+        if not ingestion:
+            return jsonify({'error': '导入记录不存在'}), 404
+        
+        return jsonify({'ingestion': ingestion}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@pdf_bp.route('/ingestions/<ingestion_id>/retry', methods=['POST'])
+def retry_ingestion(ingestion_id):
+    """从失败的阶段重新执行后台导入，不需要重新上传文件"""
+    try:
+        pipeline = get_service('pdf_pipeline')
+        if pipeline is None:
+            return jsonify({'error': 'PDF导入流水线不可用'}), 503
+        
+        ingestion = pipeline.retry(ingestion_id)
+        if not ingestion:
+            return jsonify({'error': '导入记录不存在'}), 404
+        
+        return jsonify(ingestion), 202
+        
+    except IngestionQueueFull:
+        return _queue_full_response()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _queue_full_response():
+    response = jsonify({'error': 'PDF导入队列已满，请稍后重试'})
+    response.headers['Retry-After'] = '5'
+    return response, 429
+
+@pdf_bp.route('/upload/bulk', methods=['POST'])
+def upload_pdf_bulk():
+    """批量上传课程PDF（多个文件或zip压缩包），以NDJSON逐个返回各文件的导入结果"""
+    try:
+        pdf_service = get_service('pdf_service')
+        
+        # 批量上传的请求体大小限制单独配置
+        request.max_content_length = current_app.config['PDF_BULK_MAX_SIZE']
+        uploads = request.files.getlist('files') + request.files.getlist('file')
+        if not uploads:
+            return jsonify({'error': '没有上传文件'}), 400
+        
+        directory = tempfile.mkdtemp(prefix='pdf-bulk-')
+        try:
+            files, rejected = _save_bulk_uploads(
+                uploads, directory, pdf_service.max_file_size,
+                current_app.config['PDF_BULK_MAX_SIZE'], current_app.config['PDF_BULK_MAX_FILES']
+            )
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        
+        ingestor = PDFIngestor(
+            current_app.db,
+            pdf_service,
+            extraction_cache=get_service('extraction_cache'),
+            retrieval_index=get_service('retrieval_index'),
+            course_relations=get_service('course_relations'),
+            course_similarity=get_service('course_similarity'),
+            batch_size=int(os.getenv('PDF_BULK_BATCH_SIZE', 50))
+        )
+        
+        def generate():
+            try:
+                for line in rejected:
+                    yield _format_ndjson(line)
+                for line in ingestor.ingest(files):
+                    if 'summary' in line:
+                        line['summary']['total'] += len(rejected)
+                        line['summary']['failed'] += len(rejected)
+                    yield _format_ndjson(line)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+    except RequestEntityTooLarge:
+        return jsonify({'error': '上传文件超过大小限制'}), 413
+    except BulkUploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'zip文件格式无效'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+class BulkUploadTooLarge(Exception):
+    """批量上传的文件数或解压后的总大小超过限制"""
+
+def _save_bulk_uploads(uploads, directory, max_file_size, max_total_size, max_files):
+    """将上传的PDF与zip中的PDF保存到临时目录，返回([(文件名, 路径)], 被拒绝文件的结果行)
+    
+    结果行中的index为文件在返回列表中的序号，被拒绝的文件没有index。
+    zip在解压前按中央目录检查条目数与声明的解压后总大小，解压时再按实际写入的字节数累计，
+    文件数或总大小超过限制时抛出BulkUploadTooLarge。
+    """
+    files = []
+    rejected = []
+    total_size = 0
+    
+    def check_count(count):
+        if count > max_files:
+            raise BulkUploadTooLarge(f"批量上传最多{max_files}个文件")
+    
+    def check_size(size):
+        if size > max_total_size:
+            raise BulkUploadTooLarge('批量上传的文件解压后超过总大小限制')
+    
+    def reject(filename, error):
+        rejected.append({'filename': filename, 'status': 'error', 'error': error})
+    
+    def save(filename, stream):
+        nonlocal total_size
+        check_count(len(files) + 1)
+        # 路径只使用序号，zip中的目录结构与文件名不会影响写入位置
+        path = os.path.join(directory, f"{len(files) + len(rejected):05d}.pdf")
+        size = 0
+        with open(path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                size += len(chunk)
+                if size > max_file_size:
+                    break
+                check_size(total_size + size)
+                f.write(chunk)
+        if size > max_file_size:
+            os.unlink(path)
+            reject(filename, 'PDF文件超过大小限制')
+        else:
+            total_size += size
+            files.append((filename, path))
+    
+    def is_pdf_entry(info):
+        return not info.is_dir() and not info.filename.startswith('__MACOSX/') and info.filename.lower().endswith('.pdf')
+    
+    for upload in uploads:
+        name = upload.filename or ''
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(upload.stream) as archive:
+                infos = archive.infolist()
+                check_count(len(infos))
+                entries = [info for info in infos if is_pdf_entry(info)]
+                check_count(len(files) + len(entries))
+                check_size(total_size + sum(info.file_size for info in entries if info.file_size <= max_file_size))
+                for info in entries:
+                    entry = info.filename
+                    if info.file_size > max_file_size:
+                        reject(entry, 'PDF文件超过大小限制')
+                        continue
+                    with archive.open(info) as stream:
+                        save(entry, stream)
+        elif name.lower().endswith('.pdf'):
+            save(secure_filename(name) or name, upload.stream)
+        else:
+            reject(name, '只支持PDF文件或zip压缩包')
+    return files, rejected
+
+def _format_ndjson(payload):
+    """格式化一行NDJSON"""
+    return json.dumps(payload, ensure_ascii=False, default=str) + '\n'
+
 @pdf_bp.route('/extract-text', methods=['POST'])
 def extract_text():
     """仅提取PDF文本内容"""
     try:
+        pdf_service = get_service('pdf_service')
+        pdf_service.check_upload_size(request.content_length)
+        
         if 'file' not in request.files:
             return jsonify({'error': '没有上传文件'}), 400
         
@@ -67,14 +325,59 @@ def extract_text():
         if not file.filename.lower().endswith('.pdf'):
             return jsonify({'error': '只支持PDF文件'}), 400
         
-        file_content = file.read()
-        text = pdf_service.extract_text_from_pdf(file_content)
+        pdf_file = pdf_service.spool_upload(file.stream)
+        text = pdf_service.extract_text_from_pdf(pdf_file)
         
         return jsonify({
             'text': text,
             'filename': secure_filename(file.filename)
         }), 200
         
+    except PDFUploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'PDF文件超过大小限制'}), 413
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@pdf_bp.route('/preview', methods=['POST'])
+def preview_pdf():
+    """快速预览：只提取所需字段，字段确定后不再读取后续页面"""
+    try:
+        pdf_service = get_service('pdf_service')
+        pdf_service.check_upload_size(request.content_length)
+        
+        if 'file' not in request.files:
+            return jsonify({'error': '没有上传文件'}), 400
+        
+        file = request.files['file']
+        if not file.filename.lower().endswith('.pdf'):
+            return jsonify({'error': '只支持PDF文件'}), 400
+        
+        # fields为逗号分隔的字段名，默认只取课程代码和名称
+        fields = [field.strip() for field in request.form.get('fields', 'course_code,course_name').split(',') if field.strip()]
+        
+        pdf_file = pdf_service.spool_upload(file.stream)
+        document = pdf_service.open_pdf(pdf_file)
+        if not document.is_valid:
+            return jsonify({'error': 'PDF文件格式无效'}), 400
+        
+        try:
+            course_info, pages_read = pdf_service.parse_course_fields(document.iter_pages(), fields)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'course_info': course_info,
+            'pages_read': pages_read,
+            'page_count': document.page_count,
+            'filename': secure_filename(file.filename)
+        }), 200
+        
+    except PDFUploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'PDF文件超过大小限制'}), 413
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -82,6 +385,8 @@ def extract_text():
 def parse_course():
     """解析课程描述文本"""
     try:
+        pdf_service = get_service('pdf_service')
+        
         data = request.get_json()
         if not data or 'text' not in data:
             return jsonify({'error': '缺少文本内容'}), 400
@@ -1,15 +1,23 @@
-from flask import Blueprint, request, jsonify, current_app
-from app.services.rag_service import RAGService
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from app.services.registry import get_service
+from app.services.grade_stats import (
+    TREND_WINDOW, classify_trend, recommendations_for,
+    get_grade_stats, recent_average, average_score as grade_average, score_std
+)
 from app.models.student import Student
 from app.models.course import Course
+from app.routes.listing import listing_args, ndjson_response
+import json
+import os
 
 rag_bp = Blueprint('rag', __name__)
-rag_service = RAGService()
 
 @rag_bp.route('/advice', methods=['POST'])
 def generate_advice():
     """生成个性化学习建议"""
     try:
+        rag_service = get_service('rag_service')
+        
         data = request.get_json()
         if not data:
             return jsonify({'error': '缺少请求数据'}), 400
@@ -22,7 +30,7 @@ def generate_advice():
         
         # 获取学生数据
         student_model = Student(current_app.db)
-        student_data = student_model.get_student(student_id)
+        student_data = student_model.get_student(student_id, include_grades=False)
         if not student_data:
             return jsonify({'error': '学生不存在'}), 404
         
@@ -32,8 +40,27 @@ def generate_advice():
         if not course_data:
             return jsonify({'error': '课程不存在'}), 404
         
+        # 异步模式：入队后立即返回任务ID
+        if request.args.get('async') in ('1', 'true'):
+            job_queue = get_service('job_queue')
+            if job_queue is None:
+                return jsonify({'error': '任务队列不可用'}), 503
+            job = job_queue.submit(
+                'advice',
+                {'student_id': student_id, 'course_id': course_id},
+                dedupe_key=f'advice:{student_id}:{course_id}'
+            )
+            return jsonify(job), 202
+        
         # 生成学习建议
-        advice_result = rag_service.generate_learning_advice(student_data, course_data)
+        advice_result = rag_service.generate_learning_advice(
+            student_data,
+            course_data,
+            retrieval_index=get_service('retrieval_index'),
+            advice_cache=get_service('advice_cache'),
+            course_relations=get_service('course_relations'),
+            course_similarity=get_service('course_similarity')
+        )
         
         return jsonify({
             'student_name': student_data['name'],
@@ -44,13 +71,237 @@ def generate_advice():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@rag_bp.route('/advice/batch', methods=['POST'])
+def generate_batch_advice():
+    """批量生成学习建议，以NDJSON按完成顺序逐行返回结果"""
+    try:
+        rag_service = get_service('rag_service')
+        
+        data = request.get_json()
+        pairs = data.get('pairs') if isinstance(data, dict) else None
+        if not pairs or not isinstance(pairs, list):
+            return jsonify({'error': '缺少学生与课程组合列表'}), 400
+        
+        max_pairs = int(os.getenv('ADVICE_BATCH_MAX', 500))
+        if len(pairs) > max_pairs:
+            return jsonify({'error': f'单次最多处理{max_pairs}个组合'}), 400
+        
+        requested = []
+        for pair in pairs:
+            if isinstance(pair, dict):
+                requested.append((pair.get('student_id'), pair.get('course_id')))
+            elif isinstance(pair, (list, tuple)) and len(pair) == 2:
+                requested.append((pair[0], pair[1]))
+            else:
+                requested.append((None, None))
+        
+        # 开始流式返回后无法再返回400，ID类型在此之前检查（缺失的ID在结果中逐行报错）
+        for index, ids in enumerate(requested):
+            if any(value is not None and not isinstance(value, str) for value in ids):
+                return jsonify({'error': f'第{index}个组合的学生ID和课程ID必须是字符串'}), 400
+        
+        # 每个集合只做一次$in查询
+        students = Student(current_app.db).get_students_by_ids([s for s, _ in requested if s], include_grades=False)
+        courses = Course(current_app.db).get_courses_by_ids([c for _, c in requested if c])
+        
+        retrieval_index = get_service('retrieval_index')
+        advice_cache = get_service('advice_cache')
+        course_relations = get_service('course_relations')
+        course_similarity = get_service('course_similarity')
+        
+        def generate():
+            succeeded = 0
+            failed = 0
+            valid_pairs = []
+            positions = []
+            for index, (student_id, course_id) in enumerate(requested):
+                error = None
+                if not student_id or not course_id:
+                    error = '缺少学生ID或课程ID'
+                elif student_id not in students:
+                    error = '学生不存在'
+                elif course_id not in courses:
+                    error = '课程不存在'
+                
+                if error:
+                    failed += 1
+                    yield _format_ndjson({
+                        'index': index,
+                        'student_id': student_id,
+                        'course_id': course_id,
+                        'status': 'error',
+                        'error': error
+                    })
+                else:
+                    valid_pairs.append((students[student_id], courses[course_id]))
+                    positions.append(index)
+            
+            unique_contexts = 0
+            results = rag_service.generate_batch_advice(
+                valid_pairs,
+                retrieval_index=retrieval_index,
+                advice_cache=advice_cache,
+                course_relations=course_relations,
+                course_similarity=course_similarity
+            )
+            for indices, advice_result, error in results:
+                unique_contexts += 1
+                if advice_result is not None and 'error' in advice_result:
+                    error = advice_result['error']
+                for i in indices:
+                    student_data, course_data = valid_pairs[i]
+                    line = {
+                        'index': positions[i],
+                        'student_id': student_data['_id'],
+                        'course_id': course_data['_id']
+                    }
+                    if error:
+                        failed += 1
+                        line.update({'status': 'error', 'error': error})
+                    else:
+                        succeeded += 1
+                        line.update({
+                            'status': 'ok',
+                            'student_name': student_data.get('name', ''),
+                            'course_name': course_data.get('course_name', ''),
+                            'advice_result': advice_result
+                        })
+                    yield _format_ndjson(line)
+            
+            yield _format_ndjson({
+                'summary': {
+                    'total': len(requested),
+                    'succeeded': succeeded,
+                    'failed': failed,
+                    'unique_contexts': unique_contexts
+                }
+            })
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _format_ndjson(payload):
+    """格式化一行NDJSON"""
+    return json.dumps(payload, ensure_ascii=False, default=str) + '\n'
+
+@rag_bp.route('/advice/stream', methods=['GET', 'POST'])
+def stream_advice():
+    """以Server-Sent Events流式返回学习建议（GET参数或POST JSON）"""
+    try:
+        rag_service = get_service('rag_service')
+        
+        data = request.get_json(silent=True) if request.method == 'POST' else request.args
+        if not data:
+            return jsonify({'error': '缺少请求数据'}), 400
+        
+        student_id = data.get('student_id')
+        course_id = data.get('course_id')
+        
+        if not student_id or not course_id:
+            return jsonify({'error': '缺少学生ID或课程ID'}), 400
+        
+        student_data = Student(current_app.db).get_student(student_id, include_grades=False)
+        if not student_data:
+            return jsonify({'error': '学生不存在'}), 404
+        
+        course_data = Course(current_app.db).get_course(course_id)
+        if not course_data:
+            return jsonify({'error': '课程不存在'}), 404
+        
+        events = rag_service.stream_learning_advice(
+            student_data,
+            course_data,
+            retrieval_index=get_service('retrieval_index'),
+            advice_cache=get_service('advice_cache'),
+            course_relations=get_service('course_relations'),
+            course_similarity=get_service('course_similarity')
+        )
+        
+        def generate():
+            # 先发送注释行，让代理和浏览器立即建立连接
+            yield ': stream-start\n\n'
+            for event, payload in events:
+                if event == 'meta':
+                    payload = dict(
+                        payload,
+                        student_name=student_data['name'],
+                        course_name=course_data.get('course_name', '')
+                    )
+                yield _format_sse(event, payload)
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _format_sse(event, payload):
+    """格式化一条SSE消息"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@rag_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询异步任务状态和结果"""
+    try:
+        job_queue = get_service('job_queue')
+        if job_queue is None:
+            return jsonify({'error': '任务队列不可用'}), 503
+        
+        job = job_queue.get(job_id)
+        if not job:
+            return jsonify({'error': '任务不存在'}), 404
+        
+        return jsonify({'job': job}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@rag_bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """获取学习建议缓存命中统计"""
+    advice_cache = get_service('advice_cache')
+    if advice_cache is None:
+        return jsonify({'error': '建议缓存未启用'}), 404
+    
+    semantic_cache = get_service('rag_service').semantic_cache
+    return jsonify({
+        'cache': advice_cache.stats(),
+        'semantic_cache': semantic_cache.stats() if semantic_cache is not None else None
+    }), 200
+
+@rag_bp.route('/admin/providers', methods=['GET'])
+def get_provider_status():
+    """获取模型提供方健康状态"""
+    rag_service = get_service('rag_service')
+    return jsonify({
+        'dispatch_mode': rag_service.dispatch_mode,
+        'providers': rag_service.provider_registry.snapshot(),
+        'http_pools': rag_service.http_client.stats()
+    }), 200
+
 @rag_bp.route('/courses', methods=['GET'])
 def get_all_courses():
-    """获取所有课程"""
+    """获取课程列表：按_id分页（after为上一页的next_cursor），可按course_code（逗号分隔）筛选，format=ndjson时流式返回"""
     try:
+        args = listing_args(request.args)
         course_model = Course(current_app.db)
-        courses = course_model.get_all_courses()
-        return jsonify({'courses': courses}), 200
+        course_codes = request.args.get('course_code', '').split(',')
+        
+        if args['stream']:
+            courses = course_model.iter_courses(course_codes, fields=args['fields'], after=args['after'], limit=args['limit'])
+            return ndjson_response(courses)
+        
+        courses, next_cursor = course_model.list_courses(
+            course_codes, fields=args['fields'], after=args['after'], limit=args['limit']
+        )
+        return jsonify({'courses': courses, 'next_cursor': next_cursor}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -69,6 +320,31 @@ def get_course(course_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@rag_bp.route('/courses/<course_id>/similar', methods=['GET'])
+def get_similar_courses(course_id):
+    """获取与指定课程最相似的课程"""
+    try:
+        course_model = Course(current_app.db)
+        course = course_model.get_course(course_id)
+        
+        if not course:
+            return jsonify({'error': '课程不存在'}), 404
+        
+        try:
+            k = max(1, min(int(request.args.get('k', 10)), 50))
+        except ValueError:
+            return jsonify({'error': 'k必须是整数'}), 400
+        
+        course_similarity = get_service('course_similarity')
+        similar = course_similarity.similar(course.get('course_code', ''), k=k) if course_similarity else []
+        return jsonify({
+            'course_code': course.get('course_code', ''),
+            'similar_courses': similar
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @rag_bp.route('/analyze-performance', methods=['POST'])
 def analyze_performance():
     """分析学生学习表现"""
@@ -80,13 +356,14 @@ def analyze_performance():
             return jsonify({'error': '缺少学生ID'}), 400
         
         student_model = Student(current_app.db)
-        student_data = student_model.get_student(student_id)
+        student_data = student_model.get_student(student_id, include_grades=False)
         
         if not student_data:
             return jsonify({'error': '学生不存在'}), 404
         
-        grades = student_data.get('grades', [])
-        if not grades:
+        stats = get_grade_stats(student_data)
+        average_score = grade_average(stats)
+        if average_score is None:
             return jsonify({
                 'analysis': {
                     'average_score': 0,
@@ -96,42 +373,44 @@ def analyze_performance():
                 }
             }), 200
         
-        # 计算平均分
-        total_score = sum([g.get('score', 0) for g in grades])
-        average_score = total_score / len(grades)
+        # 分析表现趋势（最近3门课程）
+        recent_avg = recent_average(stats, TREND_WINDOW)
+        if recent_avg is None:
+            recent_avg = average_score
         
-        # 分析表现趋势
-        recent_grades = grades[-3:] if len(grades) >= 3 else grades
-        recent_avg = sum([g.get('score', 0) for g in recent_grades]) / len(recent_grades)
-        
-        if recent_avg > average_score + 5:
-            trend = 'improving'
-        elif recent_avg < average_score - 5:
-            trend = 'declining'
-        else:
-            trend = 'stable'
+        trend = classify_trend(recent_avg, average_score)
         
         # 生成建议
-        recommendations = []
-        if average_score < 70:
-            recommendations.append('建议加强基础知识学习')
-            recommendations.append('寻求老师或同学的帮助')
-        elif average_score < 85:
-            recommendations.append('继续保持学习状态')
-            recommendations.append('可以尝试更有挑战性的内容')
-        else:
-            recommendations.append('学习表现优秀，继续保持')
-            recommendations.append('可以考虑帮助其他同学')
+        recommendations = recommendations_for(average_score)
         
         analysis = {
             'average_score': round(average_score, 2),
-            'total_courses': len(grades),
+            'total_courses': stats['count'],
             'performance_trend': trend,
             'recent_average': round(recent_avg, 2),
+            'score_std': round(score_std(stats), 2),
             'recommendations': recommendations
         }
         
         return jsonify({'analysis': analysis}), 200
         
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@rag_bp.route('/analyze-cohort', methods=['GET'])
+def analyze_cohort():
+    """按专业/年级批量分析学生群体的学习表现"""
+    try:
+        major = request.args.get('major')
+        grade = request.args.get('grade')
+        include_students = request.args.get('include_students', '1') not in ('0', 'false')
+        
+        cohort_analytics = get_service('cohort_analytics')
+        if cohort_analytics is None:
+            return jsonify({'error': '数据库不可用'}), 503
+        
+        analysis = cohort_analytics.analyze(major=major, grade=grade, include_students=include_students)
+        return jsonify({'analysis': analysis}), 200
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
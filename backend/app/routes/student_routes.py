@@ -1,16 +1,46 @@
 from flask import Blueprint, request, jsonify, current_app
 from app.models.student import Student
+from app.routes.listing import listing_args, ndjson_response
+from app.services.grade_import import GradeImporter, grade_format, parse_score
 from bson import ObjectId
+import os
+import shutil
+import tempfile
 
 student_bp = Blueprint('students', __name__)
 
+def _validated_grades(grades):
+    """校验创建学生时提交的成绩列表并将分数转换为数值，不合法时抛出ValueError"""
+    if not isinstance(grades, list):
+        raise ValueError('grades必须是列表')
+    validated = []
+    for index, grade in enumerate(grades, 1):
+        if not isinstance(grade, dict):
+            raise ValueError(f'第{index}条成绩必须是对象')
+        try:
+            validated.append(dict(grade, score=parse_score(grade.get('score'))))
+        except ValueError as e:
+            raise ValueError(f'第{index}条成绩: {e}')
+    return validated
+
 @student_bp.route('/', methods=['GET'])
 def get_all_students():
-    """获取所有学生"""
+    """获取学生列表：按_id分页（after为上一页的next_cursor），可按major、grade筛选，format=ndjson时流式返回"""
     try:
+        args = listing_args(request.args)
         student_model = Student(current_app.db)
-        students = student_model.get_all_students()
-        return jsonify({'students': students}), 200
+        filters = {'major': request.args.get('major'), 'grade': request.args.get('grade')}
+        
+        if args['stream']:
+            students = student_model.iter_students(**filters, fields=args['fields'], after=args['after'], limit=args['limit'])
+            return ndjson_response(students)
+        
+        students, next_cursor = student_model.list_students(
+            **filters, fields=args['fields'], after=args['after'], limit=args['limit']
+        )
+        return jsonify({'students': students, 'next_cursor': next_cursor}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -42,7 +72,7 @@ def create_student():
             'grade': data.get('grade', ''),
             'email': data.get('email', ''),
             'phone': data.get('phone', ''),
-            'grades': data.get('grades', [])
+            'grades': _validated_grades(data.get('grades', []))
         }
         
         student_id = student_model.create_student(student_data)
@@ -51,6 +81,67 @@ def create_student():
             'student_id': student_id
         }), 201
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@student_bp.route('/grades/import', methods=['POST'])
+def import_grades():
+    """批量导入成绩：上传CSV或NDJSON文件（file字段，或直接作为请求体并指定?format=），以NDJSON返回失败的行与汇总
+    
+    每行包含student_id（学号）、course、score，以及可选的semester、year。
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            stream = upload.stream
+            fmt = request.args.get('format') or grade_format(upload.filename)
+        else:
+            stream = request.stream
+            fmt = request.args.get('format') or ('ndjson' if 'ndjson' in (request.mimetype or '') else 'csv')
+        
+        # 请求结束时上传的文件会被关闭，先转存到临时文件，由流式响应在导入完成后关闭
+        spool = tempfile.TemporaryFile()
+        try:
+            shutil.copyfileobj(stream, spool)
+            spool.seek(0)
+            importer = GradeImporter(current_app.db, batch_size=int(os.getenv('GRADE_IMPORT_BATCH_SIZE', 1000)))
+            lines = importer.import_file(spool, fmt)
+        except Exception:
+            spool.close()
+            raise
+        
+        def generate():
+            try:
+                yield from lines
+            finally:
+                spool.close()
+        
+        return ndjson_response(generate())
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@student_bp.route('/grades/distribution', methods=['GET'])
+def grade_distribution():
+    """课程成绩分布：?course=CS3001&bin_width=10"""
+    try:
+        course_code = request.args.get('course', '').strip()
+        if not course_code:
+            return jsonify({'error': '缺少课程代码'}), 400
+        try:
+            bin_width = int(request.args.get('bin_width', 10))
+        except ValueError:
+            return jsonify({'error': 'bin_width必须是整数'}), 400
+        if bin_width < 1:
+            return jsonify({'error': 'bin_width必须大于0'}), 400
+        
+        distribution = Student(current_app.db).grade_distribution(course_code, bin_width)
+        return jsonify(distribution), 200
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -82,9 +173,14 @@ def add_grade(student_id):
             if field not in data:
                 return jsonify({'error': f'缺少必填字段: {field}'}), 400
         
+        try:
+            score = parse_score(data['score'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         grade_data = {
             'course': data['course'],
-            'score': data['score'],
+            'score': score,
             'semester': data.get('semester', ''),
             'year': data.get('year', '')
         }
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+# 当前进程中的缓存实例，用于模型层触发的失效通知
+_instances = weakref.WeakSet()
+
+
+def register_invalidation_listener(cache):
+    """登记需要接收学生/课程失效通知的缓存（需实现invalidate(student_id, course_id, local_only, student_ids)）"""
+    _instances.add(cache)
+
+
+class AdviceCache:
+    """学习建议缓存：进程内LRU + MongoDB持久层（TTL索引自动过期）
+
+    进程内条目最多保留memory_ttl_seconds秒，其他worker进程触发的失效
+    最迟在该时间后对本进程生效；MongoDB中的条目在失效时立即删除。
+    """
+
+    def __init__(self, db=None, maxsize: int = 512, ttl_seconds: int = 86400, memory_ttl_seconds: int = 300):
+        self.collection = db.advice_cache if db is not None else None
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.memory_ttl_seconds = min(memory_ttl_seconds, ttl_seconds)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, student_id, course_id, value)
+        self._indexes_ready = False
+        self._counters = {
+            'memory_hits': 0,
+            'mongo_hits': 0,
+            'misses': 0,
+            'invalidations': 0
+        }
+        register_invalidation_listener(self)
+
+    @staticmethod
+    def make_key(context: str, provider: str, template_version: str) -> str:
+        """基于规范化上下文、模型提供方和提示词模板版本生成缓存键"""
+        lines = (' '.join(line.split()) for line in context.splitlines())
+        normalized = '\n'.join(line for line in lines if line)
+        payload = f"{template_version}\x00{provider}\x00{normalized}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """读取缓存，依次查询进程内LRU和MongoDB"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return entry[3]
+                del self._entries[key]
+
+        doc = None
+        if self.collection is not None:
+            try:
+                doc = self.collection.find_one({'_id': key})
+            except Exception as e:
+                logging.error(f"读取建议缓存失败: {e}")
+
+        # TTL索引的清理有延迟，这里再检查一次过期时间
+        if doc is None or doc['expires_at'] <= datetime.utcnow():
+            with self._lock:
+                self._counters['misses'] += 1
+            return None
+
+        with self._lock:
+            self._counters['mongo_hits'] += 1
+            self._remember(key, doc['value'], doc.get('student_id'), doc.get('course_id'))
+        return doc['value']
+
+    def set(self, key: str, value: Dict, student_id: Optional[str] = None, course_id: Optional[str] = None):
+        """写入缓存"""
+        with self._lock:
+            self._remember(key, value, student_id, course_id)
+
+        if self.collection is None:
+            return
+
+        try:
+            self._ensure_indexes()
+            now = datetime.utcnow()
+            self.collection.replace_one(
+                {'_id': key},
+                {
+                    'value': value,
+                    'student_id': student_id,
+                    'course_id': course_id,
+                    'created_at': now,
+                    'expires_at': now + timedelta(seconds=self.ttl_seconds)
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"写入建议缓存失败: {e}")
+
+    def invalidate(self, student_id: Optional[str] = None, course_id: Optional[str] = None,
+                   local_only: bool = False, student_ids: Optional[Iterable[str]] = None) -> int:
+        """按学生（student_ids可一次传入多个）或课程失效缓存条目，返回进程内移除的条目数"""
+        students = set(student_ids or ())
+        if student_id is not None:
+            students.add(student_id)
+        if not students and course_id is None:
+            return 0
+
+        with self._lock:
+            stale = [
+                key for key, (_, entry_student, entry_course, _) in self._entries.items()
+                if entry_student in students or (course_id is not None and entry_course == course_id)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self._counters['invalidations'] += 1
+
+        if not local_only and self.collection is not None:
+            _delete_persisted(self.collection, students, course_id)
+        return len(stale)
+
+    def clear(self):
+        """清空进程内缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """命中率统计"""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        hits = counters['memory_hits'] + counters['mongo_hits']
+        total = hits + counters['misses']
+        counters.update({
+            'hits': hits,
+            'hit_rate': round(hits / total, 4) if total else 0.0,
+            'memory_entries': size,
+            'maxsize': self.maxsize
+        })
+        return counters
+
+    def _remember(self, key: str, value: Dict, student_id: Optional[str], course_id: Optional[str]):
+        """写入进程内LRU（调用方持有锁）"""
+        self._entries[key] = (time.time() + self.memory_ttl_seconds, student_id, course_id, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        self.collection.create_index('expires_at', expireAfterSeconds=0)
+        self.collection.create_index('student_id')
+        self.collection.create_index('course_id')
+        self._indexes_ready = True
+
+
+def _delete_persisted(collection, student_ids: Iterable[str], course_id: Optional[str]):
+    conditions = []
+    student_ids = list(student_ids)
+    if len(student_ids) == 1:
+        conditions.append({'student_id': student_ids[0]})
+    elif student_ids:
+        conditions.append({'student_id': {'$in': student_ids}})
+    if course_id is not None:
+        conditions.append({'course_id': course_id})
+    try:
+        collection.delete_many({'$or': conditions})
+    except Exception as e:
+        logging.error(f"删除建议缓存失败: {e}")
+
+
+def invalidate_advice_cache(db, student_id: Optional[str] = None, course_id: Optional[str] = None,
+                            student_ids: Optional[Iterable[str]] = None):
+    """学生或课程数据变更后失效相关建议缓存（供模型层调用）；批量写入时通过student_ids一次失效多个学生"""
+    students = {str(value) for value in (student_ids or ())}
+    if student_id is not None:
+        students.add(str(student_id))
+    if not students and course_id is None:
+        return
+
+    course_id = str(course_id) if course_id is not None else None
+
+    for cache in list(_instances):
+        cache.invalidate(course_id=course_id, local_only=True, student_ids=students)
+
+    if db is not None:
+        _delete_persisted(db.advice_cache, students, course_id)
+
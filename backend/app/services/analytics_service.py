@@ -0,0 +1,223 @@
+from itertools import chain
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 趋势与建议分档在grade_stats中定义（analyze_performance路由使用，不依赖numpy）
+from app.services.grade_stats import (  # noqa: F401
+    RECOMMENDATION_BUCKETS, TREND_THRESHOLD, TREND_WINDOW, TRENDS, classify_trend, recommendations_for
+)
+
+AT_RISK_SCORE = 60      # 平均分低于该值视为学业预警
+AT_RISK_RECENT_SCORE = 70  # 成绩下滑且最近平均分低于该值也视为预警
+PERCENTILES = (10, 25, 50, 75, 90)
+COHORT_CHUNK_SIZE = 20000  # 每次聚合返回的学生数，列数组所在的文档需小于16MB
+
+
+def trend_name(code: int) -> str:
+    return TRENDS[code] if code >= 0 else 'insufficient_data'
+
+
+def compute_cohort(counts: np.ndarray, sums: np.ndarray, recent: np.ndarray) -> Dict[str, np.ndarray]:
+    """对整个群体一次性计算各项指标
+
+    counts、sums为每个学生的成绩数量与总分，recent为(n, TREND_WINDOW)的最近成绩矩阵，不足部分为NaN。
+    返回按学生对齐的数组；没有成绩的学生平均分为NaN、趋势编码为-1（insufficient_data）。
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    sums = np.asarray(sums, dtype=np.float64)
+    has_grades = counts > 0
+
+    average = np.full(counts.shape, np.nan)
+    np.divide(sums, counts, out=average, where=has_grades)
+
+    recent_count = np.sum(~np.isnan(recent), axis=1)
+    recent_sum = np.nansum(recent, axis=1)
+    recent_avg = np.where(recent_count > 0, recent_sum / np.maximum(recent_count, 1), average)
+
+    # 趋势编码为TRENDS中的下标，没有成绩为-1
+    trend = np.full(counts.shape, -1, dtype=np.int8)
+    trend[has_grades] = TRENDS.index('stable')
+    trend[has_grades & (recent_avg > average + TREND_THRESHOLD)] = TRENDS.index('improving')
+    trend[has_grades & (recent_avg < average - TREND_THRESHOLD)] = TRENDS.index('declining')
+
+    uppers = np.array([upper for upper, _, _ in RECOMMENDATION_BUCKETS])
+    bucket = np.full(counts.shape, -1, dtype=np.int64)
+    bucket[has_grades] = np.searchsorted(uppers, average[has_grades], side='right')
+
+    at_risk = has_grades & (
+        (average < AT_RISK_SCORE) | ((trend == TRENDS.index('declining')) & (recent_avg < AT_RISK_RECENT_SCORE))
+    )
+
+    # 平均分在群体中的百分位排名（并列取相同排名）
+    percentile_rank = np.full(counts.shape, np.nan)
+    graded = average[has_grades]
+    if graded.size:
+        ordered = np.sort(graded)
+        percentile_rank[has_grades] = np.searchsorted(ordered, graded, side='right') / graded.size * 100
+
+    return {
+        'has_grades': has_grades,
+        'average': average,
+        'recent_average': recent_avg,
+        'trend': trend,
+        'bucket': bucket,
+        'at_risk': at_risk,
+        'percentile_rank': percentile_rank
+    }
+
+
+def recent_matrix(recent_lists: List[List[float]], window: int = TREND_WINDOW) -> np.ndarray:
+    """将每个学生的最近成绩列表整理为(n, window)矩阵，右对齐，不足部分为NaN"""
+    n = len(recent_lists)
+    matrix = np.full((n, window), np.nan)
+    lengths = np.fromiter(map(len, recent_lists), dtype=np.int64, count=n)
+    flat = np.fromiter(chain.from_iterable(recent_lists), dtype=np.float64, count=int(lengths.sum()))
+    if flat.size:
+        # 每个分数的行号与右对齐后的列号，只保留每行最后window个
+        rows = np.repeat(np.arange(n), lengths)
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        cols = np.repeat(window - lengths, lengths) + np.arange(flat.size) - starts
+        keep = cols >= 0
+        matrix[rows[keep], cols[keep]] = flat[keep]
+    return matrix
+
+
+class CohortAnalytics:
+    """按专业/年级对整个学生群体做成绩分析
+
+    只读取grade_stats中的计数、总分和最近成绩窗口，不加载成绩明细。
+    数据库端用聚合把每块学生的字段整理为列数组返回，客户端不逐个解析学生文档。
+    """
+
+    def __init__(self, db, chunk_size: int = COHORT_CHUNK_SIZE):
+        self.db = db
+        self.collection = db.students
+        self.chunk_size = chunk_size
+
+    def analyze(self, major: Optional[str] = None, grade: Optional[str] = None,
+                include_students: bool = True) -> Dict:
+        query = {}
+        if major:
+            query['major'] = major
+        if grade:
+            query['grade'] = grade
+
+        self._backfill_missing(query)
+        columns = self._load_columns(query, include_students)
+        counts = np.asarray(columns['counts'], dtype=np.float64)
+        sums = np.asarray(columns['sums'], dtype=np.float64)
+        recent = recent_matrix(columns['recent'])
+
+        result = compute_cohort(counts, sums, recent)
+        analysis = {
+            'filters': {'major': major, 'grade': grade},
+            'summary': self._summarize(result)
+        }
+        if include_students:
+            analysis['students'] = self._student_rows(columns, counts, result)
+        return analysis
+
+    def _load_columns(self, query: Dict, include_students: bool) -> Dict[str, List]:
+        """按_id分块聚合，每块返回一个文档，其中每个字段是按_id排序的列数组
+
+        分块保证单个结果文档小于16MB；最近成绩在数据库端截取为最后TREND_WINDOW个。
+        """
+        group = {
+            '_id': None,
+            'ids': {'$push': '$_id'},
+            'counts': {'$push': {'$ifNull': ['$grade_stats.count', 0]}},
+            'sums': {'$push': {'$ifNull': ['$grade_stats.sum', 0]}},
+            'recent': {'$push': {'$slice': [{'$ifNull': ['$grade_stats.recent', []]}, -TREND_WINDOW]}}
+        }
+        if include_students:
+            group['student_ids'] = {'$push': {'$ifNull': ['$student_id', None]}}
+            group['names'] = {'$push': {'$ifNull': ['$name', None]}}
+
+        columns = {name: [] for name in group if name != '_id'}
+        after = None
+        while True:
+            match = dict(query, _id={'$gt': after}) if after is not None else query
+            chunk = next(self.collection.aggregate([
+                {'$match': match},
+                {'$sort': {'_id': 1}},
+                {'$limit': self.chunk_size},
+                {'$group': group}
+            ]), None)
+            if chunk is None:
+                break
+            for name, values in columns.items():
+                values.extend(chunk[name])
+            if len(chunk['ids']) < self.chunk_size:
+                break
+            after = chunk['ids'][-1]
+        return columns
+
+    def _backfill_missing(self, query: Dict):
+        """旧文档没有grade_stats时先通过Student模型回填（写回数据库），再读取列"""
+        missing = [str(doc['_id']) for doc in self.collection.find(dict(query, grade_stats={'$exists': False}), {'_id': 1})]
+        if not missing:
+            return
+        from app.models.student import Student
+        Student(self.db).get_students_by_ids(missing, include_grades=False)
+
+    def _summarize(self, result: Dict[str, np.ndarray]) -> Dict:
+        has_grades = result['has_grades']
+        average = result['average'][has_grades]
+        summary = {
+            'total_students': int(has_grades.size),
+            'students_with_grades': int(has_grades.sum()),
+            'at_risk': int(result['at_risk'].sum()),
+            'trends': {
+                trend_name(index): int(np.sum(result['trend'] == index))
+                for index in range(-1, len(TRENDS))
+            },
+            'recommendation_buckets': {
+                name: int(np.sum(result['bucket'] == index))
+                for index, (_, name, _) in enumerate(RECOMMENDATION_BUCKETS)
+            }
+        }
+        if average.size:
+            summary['average_score'] = round(float(average.mean()), 2)
+            summary['score_std'] = round(float(average.std()), 2)
+            summary['percentiles'] = {
+                f'p{p}': round(float(value), 2)
+                for p, value in zip(PERCENTILES, np.percentile(average, PERCENTILES))
+            }
+        else:
+            summary['average_score'] = 0
+            summary['score_std'] = 0
+            summary['percentiles'] = {}
+        return summary
+
+    def _student_rows(self, columns: Dict[str, List], counts: np.ndarray, result: Dict[str, np.ndarray]) -> List[Dict]:
+        rows = []
+        average = result['average'].tolist()
+        recent_avg = result['recent_average'].tolist()
+        percentile_rank = result['percentile_rank'].tolist()
+        for i, object_id in enumerate(columns['ids']):
+            row = {
+                '_id': str(object_id),
+                'student_id': columns['student_ids'][i],
+                'name': columns['names'][i],
+                'total_courses': int(counts[i]),
+                'performance_trend': trend_name(result['trend'][i]),
+                'at_risk': bool(result['at_risk'][i])
+            }
+            if result['has_grades'][i]:
+                _, bucket, recommendations = RECOMMENDATION_BUCKETS[result['bucket'][i]]
+                row.update({
+                    'average_score': round(average[i], 2),
+                    'recent_average': round(recent_avg[i], 2),
+                    'percentile_rank': round(percentile_rank[i], 1),
+                    'recommendation_bucket': bucket,
+                    'recommendations': list(recommendations)
+                })
+            else:
+                row.update({
+                    'average_score': 0,
+                    'recommendation_bucket': None,
+                    'recommendations': ['需要更多成绩数据进行分析']
+                })
+            rows.append(row)
+        return rows
\ No newline at end of file
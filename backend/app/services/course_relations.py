@@ -0,0 +1,395 @@
+import re
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+COURSE_CODE_PATTERN = re.compile(r'\b([A-Z]{2,4}\d{4})\b', re.IGNORECASE)
+DOC_FREQ_ID = 'doc_freq'
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """得分最高的k个下标，按得分从高到低排列（得分相同时保持原顺序）"""
+    k = min(k, scores.size)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k] if k < scores.size else np.arange(scores.size)
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def parse_prerequisite_codes(prerequisites: List[str]) -> List[str]:
+    """从parse_course_description解析出的先修课程条目中提取课程代码"""
+    codes = []
+    for item in prerequisites or []:
+        for code in COURSE_CODE_PATTERN.findall(item or ''):
+            code = code.upper()
+            if code not in codes:
+                codes.append(code)
+    return codes
+
+
+class CourseRelationIndex:
+    """课程相关度索引
+
+    每门课程在course_relations集合中保存一条记录：课程文本（名称、描述、主题、学习目标）的
+    哈希词频向量、先修课程代码，以及按相关度排序的前k个相关课程。
+    相关度 = prereq_weight * 是否存在先修关系 + (1 - prereq_weight) * TF-IDF余弦相似度。
+
+    课程新增或变更时只重新计算该课程与其他课程的相似度（一次稀疏矩阵-向量乘法），
+    并只读取、修改受影响课程的相关列表；其他课程之间的相关度保留上次计算的结果。
+    IDF来自course_relation_stats中的文档频率聚合，课程变更时用$inc更新，不再为每次上传扫描全部词频；
+    各课程的词频向量按terms_rev缓存在进程内，只读取变更过的课程。
+    weighted_rows()提供IDF加权、L2归一化后的课程向量，供课程相似度矩阵计算纯文本相似度。
+    """
+
+    def __init__(self, db, k: int = 10, min_score: float = 0.1, prereq_weight: float = 0.5,
+                 n_features: int = 2 ** 18, cache_seconds: float = 60.0):
+        self.collection = db.course_relations
+        self.k = k
+        self.min_score = min_score
+        self.prereq_weight = prereq_weight
+        self.cache_seconds = cache_seconds
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features,
+            analyzer='char_wb',
+            ngram_range=(2, 4),
+            alternate_sign=False,
+            norm=None
+        )
+        self._courses = db.courses
+        self._stats = db.course_relation_stats
+        self._lock = threading.Lock()
+        self._cache = {}  # course_code -> (读取时间, 相关列表或None)
+        self._rows = {}   # course_code -> (terms_rev, 词频向量)
+        self._weighted = None  # (各课程terms_rev的集合, 课程代码, 加权矩阵)，最近一次计算的weighted_rows
+
+    def neighbors(self, course_code: str) -> Optional[List[Tuple[str, float]]]:
+        """课程的相关课程 [(课程代码, 相关度)]；索引中没有该课程时返回None"""
+        course_code = (course_code or '').strip().upper()
+        if not course_code:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(course_code)
+        if cached is not None and now - cached[0] < self.cache_seconds:
+            return cached[1]
+
+        doc = self.collection.find_one({'_id': course_code}, {'neighbors': 1})
+        result = None
+        if doc is not None:
+            result = [(n['course_code'], n['score']) for n in doc.get('neighbors', [])]
+        with self._lock:
+            self._cache[course_code] = (now, result)
+        return result
+
+    def update_course(self, course_info: Dict) -> List[Tuple[str, float]]:
+        """新增或更新一门课程，返回该课程新的相关列表"""
+        course_code = (course_info.get('course_code') or '').strip().upper()
+        if not course_code:
+            return []
+
+        terms = self._term_vector(course_info)
+        prerequisites = parse_prerequisite_codes(course_info.get('prerequisites', []))
+        codes, all_prereqs, matrix = self._load_rows()
+        revs = self._revisions(codes)
+        rows = {code: row for row, code in enumerate(codes)}
+        previous_terms = matrix[rows[course_code]] if course_code in rows else None
+        idf = self._idf(self._update_doc_freq(previous_terms, terms))
+
+        others = [row for row, code in enumerate(codes) if code != course_code]
+        codes = [codes[row] for row in others]
+        all_prereqs = [all_prereqs[row] for row in others]
+        matrix = self._weighted_matrix(sp.vstack([matrix[others], terms], format='csr') if others else terms, idf)
+        own = matrix[-1]
+        scores = self._combine(
+            np.asarray((matrix[:-1] @ own.T).todense()).ravel() if others else np.zeros(0),
+            np.array([
+                code in prerequisites or course_code in other_prereqs
+                for code, other_prereqs in zip(codes, all_prereqs)
+            ], dtype=bool)
+        )
+
+        neighbors = self._top_k(codes, scores)
+        terms_rev = ObjectId()
+        self.collection.replace_one(
+            {'_id': course_code},
+            {
+                'terms': _dump_terms(terms),
+                'terms_rev': terms_rev,
+                'prerequisites': prerequisites,
+                'neighbors': neighbors,
+                'updated_at': datetime.utcnow()
+            },
+            upsert=True
+        )
+        with self._lock:
+            self._rows[course_code] = (terms_rev, terms)
+            self._weighted = (
+                frozenset(rev for code, rev in revs.items() if code != course_code) | {terms_rev},
+                codes + [course_code],
+                matrix
+            )
+
+        # 只读取并修改相关列表会因本课程而改变的课程：原列表中有本课程，或新的相关度达到min_score
+        rows = {code: row for row, code in enumerate(codes)}
+        candidates = [codes[row] for row in np.flatnonzero(scores >= self.min_score)]
+        affected = self.collection.find(
+            {'$or': [{'_id': {'$in': candidates}}, {'neighbors.course_code': course_code}]},
+            {'neighbors': 1}
+        )
+        changed = {course_code: neighbors}
+        for doc in affected:
+            code = doc['_id']
+            row = rows.get(code)
+            if row is None:
+                continue
+            current = doc.get('neighbors', [])
+            previous = next((n['score'] for n in current if n['course_code'] == course_code), None)
+            score = float(scores[row])
+
+            if previous is not None and score < previous and len(current) >= self.k:
+                # 本课程相关度下降，原列表之外的课程可能进入前k，重新计算该课程的完整列表
+                updated = self._recompute_row(row, codes, all_prereqs, matrix, course_code, prerequisites)
+            elif previous is not None or score >= self.min_score:
+                updated = [n for n in current if n['course_code'] != course_code]
+                if score >= self.min_score:
+                    updated.append({'course_code': course_code, 'score': round(score, 4)})
+                updated = sorted(updated, key=lambda n: -n['score'])[:self.k]
+            else:
+                continue
+
+            if updated != current:
+                self.collection.update_one(
+                    {'_id': code},
+                    {'$set': {'neighbors': updated, 'updated_at': datetime.utcnow()}}
+                )
+                changed[code] = updated
+
+        with self._lock:
+            for code, updated in changed.items():
+                self._cache[code] = (time.monotonic(), [(n['course_code'], n['score']) for n in updated])
+        return [(n['course_code'], n['score']) for n in neighbors]
+
+    def weighted_rows(self) -> Tuple[List[str], Optional[sp.csr_matrix]]:
+        """索引中所有课程的 (课程代码, IDF加权并按行L2归一化的词频矩阵)
+
+        矩阵按各课程的terms_rev缓存在进程内：update_course刚计算过的矩阵直接复用，
+        其他进程修改过课程时重新计算。
+        """
+        # 只读取各课程的terms_rev判断缓存是否有效，有效时不再读取先修课程、拼接词频矩阵
+        key = frozenset(doc.get('terms_rev') for doc in self.collection.find({}, {'terms_rev': 1}))
+        with self._lock:
+            cached = self._weighted
+        if cached is not None and cached[0] == key:
+            return cached[1], cached[2]
+
+        codes, _, matrix = self._load_rows()
+        if matrix is None:
+            return [], None
+        key = frozenset(self._revisions(codes).values())
+
+        weighted = self._weighted_matrix(matrix, self._idf(self._doc_freq()))
+        with self._lock:
+            self._weighted = (key, codes, weighted)
+        return codes, weighted
+
+    def remove_course(self, course_code: str):
+        """移除一门课程，并为原本与其相关的课程重新计算相关列表"""
+        course_code = (course_code or '').strip().upper()
+        codes, _, matrix = self._load_rows()
+        if self.collection.delete_one({'_id': course_code}).deleted_count and course_code in codes:
+            self._update_doc_freq(matrix[codes.index(course_code)], None)
+        affected = list(self.collection.find({'neighbors.course_code': course_code}, {'_id': 1}))
+        with self._lock:
+            self._cache.pop(course_code, None)
+            self._rows.pop(course_code, None)
+        if affected:
+            self._refresh([doc['_id'] for doc in affected])
+
+    def rebuild(self) -> int:
+        """根据courses集合全量重建索引（首次部署或调整参数后使用），返回课程数量"""
+        courses = [
+            course for course in self._courses.find({}, {
+                'course_code': 1, 'course_name': 1, 'description': 1,
+                'topics': 1, 'objectives': 1, 'prerequisites': 1
+            })
+            if course.get('course_code')
+        ]
+        now = datetime.utcnow()
+        for course in courses:
+            code = course['course_code'].strip().upper()
+            self.collection.replace_one(
+                {'_id': code},
+                {
+                    'terms': _dump_terms(self._term_vector(course)),
+                    'terms_rev': ObjectId(),
+                    'prerequisites': parse_prerequisite_codes(course.get('prerequisites', [])),
+                    'neighbors': [],
+                    'updated_at': now
+                },
+                upsert=True
+            )
+        self._rebuild_doc_freq()
+        self._refresh([course['course_code'].strip().upper() for course in courses])
+        return len(courses)
+
+    def ensure_built(self):
+        """索引为空而已有课程时全量构建一次"""
+        if self.collection.estimated_document_count() == 0 and self._courses.estimated_document_count() > 0:
+            logging.info("课程相关度索引为空，开始全量构建")
+            self.rebuild()
+
+    def _refresh(self, course_codes: List[str]):
+        """重新计算指定课程的相关列表"""
+        codes, all_prereqs, matrix = self._load_rows()
+        if not codes:
+            return
+        matrix = self._weighted_matrix(matrix, self._idf(self._doc_freq()))
+        rows = {code: row for row, code in enumerate(codes)}
+        for code in course_codes:
+            row = rows.get(code)
+            if row is None:
+                continue
+            neighbors = self._recompute_row(row, codes, all_prereqs, matrix)
+            self.collection.update_one(
+                {'_id': code},
+                {'$set': {'neighbors': neighbors, 'updated_at': datetime.utcnow()}}
+            )
+            with self._lock:
+                self._cache[code] = (time.monotonic(), [(n['course_code'], n['score']) for n in neighbors])
+
+    def _load_rows(self) -> Tuple[List[str], List[List[str]], Optional[sp.csr_matrix]]:
+        """返回索引中所有课程的 (课程代码, 先修课程代码, 词频矩阵)
+
+        词频向量按terms_rev缓存在进程内，每次只读取各课程的terms_rev与先修课程，
+        词频只为新增或变更过的课程从数据库读取。
+        """
+        docs = list(self.collection.find({}, {'terms_rev': 1, 'prerequisites': 1}))
+        with self._lock:
+            stale = [
+                doc['_id'] for doc in docs
+                if doc['_id'] not in self._rows or self._rows[doc['_id']][0] != doc.get('terms_rev')
+            ]
+        if stale:
+            loaded = {
+                doc['_id']: (doc.get('terms_rev'), _load_terms(doc['terms'], self.vectorizer.n_features))
+                for doc in self.collection.find({'_id': {'$in': stale}}, {'terms': 1, 'terms_rev': 1})
+            }
+            with self._lock:
+                self._rows.update(loaded)
+            docs = [doc for doc in docs if doc['_id'] not in stale or doc['_id'] in loaded]
+
+        codes = [doc['_id'] for doc in docs]
+        with self._lock:
+            for code in set(self._rows) - set(codes):
+                del self._rows[code]
+            rows = [self._rows[code][1] for code in codes]
+        matrix = sp.vstack(rows, format='csr') if rows else None
+        return codes, [doc.get('prerequisites', []) for doc in docs], matrix
+
+    def _revisions(self, codes: List[str]) -> Dict:
+        """_load_rows返回的课程各自的terms_rev"""
+        with self._lock:
+            return {code: self._rows[code][0] for code in codes if code in self._rows}
+
+    def _doc_freq(self) -> Dict:
+        """文档频率聚合 {courses: 课程数, df: {特征下标: 包含该特征的课程数}}，不存在时按索引计算一次"""
+        stats = self._stats.find_one({'_id': DOC_FREQ_ID})
+        return stats if stats is not None else self._rebuild_doc_freq()
+
+    def _rebuild_doc_freq(self) -> Dict:
+        _, _, matrix = self._load_rows()
+        stats = {'_id': DOC_FREQ_ID, 'courses': 0, 'df': {}}
+        if matrix is not None:
+            doc_freq = np.bincount(matrix.indices, minlength=matrix.shape[1])
+            features = np.flatnonzero(doc_freq)
+            stats['courses'] = matrix.shape[0]
+            stats['df'] = {str(feature): int(count) for feature, count in zip(features, doc_freq[features])}
+        self._stats.replace_one({'_id': DOC_FREQ_ID}, stats, upsert=True)
+        return stats
+
+    def _update_doc_freq(self, previous_terms, terms) -> Dict:
+        """课程词频由previous_terms变为terms（None表示不存在）时用$inc更新文档频率聚合，返回更新后的聚合"""
+        if self._stats.count_documents({'_id': DOC_FREQ_ID}, limit=1) == 0:
+            self._rebuild_doc_freq()
+        previous = set(previous_terms.indices.tolist()) if previous_terms is not None else set()
+        current = set(terms.indices.tolist()) if terms is not None else set()
+        inc = {f'df.{feature}': 1 for feature in current - previous}
+        inc.update({f'df.{feature}': -1 for feature in previous - current})
+        courses = (terms is not None) - (previous_terms is not None)
+        if courses:
+            inc['courses'] = courses
+        if not inc:
+            return self._doc_freq()
+        return self._stats.find_one_and_update(
+            {'_id': DOC_FREQ_ID}, {'$inc': inc}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+
+    def _idf(self, stats: Dict) -> np.ndarray:
+        doc_freq = np.zeros(self.vectorizer.n_features)
+        df = stats.get('df', {})
+        if df:
+            doc_freq[np.fromiter(df.keys(), dtype=np.int64, count=len(df))] = np.fromiter(
+                df.values(), dtype=np.float64, count=len(df)
+            )
+        return np.log((1.0 + stats.get('courses', 0)) / (1.0 + doc_freq)) + 1.0
+
+    def _recompute_row(self, row: int, codes: List[str], all_prereqs: List[List[str]], matrix,
+                       extra_code: Optional[str] = None, extra_prerequisites: Optional[List[str]] = None) -> List[Dict]:
+        """计算第row门课程与其他所有课程（以及矩阵最后一行的extra_code课程）的相关列表"""
+        code = codes[row]
+        prerequisites = all_prereqs[row]
+        all_codes = codes + ([extra_code] if extra_code else [])
+        all_prereqs = all_prereqs + ([extra_prerequisites or []] if extra_code else [])
+
+        similarities = np.asarray((matrix @ matrix[row].T).todense()).ravel()
+        is_prereq = np.array([
+            other in prerequisites or code in other_prereqs
+            for other, other_prereqs in zip(all_codes, all_prereqs)
+        ], dtype=bool)
+        scores = self._combine(similarities, is_prereq)
+        scores[row] = -1.0
+        return self._top_k(all_codes, scores)
+
+    def _combine(self, similarities: np.ndarray, is_prereq: np.ndarray) -> np.ndarray:
+        return self.prereq_weight * is_prereq + (1.0 - self.prereq_weight) * similarities
+
+    def _top_k(self, codes: List[str], scores: np.ndarray) -> List[Dict]:
+        top = top_k_indices(scores, self.k)
+        return [
+            {'course_code': codes[i], 'score': round(float(scores[i]), 4)}
+            for i in top if scores[i] >= self.min_score
+        ]
+
+    def _term_vector(self, course_info: Dict):
+        parts = [course_info.get('course_name') or '', course_info.get('description') or '']
+        for field in ('topics', 'objectives'):
+            parts.extend(course_info.get(field) or [])
+        vector = self.vectorizer.transform([' '.join(parts).lower()])
+        vector.data = 1.0 + np.log(vector.data)  # 次线性词频
+        return vector
+
+    def _weighted_matrix(self, matrix, idf: np.ndarray):
+        """词频矩阵乘以文档频率聚合得到的IDF，并按行L2归一化"""
+        return normalize(matrix @ sp.diags(idf), norm='l2', copy=False).tocsr()
+
+
+def _dump_terms(vector) -> Dict:
+    return {'indices': vector.indices.tolist(), 'values': vector.data.tolist()}
+
+
+def _load_terms(terms: Dict, n_features: int):
+    indices = terms.get('indices', [])
+    return sp.csr_matrix(
+        (terms.get('values', []), indices, [0, len(indices)]),
+        shape=(1, n_features)
+    )
\ No newline at end of file
@@ -0,0 +1,434 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from app.services.course_relations import top_k_indices
+
+try:
+    import fcntl
+except ImportError:  # Windows开发环境没有fcntl，退化为进程内锁
+    fcntl = None
+
+
+# 版本目录的格式：相似度改为来自课程相关度索引的课程向量后，旧格式的版本视为不存在并重新构建
+FORMAT = 'relations-1'
+
+
+class CourseSimilarityMatrix:
+    """课程相似度矩阵
+
+    课程之间的纯文本相似度（不含先修关系），每门课程只保留前k个最相似的课程，
+    以ELL格式（n×k的邻居下标矩阵和相似度矩阵，不足k个时下标为-1）保存为.npy文件。
+    读取时以内存映射方式打开，多个worker进程共享同一份页缓存；查询某门课程的相似课程只需读取一行。
+    相似度是课程相关度索引（CourseRelationIndex.weighted_rows）中TF-IDF向量的余弦相似度，
+    本类不再单独向量化课程文本，写入前需先更新课程相关度索引。
+
+    全量构建写入新的版本目录，再原子地替换CURRENT指针文件；读取方在查询时检查指针，发现新版本后重新映射。
+    单门课程的更新只向当前版本的log.jsonl追加一行（该课程与变化的邻居行），
+    读取方按偏移读取新追加的行，覆盖内存映射中的对应行；追加满compact_after行后合并写入新版本。
+    写入方通过文件锁串行化，并在进程内保留邻居矩阵，其他进程没有写入时不重新读取版本目录。
+    """
+
+    def __init__(self, directory: str, relations, k: int = 20, keep_versions: int = 2, compact_after: int = 1000):
+        self.directory = directory
+        self.relations = relations
+        self.k = k
+        self.keep_versions = keep_versions
+        self.compact_after = compact_after
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._version = None
+        self._courses = []     # [{'course_code', 'course_id', 'course_name'}]
+        self._rows = {}        # course_code -> 行号
+        self._neighbors = None  # 内存映射的(n, k)邻居下标
+        self._scores = None     # 内存映射的(n, k)相似度
+        self._overlay = {}      # 行号 -> (邻居下标, 相似度)，来自log.jsonl，优先于内存映射
+        self._log_offset = 0    # log.jsonl中已读取的字节数
+        self._writer = None     # 写入方的进程内状态，见_load_for_write
+
+    def similar(self, course_code: str, k: int = 10) -> List[Dict]:
+        """与课程最相似的k门课程"""
+        with self._lock:
+            self._refresh()
+            row = self._rows.get((course_code or '').strip().upper())
+            if row is None:
+                return []
+            if row in self._overlay:
+                neighbors, scores = (values[:k] for values in self._overlay[row])
+            else:
+                neighbors = np.array(self._neighbors[row, :k])
+                scores = np.array(self._scores[row, :k])
+            courses = self._courses
+
+        results = []
+        for index, score in zip(neighbors, scores):
+            if index < 0 or score <= 0:
+                break
+            course = dict(courses[index])
+            course['score'] = round(float(score), 4)
+            results.append(course)
+        return results
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._refresh()
+            return {'version': self._version, 'courses': len(self._courses), 'k': self.k}
+
+    def update_course(self, course_info: Dict, course_id: Optional[str] = None) -> int:
+        """新增或更新一门课程：只计算该课程与其他课程的相似度，并修补受影响课程的邻居行。返回课程数量
+
+        课程相关度索引中没有该课程（更新相关度索引失败）时不做修改。
+        """
+        course_code = (course_info.get('course_code') or '').strip().upper()
+        if not course_code:
+            return 0
+        codes, matrix = self.relations.weighted_rows()
+        relation_rows = {code: row for row, code in enumerate(codes)}
+        if course_code not in relation_rows:
+            logging.error(f"课程相关度索引中没有{course_code}，跳过相似度更新")
+            return len(self._courses)
+
+        with self._write_lock():
+            state = self._load_for_write()
+            self._writer = None  # 计算中途出错时下次重新读取
+            courses, neighbors, scores = state['courses'], state['neighbors'], state['scores']
+            entry = {
+                'course_code': course_code,
+                'course_id': str(course_id) if course_id is not None else None,
+                'course_name': course_info.get('course_name', '')
+            }
+
+            rows = {course['course_code']: i for i, course in enumerate(courses)}
+            row = rows.get(course_code)
+            if row is None:
+                row = len(courses)
+                courses.append(entry)
+                neighbors = np.vstack([neighbors, np.full((1, self.k), -1, dtype=np.int32)])
+                scores = np.vstack([scores, np.zeros((1, self.k), dtype=np.float32)])
+            else:
+                courses[row] = entry
+
+            positions = _positions(courses, relation_rows)
+            similarities = _similarities(matrix, positions, relation_rows[course_code])
+            similarities[row] = 0.0
+            neighbors[row], scores[row] = _top_k(similarities, self.k)
+            changed = {row}
+
+            # 修补其他课程的邻居行：本课程进入前k，或本课程原本在前k而相似度有变化
+            contains = np.any(neighbors == row, axis=1)
+            contains[row] = False
+            enters = (similarities > scores[:, -1]) & ~contains
+            enters[row] = False
+            for other in np.flatnonzero(enters):
+                _insert(neighbors[other], scores[other], row, similarities[other])
+                changed.add(int(other))
+            for other in np.flatnonzero(contains):
+                position = int(np.flatnonzero(neighbors[other] == row)[0])
+                if similarities[other] >= scores[other, position] or neighbors[other, -1] < 0:
+                    _remove(neighbors[other], scores[other], position)
+                    _insert(neighbors[other], scores[other], row, similarities[other])
+                else:
+                    # 相似度下降，原本排在前k之外的课程可能进入，重新计算该行
+                    row_similarities = _similarities(matrix, positions, positions[other])
+                    row_similarities[other] = 0.0
+                    neighbors[other], scores[other] = _top_k(row_similarities, self.k)
+                changed.add(int(other))
+
+            state.update(neighbors=neighbors, scores=scores)
+            if state['log_records'] >= self.compact_after:
+                state.update(version=self._write(courses, neighbors, scores), log_size=0, log_records=0)
+            else:
+                self._append_log(state, row, entry, changed)
+            self._writer = state
+            return len(courses)
+
+    def rebuild(self, courses: List[Dict], block_size: int = 1024) -> int:
+        """根据课程列表全量构建（首次部署时使用，课程相关度索引需已构建），按块计算以限制内存"""
+        entries = []
+        seen = {}
+        for course in courses:
+            course_code = (course.get('course_code') or '').strip().upper()
+            if not course_code:
+                continue
+            entry = {
+                'course_code': course_code,
+                'course_id': str(course['_id']) if course.get('_id') is not None else None,
+                'course_name': course.get('course_name', '')
+            }
+            if course_code in seen:
+                entries[seen[course_code]] = entry
+            else:
+                seen[course_code] = len(entries)
+                entries.append(entry)
+
+        codes, matrix = self.relations.weighted_rows()
+        with self._write_lock():
+            n = len(entries)
+            neighbors = np.full((n, self.k), -1, dtype=np.int32)
+            scores = np.zeros((n, self.k), dtype=np.float32)
+            if n and matrix is not None:
+                positions = _positions(entries, {code: row for row, code in enumerate(codes)})
+                # 按本矩阵的课程顺序排列向量，相关度索引中没有的课程为零向量
+                aligned = (sp.diags((positions >= 0).astype(np.float32)) @ matrix[np.maximum(positions, 0)]).tocsr()
+                for start in range(0, n, block_size):
+                    block = (aligned[start:start + block_size] @ aligned.T).toarray()
+                    for offset, similarities in enumerate(block):
+                        similarities[start + offset] = 0.0
+                        neighbors[start + offset], scores[start + offset] = _top_k(similarities, self.k)
+            version = self._write(entries, neighbors, scores)
+            self._writer = {
+                'version': version, 'log_size': 0, 'log_records': 0,
+                'courses': entries, 'neighbors': neighbors, 'scores': scores
+            }
+            return n
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            self._refresh()
+            return not self._courses
+
+    def _refresh(self):
+        """CURRENT指向新版本时重新映射，并读取log.jsonl中新追加的更新（调用方持有锁）"""
+        version = self._read_current()
+        if version != self._version:
+            self._remap(version)
+        if self._version is not None and self._log_size(self._version) > self._log_offset:
+            self._read_log()
+
+    def _remap(self, version: Optional[str]):
+        if version is None:
+            self._version, self._courses, self._rows = None, [], {}
+            self._neighbors = self._scores = None
+            self._overlay, self._log_offset = {}, 0
+            return
+
+        path = os.path.join(self.directory, version)
+        try:
+            with open(os.path.join(path, 'courses.json'), encoding='utf-8') as f:
+                courses = json.load(f)
+            neighbors = np.load(os.path.join(path, 'neighbors.npy'), mmap_mode='r')
+            scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode='r')
+        except (OSError, ValueError) as e:
+            logging.error(f"加载课程相似度矩阵失败: {e}")
+            return
+
+        self._version = version
+        self._courses = courses
+        self._rows = {course['course_code']: i for i, course in enumerate(courses)}
+        self._neighbors = neighbors
+        self._scores = scores
+        self._overlay, self._log_offset = {}, 0
+
+    def _read_log(self):
+        """读取log.jsonl中上次读取位置之后的完整行，覆盖对应课程与邻居行"""
+        try:
+            with open(os.path.join(self.directory, self._version, 'log.jsonl'), 'rb') as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except OSError as e:
+            logging.error(f"读取课程相似度更新失败: {e}")
+            return
+        end = data.rfind(b'\n') + 1  # 写入方可能正在追加最后一行
+        courses = list(self._courses)
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            _apply_course(courses, self._rows, record)
+            for other, (neighbors, scores) in record['rows'].items():
+                self._overlay[int(other)] = (np.array(neighbors, dtype=np.int32), np.array(scores, dtype=np.float32))
+        self._courses = courses
+        self._log_offset += end
+
+    def _log_size(self, version: str) -> int:
+        try:
+            return os.path.getsize(os.path.join(self.directory, version, 'log.jsonl'))
+        except OSError:
+            return 0
+
+    def _read_current(self) -> Optional[str]:
+        """CURRENT指向的版本；指向旧格式的版本时视为没有版本"""
+        try:
+            with open(os.path.join(self.directory, 'CURRENT'), encoding='utf-8') as f:
+                version = f.read().strip() or None
+            if version is None:
+                return None
+            with open(os.path.join(self.directory, version, 'FORMAT'), encoding='utf-8') as f:
+                return version if f.read().strip() == FORMAT else None
+        except OSError:
+            return None
+
+    def _load_for_write(self) -> Dict:
+        """写入方的状态（调用方持有写锁）：当前版本与log.jsonl均未被其他进程改变时直接使用进程内的状态，
+        否则读取版本目录并重放log.jsonl"""
+        version = self._read_current()
+        log_size = self._log_size(version) if version is not None else 0
+        state = self._writer
+        if state is not None and state['version'] == version and state['log_size'] == log_size:
+            return state
+
+        courses = []
+        neighbors = np.zeros((0, self.k), dtype=np.int32)
+        scores = np.zeros((0, self.k), dtype=np.float32)
+        log_records = 0
+        if version is not None:
+            path = os.path.join(self.directory, version)
+            with open(os.path.join(path, 'courses.json'), encoding='utf-8') as f:
+                courses = json.load(f)
+            neighbors = np.load(os.path.join(path, 'neighbors.npy'))
+            scores = np.load(os.path.join(path, 'scores.npy'))
+            if log_size:
+                with open(os.path.join(path, 'log.jsonl'), 'rb') as f:
+                    data = f.read(log_size)
+                rows = {course['course_code']: i for i, course in enumerate(courses)}
+                for line in data.splitlines():
+                    record = json.loads(line)
+                    if _apply_course(courses, rows, record):
+                        neighbors = np.vstack([neighbors, np.full((1, self.k), -1, dtype=np.int32)])
+                        scores = np.vstack([scores, np.zeros((1, self.k), dtype=np.float32)])
+                    for other, (other_neighbors, other_scores) in record['rows'].items():
+                        neighbors[int(other)] = other_neighbors
+                        scores[int(other)] = other_scores
+                    log_records += 1
+
+        return {
+            'version': version, 'log_size': log_size, 'log_records': log_records,
+            'courses': courses, 'neighbors': neighbors, 'scores': scores
+        }
+
+    def _append_log(self, state: Dict, row: int, entry: Dict, changed):
+        """向当前版本的log.jsonl追加一门课程的更新（调用方持有写锁）；还没有版本时先写入完整版本"""
+        if state['version'] is None:
+            state.update(
+                version=self._write(state['courses'], state['neighbors'], state['scores']),
+                log_size=0, log_records=0
+            )
+            return
+        record = {
+            'row': row,
+            'course': entry,
+            'rows': {
+                str(other): [state['neighbors'][other].tolist(), state['scores'][other].tolist()]
+                for other in sorted(changed)
+            }
+        }
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(os.path.join(self.directory, state['version'], 'log.jsonl'), 'ab') as f:
+            f.write(line)
+        state['log_size'] += len(line)
+        state['log_records'] += 1
+
+        with self._lock:
+            self._refresh()
+
+    def _write(self, courses: List[Dict], neighbors: np.ndarray, scores: np.ndarray) -> str:
+        """写入新版本目录并切换CURRENT（调用方持有写锁）"""
+        version = f"v{time.time_ns()}"
+        path = os.path.join(self.directory, version)
+        os.makedirs(path)
+        with open(os.path.join(path, 'courses.json'), 'w', encoding='utf-8') as f:
+            json.dump(courses, f, ensure_ascii=False)
+        np.save(os.path.join(path, 'neighbors.npy'), np.ascontiguousarray(neighbors, dtype=np.int32))
+        np.save(os.path.join(path, 'scores.npy'), np.ascontiguousarray(scores, dtype=np.float32))
+        with open(os.path.join(path, 'FORMAT'), 'w', encoding='utf-8') as f:
+            f.write(FORMAT)
+
+        pointer = os.path.join(self.directory, f'CURRENT.{os.getpid()}.tmp')
+        with open(pointer, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(self.directory, 'CURRENT'))
+        self._prune(version)
+
+        with self._lock:
+            self._refresh()
+        return version
+
+    def _prune(self, current: str):
+        # 已映射旧版本的读取方在Linux上删除后仍可继续读取
+        versions = sorted(name for name in os.listdir(self.directory) if name.startswith('v'))
+        for name in versions[:-self.keep_versions]:
+            if name != current:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _positions(courses: List[Dict], relation_rows: Dict) -> np.ndarray:
+    """各课程在课程相关度索引加权矩阵中的行号，索引中没有的课程为-1"""
+    return np.fromiter(
+        (relation_rows.get(course['course_code'], -1) for course in courses), dtype=np.int64, count=len(courses)
+    )
+
+
+def _similarities(matrix, positions: np.ndarray, relation_row: int) -> np.ndarray:
+    """相关度索引第relation_row行的课程与本矩阵各课程（按positions对应）的余弦相似度"""
+    similarities = np.zeros(positions.size, dtype=np.float32)
+    if relation_row < 0:
+        return similarities
+    values = matrix @ matrix[relation_row].toarray().ravel()  # 稀疏矩阵乘稠密向量，比稀疏乘稀疏快一个数量级
+    present = positions >= 0
+    similarities[present] = values[positions[present]]
+    return similarities
+
+
+def _apply_course(courses: List[Dict], rows: Dict, record: Dict) -> bool:
+    """把log.jsonl中一条更新的课程写入课程列表，返回是否为新增课程"""
+    row = record['row']
+    if row == len(courses):
+        courses.append(record['course'])
+        rows[record['course']['course_code']] = row
+        return True
+    courses[row] = record['course']
+    rows[record['course']['course_code']] = row
+    return False
+
+
+def _top_k(similarities: np.ndarray, k: int):
+    """返回长度为k的(邻居下标, 相似度)，相似度为0的位置下标为-1"""
+    neighbors = np.full(k, -1, dtype=np.int32)
+    scores = np.zeros(k, dtype=np.float32)
+    top = top_k_indices(similarities, k)
+    top = top[similarities[top] > 0]
+    neighbors[:top.size] = top
+    scores[:top.size] = similarities[top]
+    return neighbors, scores
+
+
+def _insert(neighbors: np.ndarray, scores: np.ndarray, index: int, score: float):
+    """按相似度把index插入一行邻居（原地修改，超出k个时丢弃最末的邻居）"""
+    if score <= 0:
+        return
+    valid = neighbors >= 0
+    position = int(np.searchsorted(-scores[valid], -score, side='right'))
+    if position >= neighbors.size:
+        return
+    neighbors[position + 1:] = neighbors[position:-1].copy()
+    scores[position + 1:] = scores[position:-1].copy()
+    neighbors[position] = index
+    scores[position] = score
+
+
+def _remove(neighbors: np.ndarray, scores: np.ndarray, position: int):
+    """移除一行邻居中position处的邻居，后面的邻居前移"""
+    neighbors[position:-1] = neighbors[position + 1:].copy()
+    scores[position:-1] = scores[position + 1:].copy()
+    neighbors[-1] = -1
+    scores[-1] = 0.0
\ No newline at end of file
@@ -0,0 +1,100 @@
+import logging
+import threading
+from datetime import datetime
+from typing import BinaryIO, Dict, Optional
+
+from app.services.pdf_service import EXTRACTOR_VERSION
+
+
+class ExtractionCache:
+    """PDF解析结果缓存：以上传文件内容的SHA-256为键
+
+    pdf_extractions集合中每个文件一条记录（_id为SHA-256），保存提取的文本、解析出的course_info、
+    页数与元数据，重复上传同一文件时一次按_id查询即可返回。记录带有extractor_version，
+    PDFService的解析逻辑变化（EXTRACTOR_VERSION递增）后旧记录不再命中，下次上传时重新解析并覆盖。
+    store_raw为True时原始PDF另存入GridFS（pdf_files桶），便于之后用新版本解析逻辑重新处理。
+    """
+
+    def __init__(self, db, store_raw: bool = False, extractor_version: int = EXTRACTOR_VERSION):
+        self.db = db
+        self.collection = db.pdf_extractions
+        self.store_raw = store_raw
+        self.extractor_version = extractor_version
+        self._fs = None
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'stale': 0, 'writes': 0}
+
+    def get(self, sha256: str) -> Optional[Dict]:
+        """读取当前解析版本的缓存记录，没有或版本过旧时返回None"""
+        try:
+            doc = self.collection.find_one({'_id': sha256})
+        except Exception as e:
+            logging.error(f"读取PDF解析缓存失败: {e}")
+            doc = None
+
+        with self._lock:
+            if doc is None:
+                self._counters['misses'] += 1
+                return None
+            if doc.get('extractor_version') != self.extractor_version:
+                self._counters['stale'] += 1
+                self._counters['misses'] += 1
+                return None
+            self._counters['hits'] += 1
+
+        try:
+            self.collection.update_one(
+                {'_id': sha256},
+                {'$inc': {'hits': 1}, '$set': {'last_hit_at': datetime.utcnow()}}
+            )
+        except Exception as e:
+            logging.error(f"更新PDF解析缓存命中次数失败: {e}")
+        return doc
+
+    def put(self, sha256: str, text: str, course_info: Dict, document: Optional[Dict] = None,
+            pdf_file: Optional[BinaryIO] = None):
+        """保存解析结果（course_info应为写入courses集合之前的副本）"""
+        now = datetime.utcnow()
+        record = {
+            'extractor_version': self.extractor_version,
+            'text': text,
+            'course_info': course_info,
+            'document': document or {},
+            'hits': 0,
+            'created_at': now,
+            'last_hit_at': None
+        }
+        if self.store_raw and pdf_file is not None:
+            record['gridfs_id'] = self._store_raw(sha256, pdf_file)
+
+        try:
+            self.collection.replace_one({'_id': sha256}, record, upsert=True)
+            with self._lock:
+                self._counters['writes'] += 1
+        except Exception as e:
+            logging.error(f"写入PDF解析缓存失败: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['misses']
+        counters.update({
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0,
+            'extractor_version': self.extractor_version
+        })
+        return counters
+
+    def _store_raw(self, sha256: str, pdf_file: BinaryIO):
+        """原始PDF按内容哈希存入GridFS，相同内容只保存一份"""
+        try:
+            if self._fs is None:
+                import gridfs
+                self._fs = gridfs.GridFS(self.db, collection='pdf_files')
+            existing = self._fs.find_one({'sha256': sha256})
+            if existing is not None:
+                return existing._id
+            pdf_file.seek(0)
+            return self._fs.put(pdf_file, filename=f'{sha256}.pdf', sha256=sha256, content_type='application/pdf')
+        except Exception as e:
+            logging.error(f"保存原始PDF到GridFS失败: {e}")
+            return None
@@ -0,0 +1,199 @@
+import codecs
+import csv
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from app.models.student import Student
+from app.services.grade_stats import normalize_course_code
+
+GRADE_FORMATS = ('csv', 'ndjson')
+GRADE_COLUMNS = ('student_id', 'course', 'score')  # 必需的列，semester与year可选
+DEFAULT_BATCH_SIZE = 1000
+
+# (行号, 行数据, 读取错误)
+GradeRow = Tuple[int, Optional[Dict], Optional[str]]
+
+
+def grade_format(filename: str, default: str = 'csv') -> str:
+    """根据文件扩展名判断格式：.ndjson/.jsonl为NDJSON，其他按default处理"""
+    extension = (filename or '').rsplit('.', 1)[-1].lower() if '.' in (filename or '') else ''
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if extension == 'csv':
+        return 'csv'
+    return default
+
+
+def read_grade_rows(stream, fmt: str) -> Iterator[GradeRow]:
+    """从二进制流逐行读取成绩（不读入整个文件），CSV表头缺少必需列时立即抛出ValueError"""
+    if fmt not in GRADE_FORMATS:
+        raise ValueError(f"不支持的格式: {fmt}（可选: {', '.join(GRADE_FORMATS)}）")
+
+    text = codecs.getreader('utf-8-sig')(stream)
+    if fmt == 'ndjson':
+        return _read_ndjson(text)
+
+    reader = csv.DictReader(text)
+    columns = [column.strip() for column in reader.fieldnames or []]
+    missing = [column for column in GRADE_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"CSV缺少列: {', '.join(missing)}")
+    reader.fieldnames = columns
+    return ((reader.line_num, row, None) for row in reader)
+
+
+def _read_ndjson(text) -> Iterator[GradeRow]:
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except ValueError as e:
+            yield line_number, None, f"JSON格式错误: {e}"
+
+
+def _text(value) -> str:
+    return '' if value is None else str(value).strip()
+
+
+def parse_score(raw_score):
+    """校验分数（数值或数字字符串，0到100之间）并转换为数值，不合法时抛出ValueError"""
+    if raw_score is None or isinstance(raw_score, bool) or _text(raw_score) == '':
+        raise ValueError('缺少分数')
+    try:
+        score = float(raw_score)
+    except (TypeError, ValueError):
+        raise ValueError(f"分数不是数字: {raw_score}")
+    if not 0 <= score <= 100:
+        raise ValueError(f"分数必须在0到100之间: {raw_score}")
+    return int(score) if score.is_integer() else score
+
+
+def parse_grade_row(row) -> Dict:
+    """校验一行成绩，返回 {student_id, course, score, semester, year}，不合法时抛出ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError('每行必须是JSON对象')
+
+    student_id = _text(row.get('student_id'))
+    if not student_id:
+        raise ValueError('缺少学号')
+    course = normalize_course_code(row.get('course'))
+    if not course:
+        raise ValueError('缺少课程代码')
+
+    return {
+        'student_id': student_id,
+        'course': course,
+        'score': parse_score(row.get('score')),
+        'semester': _text(row.get('semester')),
+        'year': _text(row.get('year'))
+    }
+
+
+class GradeImporter:
+    """批量导入成绩（教务处每学期导出的CSV/NDJSON文件）
+
+    逐行读取并校验，每batch_size行为一批：学号通过缓存的映射解析为学生_id（未缓存的学号每批一次$in查询），
+    按学生分组后由Student.bulk_add_grades写入，聚合更新与建议缓存失效每批只进行一次；
+    聚合未能更新（学生已被删除）的学生的行报告为失败。
+    import_rows()逐个产生NDJSON行：每个失败的行一行，最后一行为汇总。
+    """
+
+    def __init__(self, db, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.student_model = Student(db)
+        self.batch_size = batch_size
+        self._student_ids = {}  # 学号 -> 学生文档_id，None表示学号不存在
+
+    def import_file(self, stream, fmt: str) -> Iterator[Dict]:
+        """导入二进制流中的成绩文件（格式错误在调用时即抛出ValueError）"""
+        return self.import_rows(read_grade_rows(stream, fmt))
+
+    def import_rows(self, rows: Iterable[GradeRow]) -> Iterator[Dict]:
+        counts = {'total': 0, 'imported': 0, 'failed': 0}
+        students = set()
+        batch = []
+
+        for line, row, error in rows:
+            counts['total'] += 1
+            grade = None
+            if error is None:
+                try:
+                    grade = parse_grade_row(row)
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                counts['failed'] += 1
+                yield {'line': line, 'status': 'error', 'error': error}
+                continue
+
+            batch.append((line, grade))
+            if len(batch) >= self.batch_size:
+                yield from self._flush(batch, counts, students)
+                batch = []
+
+        if batch:
+            yield from self._flush(batch, counts, students)
+
+        yield {
+            'summary': {
+                'total': counts['total'],
+                'imported': counts['imported'],
+                'failed': counts['failed'],
+                'students': len(students)
+            }
+        }
+
+    def _flush(self, batch, counts: Dict, students: set) -> Iterator[Dict]:
+        """解析一批的学号并按学生分组写入，为学号不存在或写入失败的行产生结果行"""
+        self._resolve({grade['student_id'] for _, grade in batch})
+
+        now = datetime.utcnow()
+        grouped = {}
+        lines = []  # [(行号, 学生_id)]
+        for line, grade in batch:
+            object_id = self._student_ids.get(grade['student_id'])
+            if object_id is None:
+                counts['failed'] += 1
+                yield {'line': line, 'status': 'error', 'error': f"学号不存在: {grade['student_id']}"}
+                continue
+            grouped.setdefault(object_id, []).append({
+                'course': grade['course'],
+                'score': grade['score'],
+                'semester': grade['semester'],
+                'year': grade['year'],
+                'timestamp': now
+            })
+            lines.append((line, object_id))
+
+        if not grouped:
+            return
+        try:
+            written = set(self.student_model.bulk_add_grades(grouped))
+        except Exception as e:
+            logging.error(f"批量写入成绩失败: {e}")
+            for line, _ in lines:
+                counts['failed'] += 1
+                yield {'line': line, 'status': 'error', 'error': f"写入成绩失败: {e}"}
+            return
+
+        for line, object_id in lines:
+            if object_id in written:
+                counts['imported'] += 1
+            else:
+                # 解析学号之后学生被删除
+                counts['failed'] += 1
+                yield {'line': line, 'status': 'error', 'error': '学生不存在或已被删除'}
+        students.update(written)
+
+    def _resolve(self, codes: set):
+        """把未缓存的学号一次$in查询解析为学生_id"""
+        missing = [code for code in codes if code not in self._student_ids]
+        if not missing:
+            return
+        for code in missing:
+            self._student_ids[code] = None
+        for student in self.db.students.find({'student_id': {'$in': missing}}, {'student_id': 1}):
+            self._student_ids[student['student_id']] = student['_id']
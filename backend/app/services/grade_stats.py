@@ -0,0 +1,183 @@
+from typing import Dict, List, Optional, Tuple
+
+RECENT_WINDOW = 10  # grade_stats.recent 保留的最近成绩数量
+GRADE_STATS_VERSION = 3  # 聚合结构变化时递增，旧版本的聚合会根据成绩明细重新计算
+
+TREND_WINDOW = 3        # 趋势判断使用最近几门课程
+TREND_THRESHOLD = 5     # 最近平均分与总平均分相差超过该值视为进步/退步
+TRENDS = ('improving', 'stable', 'declining')
+
+# 与analyze_performance一致的建议分档：(平均分上限, 分档, 建议)
+RECOMMENDATION_BUCKETS = [
+    (70, 'needs_support', ['建议加强基础知识学习', '寻求老师或同学的帮助']),
+    (85, 'on_track', ['继续保持学习状态', '可以尝试更有挑战性的内容']),
+    (float('inf'), 'excellent', ['学习表现优秀，继续保持', '可以考虑帮助其他同学'])
+]
+
+
+def score_value(grade: Dict) -> float:
+    """成绩记录中的分数（字符串分数转换为数值）"""
+    score = grade.get('score', 0)
+    if isinstance(score, (int, float)):
+        return score
+    return float(score)
+
+
+def _field_key(value: str) -> str:
+    # MongoDB字段名不能包含'.'，也不能以'$'开头
+    return value.replace('.', '_').replace('$', '_')
+
+
+def normalize_course_code(course_code) -> str:
+    """课程代码的规范形式（去掉首尾空白并转为大写），写入成绩和按课程查询时使用"""
+    return '' if course_code is None else str(course_code).strip().upper()
+
+
+def prefix_key(course_code: str) -> Optional[str]:
+    """课程前缀在by_prefix中的键；不足两位的课程代码前缀为空，使用'_'代替（字段名不能为空）"""
+    course_code = normalize_course_code(course_code)
+    if not course_code:
+        return None
+    prefix = course_code[:2] if len(course_code) >= 2 else ''
+    return _field_key(prefix or '_')
+
+
+def course_key(course_code: str) -> Optional[str]:
+    """课程在by_course中的键"""
+    course_code = normalize_course_code(course_code)
+    if not course_code:
+        return None
+    return _field_key(course_code)
+
+
+def empty_grade_stats() -> Dict:
+    return {
+        'version': GRADE_STATS_VERSION,
+        'count': 0,
+        'sum': 0,
+        'sum_sq': 0,
+        'by_prefix': {},
+        'by_course': {},
+        'recent': []
+    }
+
+
+def compute_grade_stats(grades: List[Dict]) -> Dict:
+    """根据完整成绩列表计算聚合（创建学生、整体替换成绩或回填旧数据时使用）"""
+    stats = empty_grade_stats()
+    for grade in grades:
+        score = score_value(grade)
+        stats['count'] += 1
+        stats['sum'] += score
+        stats['sum_sq'] += score * score
+
+        for field, key in (('by_prefix', prefix_key(grade.get('course', ''))),
+                           ('by_course', course_key(grade.get('course', '')))):
+            if key is not None:
+                bucket = stats[field].setdefault(key, {'count': 0, 'sum': 0})
+                bucket['count'] += 1
+                bucket['sum'] += score
+
+    stats['recent'] = [score_value(grade) for grade in grades[-RECENT_WINDOW:]]
+    return stats
+
+
+def grade_stats_update(grade: Dict) -> Dict:
+    """追加一条成绩时对grade_stats的原子更新（$inc计数与求和，$push+$slice维护最近窗口）"""
+    return grades_stats_update([grade])
+
+
+def grades_stats_update(grades: List[Dict]) -> Dict:
+    """一次追加多条成绩时对grade_stats的原子更新，各项增量先在本地合并"""
+    inc = {
+        'grade_stats.count': 0,
+        'grade_stats.sum': 0,
+        'grade_stats.sum_sq': 0
+    }
+    scores = []
+    for grade in grades:
+        score = score_value(grade)
+        scores.append(score)
+        inc['grade_stats.count'] += 1
+        inc['grade_stats.sum'] += score
+        inc['grade_stats.sum_sq'] += score * score
+        for field, key in (('by_prefix', prefix_key(grade.get('course', ''))),
+                           ('by_course', course_key(grade.get('course', '')))):
+            if key is not None:
+                inc[f'grade_stats.{field}.{key}.count'] = inc.get(f'grade_stats.{field}.{key}.count', 0) + 1
+                inc[f'grade_stats.{field}.{key}.sum'] = inc.get(f'grade_stats.{field}.{key}.sum', 0) + score
+
+    return {
+        '$inc': inc,
+        '$push': {'grade_stats.recent': {'$each': scores[-RECENT_WINDOW:], '$slice': -RECENT_WINDOW}}
+    }
+
+
+def get_grade_stats(student_data: Dict) -> Dict:
+    """学生文档中的成绩聚合；旧文档没有聚合时根据grades现算"""
+    stats = student_data.get('grade_stats')
+    if stats is not None and stats.get('version') == GRADE_STATS_VERSION:
+        return stats
+    return compute_grade_stats(student_data.get('grades', []))
+
+
+def average_score(stats: Dict) -> Optional[float]:
+    if not stats.get('count'):
+        return None
+    return stats['sum'] / stats['count']
+
+
+def related_average(stats: Dict, course_code: str) -> Optional[float]:
+    """与课程同前缀的历史课程平均分"""
+    key = prefix_key(course_code)
+    bucket = stats.get('by_prefix', {}).get(key) if key is not None else None
+    if not bucket or not bucket.get('count'):
+        return None
+    return bucket['sum'] / bucket['count']
+
+
+def weighted_course_average(stats: Dict, weights: List[Tuple[str, float]]) -> Optional[float]:
+    """按课程权重加权的平均分：sum(w * 课程总分) / sum(w * 课程成绩数)，只统计学生修过的课程"""
+    by_course = stats.get('by_course', {})
+    total = 0.0
+    count = 0.0
+    for course_code, weight in weights:
+        bucket = by_course.get(course_key(course_code))
+        if bucket and bucket.get('count') and weight > 0:
+            total += weight * bucket['sum']
+            count += weight * bucket['count']
+    if count == 0:
+        return None
+    return total / count
+
+
+def recent_average(stats: Dict, n: int = 3) -> Optional[float]:
+    recent = stats.get('recent', [])[-n:]
+    if not recent:
+        return None
+    return sum(recent) / len(recent)
+
+
+def score_std(stats: Dict) -> Optional[float]:
+    """成绩的总体标准差"""
+    count = stats.get('count')
+    if not count:
+        return None
+    mean = stats['sum'] / count
+    return max(stats['sum_sq'] / count - mean * mean, 0.0) ** 0.5
+
+
+def classify_trend(recent_avg: float, average_score: float) -> str:
+    if recent_avg > average_score + TREND_THRESHOLD:
+        return 'improving'
+    elif recent_avg < average_score - TREND_THRESHOLD:
+        return 'declining'
+    return 'stable'
+
+
+def recommendations_for(average_score: float) -> List[str]:
+    """单个学生的建议（analyze_performance使用）"""
+    for upper, _, recommendations in RECOMMENDATION_BUCKETS:
+        if average_score < upper:
+            return list(recommendations)
+    return list(RECOMMENDATION_BUCKETS[-1][2])
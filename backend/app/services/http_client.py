@@ -0,0 +1,100 @@
+import os
+import threading
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ProviderHTTPClient:
+    """模型提供方共享HTTP客户端：按主机复用keep-alive连接池
+
+    Session在首次使用时按进程创建，gunicorn fork出的worker会重新建立自己的连接池，
+    不会与父进程共享socket。
+    """
+
+    def __init__(self, pool_size: Optional[int] = None, connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None, max_hosts: int = 10):
+        self.pool_size = pool_size or int(os.getenv('LLM_HTTP_POOL_SIZE', os.getenv('LLM_DISPATCH_WORKERS', 16)))
+        self.connect_timeout = connect_timeout or float(os.getenv('LLM_CONNECT_TIMEOUT', 3.05))
+        self.read_timeout = read_timeout or float(os.getenv('LLM_READ_TIMEOUT', 30.0))
+        self.max_hosts = max_hosts
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._adapter = None
+        self._pid = None
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                self._adapter = HTTPAdapter(pool_connections=self.max_hosts, pool_maxsize=self.pool_size)
+                session = requests.Session()
+                session.mount('https://', self._adapter)
+                session.mount('http://', self._adapter)
+                self._session = session
+                self._pid = os.getpid()
+            return self._session
+
+    def post(self, url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """发送POST请求，timeout为本次调用剩余的总时间，分别约束连接和读取超时"""
+        return self.session.post(url, timeout=self._timeouts(timeout), **kwargs)
+
+    def reset(self):
+        """丢弃当前Session（fork后在子进程中调用，锁可能被父进程的其他线程持有，因此重建）"""
+        self._lock = threading.Lock()
+        self._session = None
+        self._adapter = None
+        self._pid = None
+
+    def stats(self) -> List[Dict]:
+        """每个主机连接池的建连数与复用次数"""
+        with self._lock:
+            adapter = self._adapter if self._pid == os.getpid() else None
+        if adapter is None:
+            return []
+
+        pools = adapter.poolmanager.pools
+        stats = []
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats.append({
+                'host': f"{pool.scheme}://{pool.host}:{pool.port}",
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+                'reused': max(pool.num_requests - pool.num_connections, 0),
+                'pool_size': self.pool_size
+            })
+        return stats
+
+    def _timeouts(self, timeout: Optional[float]):
+        if timeout is None:
+            return (self.connect_timeout, self.read_timeout)
+        return (min(self.connect_timeout, timeout), min(self.read_timeout, timeout))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_provider_http_client() -> ProviderHTTPClient:
+    """进程内共享的模型提供方HTTP客户端"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ProviderHTTPClient()
+        return _client
+
+
+def _reset_after_fork():
+    global _client_lock
+    _client_lock = threading.Lock()
+    if _client is not None:
+        _client.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,216 @@
+import os
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.services.llm_dispatch import get_shared_executor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def expire_dedupe(db, query: Dict) -> int:
+    """数据变更后让匹配query的任务不再参与去重：已完成的结果不再复用，执行中的任务完成后也不复用，返回受影响的任务数"""
+    result = db.jobs.update_many(
+        dict(query, dedupe_key={'$exists': True}),
+        {'$unset': {'dedupe_key': '', 'active_key': ''}}
+    )
+    return result.modified_count
+
+
+def expire_advice_jobs(db, student_ids: Iterable[str] = (), course_id: Optional[str] = None) -> int:
+    """学生或课程数据变更后解除相关建议任务的去重（供模型层调用），任务载荷中记录了student_id和course_id"""
+    conditions = []
+    student_ids = [str(student_id) for student_id in student_ids]
+    if student_ids:
+        conditions.append({'payload.student_id': {'$in': student_ids}})
+    if course_id is not None:
+        conditions.append({'payload.course_id': str(course_id)})
+    if not conditions or db is None:
+        return 0
+    try:
+        return expire_dedupe(db, {'kind': 'advice', '$or': conditions})
+    except Exception as e:
+        logging.error(f"解除建议任务去重失败: {e}")
+        return 0
+
+
+class JobQueue:
+    """基于MongoDB jobs集合的异步任务队列，任务在进程内有界线程池中执行
+
+    - 去重：排队/执行中的任务以active_key唯一索引去重，dedupe_window秒内完成的同键任务直接复用；
+      任务依赖的数据变更时由expire_dedupe()解除去重
+    - 并发：每个进程最多同时执行max_concurrency个任务
+    - 恢复：状态为running但超过stale_after秒未完成的任务（通常是进程重启导致）重新排队；
+      每次执行以run_id认领任务，任务被重新认领后原来的执行不再写入结果
+    """
+
+    def __init__(self, db, handler: Callable[[Dict], Dict], name: str = 'jobs', max_concurrency: int = 4,
+                 stale_after: int = 300, dedupe_window: int = 300, max_attempts: int = 3):
+        self.collection = db.jobs
+        self.handler = handler
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.stale_after = stale_after
+        self.dedupe_window = dedupe_window
+        self.max_attempts = max_attempts
+
+        self._executor = get_shared_executor(f'{name}-worker', max_concurrency)
+        self._lock = threading.Lock()
+        self._running = 0
+
+        self.collection.create_index('active_key', unique=True, sparse=True)
+        self.collection.create_index([('dedupe_key', 1), ('finished_at', -1)])
+        self.collection.create_index([('status', 1), ('updated_at', 1)])
+
+    def submit(self, kind: str, payload: Dict, dedupe_key: Optional[str] = None) -> Dict:
+        """提交任务，返回 {'job_id', 'status', 'deduplicated'}"""
+        if dedupe_key:
+            recent = self.collection.find_one(
+                {
+                    'dedupe_key': dedupe_key,
+                    'status': DONE,
+                    'finished_at': {'$gte': datetime.utcnow() - timedelta(seconds=self.dedupe_window)}
+                },
+                sort=[('finished_at', -1)]
+            )
+            if recent:
+                return {'job_id': str(recent['_id']), 'status': DONE, 'deduplicated': True}
+
+        now = datetime.utcnow()
+        job = {
+            'kind': kind,
+            'payload': payload,
+            'status': QUEUED,
+            'attempts': 0,
+            'created_at': now,
+            'updated_at': now
+        }
+        if dedupe_key:
+            job['dedupe_key'] = dedupe_key
+            job['active_key'] = dedupe_key
+
+        try:
+            job_id = self.collection.insert_one(job).inserted_id
+        except DuplicateKeyError:
+            existing = self.collection.find_one({'active_key': dedupe_key})
+            if existing:
+                return {'job_id': str(existing['_id']), 'status': existing['status'], 'deduplicated': True}
+            # 已有任务恰好在此期间完成，重新提交
+            return self.submit(kind, payload, dedupe_key)
+
+        self._schedule(job_id)
+        return {'job_id': str(job_id), 'status': QUEUED, 'deduplicated': False}
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """查询任务状态和结果"""
+        try:
+            job = self.collection.find_one({'_id': ObjectId(job_id)}, {'active_key': 0})
+        except:
+            return None
+        if not job:
+            return None
+
+        job['job_id'] = str(job.pop('_id'))
+        for field in ('created_at', 'updated_at', 'started_at', 'finished_at'):
+            if job.get(field):
+                job[field] = job[field].isoformat()
+        return job
+
+    def recover_stale(self) -> int:
+        """将超时未完成的running任务以及长时间无人处理的queued任务重新排队"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        recovered = 0
+        for job in self.collection.find(
+            {'status': {'$in': [QUEUED, RUNNING]}, 'updated_at': {'$lt': cutoff}},
+            {'status': 1, 'attempts': 1, 'run_id': 1}
+        ):
+            if job.get('attempts', 0) >= self.max_attempts:
+                self._finish(job['_id'], job.get('run_id'), FAILED, error='任务多次中断，已放弃')
+                continue
+
+            result = self.collection.update_one(
+                {'_id': job['_id'], 'status': job['status'], 'updated_at': {'$lt': cutoff}},
+                {'$set': {'status': QUEUED, 'run_id': None, 'updated_at': datetime.utcnow()}}
+            )
+            if result.modified_count:
+                recovered += 1
+                self._schedule(job['_id'])
+
+        if recovered:
+            logging.warning(f"{self.name}: 恢复了{recovered}个中断的任务")
+        return recovered
+
+    def stats(self) -> Dict:
+        with self._lock:
+            running = self._running
+        return {
+            'running_in_process': running,
+            'max_concurrency': self.max_concurrency,
+            'queued': self.collection.count_documents({'status': QUEUED}),
+            'running': self.collection.count_documents({'status': RUNNING})
+        }
+
+    def _schedule(self, job_id):
+        self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        # 原子地认领任务，避免多个进程重复执行
+        run_id = ObjectId()
+        job = self.collection.find_one_and_update(
+            {'_id': job_id, 'status': QUEUED},
+            {
+                '$set': {
+                    'status': RUNNING,
+                    'run_id': run_id,
+                    'started_at': datetime.utcnow(),
+                    'updated_at': datetime.utcnow(),
+                    'worker': f'{socket.gethostname()}:{os.getpid()}'
+                },
+                '$inc': {'attempts': 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            return
+
+        with self._lock:
+            self._running += 1
+        try:
+            result = self.handler(job['payload'])
+            finished = self._finish(job_id, run_id, DONE, result=result)
+        except Exception as e:
+            logging.error(f"{self.name}: 任务{job_id}执行失败: {e}")
+            finished = self._finish(job_id, run_id, FAILED, error=str(e))
+        finally:
+            with self._lock:
+                self._running -= 1
+        if not finished:
+            logging.warning(f"{self.name}: 任务{job_id}已被重新认领，丢弃本次执行的结果")
+
+    def _finish(self, job_id, run_id: Optional[ObjectId], status: str, result: Optional[Dict] = None,
+                error: Optional[str] = None) -> bool:
+        """写入任务结果；任务已被其他执行重新认领（run_id不匹配）时不写入，返回是否写入"""
+        now = datetime.utcnow()
+        updated = self.collection.update_one(
+            {'_id': job_id, 'run_id': run_id},
+            {
+                '$set': {
+                    'status': status,
+                    'result': result,
+                    'error': error,
+                    'finished_at': now,
+                    'updated_at': now
+                },
+                '$unset': {'active_key': ''}
+            }
+        )
+        return updated.matched_count > 0
@@ -0,0 +1,93 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List, Optional, Tuple
+
+_executors = {}  # 名称 -> (进程号, 线程池)
+_executor_lock = threading.Lock()
+
+
+def get_shared_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """按名称获取进程内共享的线程池（fork后的子进程会重新创建）"""
+    with _executor_lock:
+        pid, executor = _executors.get(name, (None, None))
+        if executor is None or pid != os.getpid():
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+            _executors[name] = (os.getpid(), executor)
+        return executor
+
+
+def get_dispatch_executor() -> ThreadPoolExecutor:
+    """获取模型调用线程池"""
+    return get_shared_executor('llm-dispatch', int(os.getenv('LLM_DISPATCH_WORKERS', 16)))
+
+
+class HedgedDispatcher:
+    """对冲式模型调用
+
+    先调用首选提供方；若hedge_delay秒内没有得到结果（或已失败），
+    则启动下一个提供方，返回最先成功的结果。整个调用受deadline约束，
+    结束时取消尚未开始的调用，仍在执行的调用结果将被丢弃。
+    """
+
+    def __init__(self, executor: Optional[ThreadPoolExecutor] = None, hedge_delay: float = 3.0,
+                 deadline: float = 25.0):
+        self._executor = executor
+        self.hedge_delay = hedge_delay
+        self.deadline = deadline
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        return self._executor or get_dispatch_executor()
+
+    def dispatch(self, calls: List[Tuple[str, Callable[..., Optional[str]]]]) -> Tuple[Optional[str], Optional[str]]:
+        """执行对冲调用，返回(结果, 提供方名称)，全部失败或超时返回(None, None)
+
+        calls中的每个函数接收timeout关键字参数（剩余的秒数）。
+        """
+        remaining = list(calls)
+        pending = {}
+        deadline = time.monotonic() + self.deadline
+
+        def launch_next():
+            name, call = remaining.pop(0)
+            timeout = max(deadline - time.monotonic(), 0.1)
+            pending[self.executor.submit(call, timeout=timeout)] = name
+
+        try:
+            if remaining:
+                launch_next()
+
+            while pending or remaining:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    logging.error("模型调用超过总时限，放弃等待")
+                    break
+
+                if not pending:
+                    launch_next()
+                    continue
+
+                wait_time = min(self.hedge_delay, left) if remaining else left
+                done, _ = wait(list(pending), timeout=wait_time, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logging.error(f"{name} 调用失败: {e}")
+                        result = None
+                    if result:
+                        return result, name
+
+                # 超过对冲延迟或已有调用失败：启动下一个提供方
+                if remaining:
+                    launch_next()
+
+            return None, None
+        finally:
+            for future in pending:
+                future.cancel()
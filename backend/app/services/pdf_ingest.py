@@ -0,0 +1,185 @@
+import logging
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.models.course import Course
+from app.services.pdf_service import PDFService, file_sha256, get_extract_executor, parse_pdf_path
+
+# 一次导入的课程数超过该值时，课程相关度索引与相似度矩阵在最后全量重建，而不是逐门增量更新
+REBUILD_THRESHOLD = 20
+
+
+class PDFIngestor:
+    """批量导入课程PDF
+
+    文件先按内容哈希查询解析缓存，未命中的文件交给进程池并行解析（每个文件由一个进程完成提取与解析）；
+    解析完成的课程每batch_size门通过一次bulk_write按course_code写入courses集合。
+    ingest()逐个产生NDJSON行：每个文件解析完成时一行进度（status为parsed），写入完成或出错时一行结果，最后一行为汇总。
+    """
+
+    def __init__(self, db, pdf_service: PDFService, extraction_cache=None, retrieval_index=None,
+                 course_relations=None, course_similarity=None, workers: Optional[int] = None, batch_size: int = 50):
+        self.db = db
+        self.pdf_service = pdf_service
+        self.extraction_cache = extraction_cache
+        self.retrieval_index = retrieval_index
+        self.course_relations = course_relations
+        self.course_similarity = course_similarity
+        self.workers = workers if workers is not None else pdf_service.extract_workers
+        self.batch_size = batch_size
+
+    def ingest(self, files: List[Tuple[str, str]]) -> Iterator[Dict]:
+        """导入文件列表 [(显示的文件名, 本地路径)]"""
+        counts = {'succeeded': 0, 'failed': 0, 'cached': 0}
+        pending = []   # [(序号, 文件名, 内容哈希, 解析结果)]
+        touched = {}   # course_code -> (course_info, course_id)
+
+        for index, filename, sha256, parsed, error in self._parse_all(files):
+            if error is not None:
+                counts['failed'] += 1
+                yield {'index': index, 'filename': filename, 'status': 'error', 'error': error}
+                continue
+            if not parsed['course_info'].get('course_code'):
+                counts['failed'] += 1
+                yield {'index': index, 'filename': filename, 'status': 'error', 'error': '未识别到课程代码'}
+                continue
+
+            pending.append((index, filename, sha256, parsed))
+            yield {
+                'index': index,
+                'filename': filename,
+                'status': 'parsed',
+                'course_code': parsed['course_info']['course_code'],
+                'cached': parsed.get('cached', False)
+            }
+            if len(pending) >= self.batch_size:
+                yield from self._flush(pending, counts, touched)
+                pending = []
+
+        if pending:
+            yield from self._flush(pending, counts, touched)
+
+        self._update_course_indexes(touched)
+        yield {
+            'summary': {
+                'total': len(files),
+                'succeeded': counts['succeeded'],
+                'failed': counts['failed'],
+                'cached': counts['cached'],
+                'courses': len(touched)
+            }
+        }
+
+    def _parse_all(self, files: List[Tuple[str, str]]) -> Iterator[Tuple]:
+        """按完成顺序产生 (序号, 文件名, 内容哈希, 解析结果, 错误)"""
+        futures = {}
+        executor = get_extract_executor(self.workers) if self.workers > 1 else None
+
+        for index, (filename, path) in enumerate(files):
+            try:
+                sha256 = file_sha256(path)
+            except OSError as e:
+                yield index, filename, None, None, str(e)
+                continue
+
+            cached = self.extraction_cache.get(sha256) if self.extraction_cache is not None else None
+            if cached is not None:
+                parsed = {key: cached[key] for key in ('text', 'course_info', 'document')}
+                parsed['cached'] = True
+                yield index, filename, sha256, parsed, None
+            elif executor is not None:
+                futures[executor.submit(parse_pdf_path, path, self.pdf_service.max_file_size)] = (index, filename, sha256, path)
+            else:
+                yield self._parse_one(index, filename, sha256, path,
+                                      partial(parse_pdf_path, path, self.pdf_service.max_file_size))
+
+        for future in as_completed(futures):
+            index, filename, sha256, path = futures[future]
+            parse = future.result
+            if isinstance(future.exception(), BrokenProcessPool):
+                # 进程池异常退出时改为在当前进程中解析
+                parse = partial(parse_pdf_path, path, self.pdf_service.max_file_size)
+            yield self._parse_one(index, filename, sha256, path, parse)
+
+    def _parse_one(self, index: int, filename: str, sha256: str, path: str, parse) -> Tuple:
+        try:
+            parsed = parse()
+        except Exception as e:
+            return index, filename, sha256, None, str(e)
+
+        if self.extraction_cache is not None:
+            with open(path, 'rb') as pdf_file:
+                self.extraction_cache.put(sha256, parsed['text'], dict(parsed['course_info']),
+                                          document=parsed['document'], pdf_file=pdf_file)
+        return index, filename, sha256, parsed, None
+
+    def _flush(self, pending: List[Tuple], counts: Dict, touched: Dict) -> Iterator[Dict]:
+        """一次bulk_write写入一批课程，并为每个文件产生结果行"""
+        course_infos = []
+        for _, _, sha256, parsed in pending:
+            course_info = dict(parsed['course_info'])
+            course_info['source_sha256'] = sha256
+            course_infos.append(course_info)
+
+        try:
+            course_ids = Course(self.db).bulk_upsert(course_infos)
+        except Exception as e:
+            logging.error(f"批量写入课程失败: {e}")
+            for index, filename, _, _ in pending:
+                counts['failed'] += 1
+                yield {'index': index, 'filename': filename, 'status': 'error', 'error': f"写入课程失败: {e}"}
+            return
+
+        for (index, filename, _, parsed), course_info in zip(pending, course_infos):
+            course_code = course_info['course_code']
+            course_id = course_ids.get(course_code)
+            touched[course_code] = (course_info, course_id)
+            if self.retrieval_index is not None:
+                try:
+                    self.retrieval_index.add_document(course_code, parsed['text'], course_id=course_id)
+                except Exception as e:
+                    logging.error(f"更新检索索引失败: {e}")
+
+            counts['succeeded'] += 1
+            cached = parsed.get('cached', False)
+            if cached:
+                counts['cached'] += 1
+            yield {
+                'index': index,
+                'filename': filename,
+                'status': 'ok',
+                'course_id': course_id,
+                'course_code': course_code,
+                'course_name': course_info.get('course_name', ''),
+                'cached': cached
+            }
+
+    def _update_course_indexes(self, touched: Dict):
+        """更新课程相关度索引与相似度矩阵：课程较少时逐门增量更新，较多时全量重建一次"""
+        if not touched:
+            return
+        rebuild = len(touched) > REBUILD_THRESHOLD
+
+        if self.course_relations is not None:
+            try:
+                if rebuild:
+                    self.course_relations.rebuild()
+                else:
+                    for course_info, _ in touched.values():
+                        self.course_relations.update_course(course_info)
+            except Exception as e:
+                logging.error(f"更新课程相关度索引失败: {e}")
+
+        if self.course_similarity is not None:
+            try:
+                if rebuild:
+                    self.course_similarity.rebuild(list(self.db.courses.find({}, {
+                        'course_code': 1, 'course_name': 1, 'description': 1, 'objectives': 1, 'topics': 1
+                    })))
+                else:
+                    for course_info, course_id in touched.values():
+                        self.course_similarity.update_course(course_info, course_id=course_id)
+            except Exception as e:
+                logging.error(f"更新课程相似度矩阵失败: {e}")
@@ -0,0 +1,458 @@
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.models.course import Course
+from app.services.llm_dispatch import get_shared_executor
+from app.services.pdf_service import content_sha256
+
+STAGES = ('spool', 'extract', 'parse', 'persist', 'index')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# 单个阶段的状态
+PENDING = 'pending'
+SKIPPED = 'skipped'
+
+
+class IngestionQueueFull(Exception):
+    """进程内等待处理的PDF已达上限"""
+
+
+class IngestionRejected(ValueError):
+    """文件内容无法导入（PDF格式无效、未识别到课程代码），重试不会成功"""
+
+
+class IngestionPipeline:
+    """后台PDF导入流水线：spool → extract → parse → persist → index
+
+    spool在请求线程中完成（读取上传内容、检查文件头与大小并写入PDF_INGEST_DIR），其余阶段在进程内有界线程池中执行，
+    大文件的文本提取仍由PDFService交给进程池。每次导入在pdf_ingestions集合中一条记录，保存各阶段的状态与耗时；
+    某个阶段失败时保留已上传的文件与之前阶段的结果（提取的文本写在文件旁），retry()从失败的阶段继续，不需要重新上传；
+    文件内容本身无法导入（IngestionRejected）时立即删除文件，失败超过failed_ttl秒仍未重试的导入由cleanup()删除文件。
+    进程内排队与执行中的导入数达到max_pending时submit()抛出IngestionQueueFull。
+
+    每次执行以run_id认领导入，执行期间每heartbeat_interval秒刷新updated_at；超过stale_after秒未刷新的导入视为中断，
+    可以重试。被重新认领后，原来的执行写入状态时不再匹配run_id，在下一个阶段前停止。
+
+    services为按名称获取服务的函数（应用中为ServiceRegistry.get），检索索引等服务在index阶段才获取。
+    """
+
+    def __init__(self, db, services: Callable[[str], Any], directory: str, workers: int = 2,
+                 max_pending: int = 32, stale_after: int = 600, heartbeat_interval: Optional[float] = None,
+                 failed_ttl: int = 7 * 24 * 3600, cleanup_interval: int = 3600):
+        self.db = db
+        self.collection = db.pdf_ingestions
+        self.services = services
+        self.directory = directory
+        self.workers = workers
+        self.max_pending = max_pending
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval if heartbeat_interval is not None else stale_after / 4
+        self.failed_ttl = failed_ttl
+        self.cleanup_interval = cleanup_interval
+
+        self._executor = get_shared_executor('pdf-ingest', workers)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_cleanup = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.collection.create_index([('status', 1), ('updated_at', 1)])
+
+    def is_full(self) -> bool:
+        with self._lock:
+            return self._pending >= self.max_pending
+
+    def submit(self, filename: str, stream: BinaryIO) -> Dict:
+        """保存上传的PDF并排队处理，返回 {'ingestion_id', 'status'}"""
+        self._reserve()
+        ingestion_id = ObjectId()
+        try:
+            started = time.perf_counter()
+            pdf_service = self.services('pdf_service')
+            pdf_file = pdf_service.spool_upload(stream)
+            sha256 = content_sha256(pdf_file)
+            with open(self._path(ingestion_id, 'pdf'), 'wb') as f:
+                shutil.copyfileobj(pdf_file, f)
+                size = f.tell()
+
+            now = datetime.utcnow()
+            stages = {stage: {'status': PENDING} for stage in STAGES}
+            stages['spool'] = {'status': DONE, 'duration_ms': _elapsed_ms(started)}
+            self.collection.insert_one({
+                '_id': ingestion_id,
+                'filename': filename,
+                'sha256': sha256,
+                'size': size,
+                'status': QUEUED,
+                'stage': 'extract',
+                'stages': stages,
+                'attempts': 0,
+                'created_at': now,
+                'updated_at': now
+            })
+        except Exception:
+            self._release()
+            self._remove_files(ingestion_id)
+            raise
+
+        self._executor.submit(self._run, ingestion_id)
+        self._schedule_cleanup()
+        return {'ingestion_id': str(ingestion_id), 'status': QUEUED}
+
+    def retry(self, ingestion_id: str) -> Optional[Dict]:
+        """从失败（或中断超过stale_after秒）的阶段重新执行，记录不存在时返回None"""
+        record = self._find(ingestion_id)
+        if record is None:
+            return None
+        if record['status'] == DONE:
+            raise ValueError('导入已完成')
+        stale = record['updated_at'] < datetime.utcnow() - timedelta(seconds=self.stale_after)
+        if record['status'] != FAILED and not stale:
+            raise ValueError('导入仍在进行中')
+        if record.get('retryable') is False:
+            raise ValueError('文件内容无法导入，请修正后重新上传')
+        if not os.path.exists(self._path(record['_id'], 'pdf')):
+            raise ValueError('上传的文件已不存在，请重新上传')
+
+        self._reserve()
+        result = self.collection.update_one(
+            {'_id': record['_id'], 'status': record['status'], 'updated_at': record['updated_at']},
+            {'$set': {'status': QUEUED, 'error': None, 'run_id': None, 'updated_at': datetime.utcnow()}}
+        )
+        if not result.modified_count:
+            self._release()
+            raise ValueError('导入状态已变化，请刷新后重试')
+
+        self._executor.submit(self._run, record['_id'])
+        return {'ingestion_id': str(record['_id']), 'status': QUEUED, 'stage': record['stage']}
+
+    def get(self, ingestion_id: str) -> Optional[Dict]:
+        """查询导入进度与各阶段耗时"""
+        record = self._find(ingestion_id)
+        if record is None:
+            return None
+
+        stages = []
+        for stage in STAGES:
+            info = dict(record['stages'].get(stage, {}))
+            info['name'] = stage
+            stages.append(info)
+        progress = {
+            'ingestion_id': str(record['_id']),
+            'filename': record['filename'],
+            'status': record['status'],
+            'stage': record['stage'],
+            'stages': stages,
+            'total_ms': round(sum(stage.get('duration_ms', 0) for stage in stages), 1),
+            'attempts': record['attempts'],
+            'error': record.get('error'),
+            'retryable': record.get('retryable', True) and not record.get('files_removed', False),
+            'result': record.get('result')
+        }
+        for field in ('created_at', 'updated_at', 'finished_at'):
+            if record.get(field):
+                progress[field] = record[field].isoformat()
+        return progress
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = self._pending
+        return {
+            'pending_in_process': pending,
+            'max_pending': self.max_pending,
+            'workers': self.workers,
+            'queued': self.collection.count_documents({'status': QUEUED}),
+            'running': self.collection.count_documents({'status': RUNNING}),
+            'failed': self.collection.count_documents({'status': FAILED})
+        }
+
+    def cleanup(self) -> int:
+        """删除失败超过failed_ttl秒的导入保留的文件，以及没有导入记录的残留文件，返回清理的导入数"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.failed_ttl)
+        removed = 0
+        expired = self.collection.find(
+            {'status': FAILED, 'updated_at': {'$lt': cutoff}, 'files_removed': {'$ne': True}},
+            {'updated_at': 1}
+        )
+        for record in list(expired):
+            # 以状态与updated_at未变为条件，避免删除同时被重试的导入的文件
+            result = self.collection.update_one(
+                {'_id': record['_id'], 'status': FAILED, 'updated_at': record['updated_at']},
+                {'$set': {'files_removed': True}}
+            )
+            if result.modified_count:
+                self._remove_files(record['_id'])
+                removed += 1
+
+        # 写入文件后、插入记录前进程退出时留下的文件
+        orphans = {}
+        for name in os.listdir(self.directory):
+            stem = name.rsplit('.', 1)[0]
+            path = os.path.join(self.directory, name)
+            if ObjectId.is_valid(stem) and datetime.utcfromtimestamp(os.path.getmtime(path)) < cutoff:
+                orphans.setdefault(ObjectId(stem), []).append(path)
+        if orphans:
+            for record in self.collection.find({'_id': {'$in': list(orphans)}}, {'_id': 1}):
+                orphans.pop(record['_id'])
+            for paths in orphans.values():
+                for path in paths:
+                    os.unlink(path)
+            removed += len(orphans)
+        return removed
+
+    def _schedule_cleanup(self):
+        """距上次清理超过cleanup_interval秒时在后台清理一次"""
+        now = time.monotonic()
+        with self._lock:
+            if self._last_cleanup is not None and now - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = now
+        self._executor.submit(self._cleanup_safely)
+
+    def _cleanup_safely(self):
+        try:
+            self.cleanup()
+        except Exception as e:
+            logging.error(f"清理失败的PDF导入文件失败: {e}")
+
+    def _reserve(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise IngestionQueueFull('PDF导入队列已满，请稍后重试')
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, ingestion_id: ObjectId):
+        try:
+            # 原子地认领，避免重复执行
+            run_id = ObjectId()
+            record = self.collection.find_one_and_update(
+                {'_id': ingestion_id, 'status': QUEUED},
+                {
+                    '$set': {
+                        'status': RUNNING,
+                        'run_id': run_id,
+                        'updated_at': datetime.utcnow(),
+                        'worker': f'{socket.gethostname()}:{os.getpid()}'
+                    },
+                    '$inc': {'attempts': 1}
+                },
+                return_document=ReturnDocument.AFTER
+            )
+            if record is not None:
+                with self._heartbeat(ingestion_id, run_id):
+                    self._run_stages(record, run_id)
+        finally:
+            self._release()
+
+    @contextmanager
+    def _heartbeat(self, ingestion_id: ObjectId, run_id: ObjectId):
+        """执行期间定期刷新updated_at，长时间的阶段不会被当作中断而重复执行"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.heartbeat_interval):
+                try:
+                    if not self._update(ingestion_id, {}, run_id):
+                        return
+                except Exception as e:
+                    logging.error(f"刷新PDF导入{ingestion_id}的心跳失败: {e}")
+
+        thread = threading.Thread(target=beat, name=f'pdf-ingest-heartbeat-{ingestion_id}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _run_stages(self, record: Dict, run_id: ObjectId):
+        ingestion_id = record['_id']
+        context = self._load_context(record)
+        for stage in STAGES:
+            if record['stages'][stage]['status'] in (DONE, SKIPPED):
+                continue
+
+            if not self._update(ingestion_id, {'stage': stage, f'stages.{stage}': {'status': RUNNING}}, run_id):
+                logging.warning(f"PDF导入{ingestion_id}已被重新认领，停止本次执行")
+                return
+            started = time.perf_counter()
+            try:
+                updates = getattr(self, f'_{stage}')(ingestion_id, context) or {}
+            except Exception as e:
+                logging.error(f"PDF导入{ingestion_id}在{stage}阶段失败: {e}")
+                updates = {
+                    'status': FAILED,
+                    'error': str(e),
+                    f'stages.{stage}': {'status': FAILED, 'duration_ms': _elapsed_ms(started), 'error': str(e)}
+                }
+                if isinstance(e, IngestionRejected):
+                    # 重试不会成功，不保留上传的文件
+                    updates['retryable'] = False
+                if self._update(ingestion_id, updates, run_id) and isinstance(e, IngestionRejected):
+                    self._remove_files(ingestion_id)
+                return
+
+            updates[f'stages.{stage}'] = {'status': DONE, 'duration_ms': _elapsed_ms(started)}
+            if not self._update(ingestion_id, updates, run_id):
+                logging.warning(f"PDF导入{ingestion_id}已被重新认领，停止本次执行")
+                return
+            record['stages'][stage] = {'status': DONE}
+            if context.get('cached') and stage == 'extract':
+                # 缓存命中时文本与课程信息都已得到，跳过解析阶段
+                record['stages']['parse'] = {'status': SKIPPED}
+                self._update(ingestion_id, {'stages.parse': {'status': SKIPPED, 'duration_ms': 0}}, run_id)
+
+        if self._update(ingestion_id, {'status': DONE, 'stage': None, 'finished_at': datetime.utcnow()}, run_id):
+            self._remove_files(ingestion_id)
+
+    def _load_context(self, record: Dict) -> Dict:
+        """重试时恢复之前阶段的结果"""
+        context = {
+            'sha256': record['sha256'],
+            'course_info': record.get('course_info'),
+            'document': record.get('document'),
+            'course_id': (record.get('result') or {}).get('course_id'),
+            'cached': (record.get('result') or {}).get('cached', False),
+            'text': None
+        }
+        text_path = self._path(record['_id'], 'txt')
+        if os.path.exists(text_path):
+            with open(text_path, encoding='utf-8') as f:
+                context['text'] = f.read()
+        return context
+
+    def _extract(self, ingestion_id: ObjectId, context: Dict) -> Dict:
+        extraction_cache = self.services('extraction_cache')
+        cached = extraction_cache.get(context['sha256']) if extraction_cache is not None else None
+        if cached is not None:
+            context.update(text=cached['text'], course_info=dict(cached['course_info']),
+                           document=cached.get('document', {}), cached=True)
+        else:
+            pdf_service = self.services('pdf_service')
+            with open(self._path(ingestion_id, 'pdf'), 'rb') as pdf_file:
+                document = pdf_service.open_pdf(pdf_file)
+                if not document.is_valid:
+                    raise IngestionRejected('PDF文件格式无效')
+                context['text'] = pdf_service.extract_text_from_pdf(document)
+                context['document'] = document.summary()
+
+        with open(self._path(ingestion_id, 'txt'), 'w', encoding='utf-8') as f:
+            f.write(context['text'])
+        updates = {'document': context['document']}
+        if context['cached']:
+            updates['course_info'] = context['course_info']
+            updates['result'] = {'cached': True}
+        return updates
+
+    def _parse(self, ingestion_id: ObjectId, context: Dict) -> Dict:
+        course_info = self.services('pdf_service').parse_course_description(context['text'])
+        context['course_info'] = course_info
+
+        extraction_cache = self.services('extraction_cache')
+        if extraction_cache is not None:
+            with open(self._path(ingestion_id, 'pdf'), 'rb') as pdf_file:
+                extraction_cache.put(context['sha256'], context['text'], dict(course_info),
+                                     document=context['document'], pdf_file=pdf_file)
+        return {'course_info': course_info}
+
+    def _persist(self, ingestion_id: ObjectId, context: Dict) -> Dict:
+        course_info = dict(context['course_info'])
+        if not course_info.get('course_code'):
+            raise IngestionRejected('未识别到课程代码')
+
+        course_model = Course(self.db)
+        existing_course = course_model.get_course_by_code(course_info['course_code'])
+        unchanged = existing_course is not None and existing_course.get('source_sha256') == context['sha256']
+        course_info['source_sha256'] = context['sha256']
+        if unchanged:
+            # 课程当前的来源就是同一个文件：课程记录与各索引都已是最新
+            course_id = existing_course['_id']
+        elif existing_course:
+            course_id = existing_course['_id']
+            course_model.update_course(course_id, course_info)
+        else:
+            course_id = course_model.create_course(dict(course_info))
+
+        context['course_id'] = course_id
+        context['unchanged'] = unchanged
+        return {'result': {
+            'course_id': course_id,
+            'course_code': course_info['course_code'],
+            'course_name': course_info.get('course_name', ''),
+            'cached': context['cached']
+        }}
+
+    def _index(self, ingestion_id: ObjectId, context: Dict):
+        if context.get('unchanged'):
+            return None
+        course_info = context['course_info']
+        errors = []
+
+        retrieval_index = self.services('retrieval_index')
+        if retrieval_index is not None:
+            try:
+                retrieval_index.add_document(course_info['course_code'], context['text'], course_id=context['course_id'])
+            except Exception as e:
+                errors.append(f"检索索引: {e}")
+
+        course_relations = self.services('course_relations')
+        if course_relations is not None:
+            try:
+                course_relations.update_course(course_info)
+            except Exception as e:
+                errors.append(f"课程相关度索引: {e}")
+
+        course_similarity = self.services('course_similarity')
+        if course_similarity is not None:
+            try:
+                course_similarity.update_course(course_info, course_id=context['course_id'])
+            except Exception as e:
+                errors.append(f"课程相似度矩阵: {e}")
+
+        if errors:
+            raise RuntimeError('更新索引失败（' + '；'.join(errors) + '）')
+        return None
+
+    def _find(self, ingestion_id: str) -> Optional[Dict]:
+        try:
+            return self.collection.find_one({'_id': ObjectId(ingestion_id)})
+        except Exception:
+            return None
+
+    def _update(self, ingestion_id: ObjectId, updates: Dict, run_id: ObjectId) -> bool:
+        """写入本次执行的状态，导入已被其他执行认领时不写入并返回False"""
+        updates['updated_at'] = datetime.utcnow()
+        result = self.collection.update_one({'_id': ingestion_id, 'run_id': run_id}, {'$set': updates})
+        return result.matched_count > 0
+
+    def _path(self, ingestion_id: ObjectId, extension: str) -> str:
+        return os.path.join(self.directory, f'{ingestion_id}.{extension}')
+
+    def _remove_files(self, ingestion_id: ObjectId):
+        for extension in ('pdf', 'txt'):
+            try:
+                os.unlink(self._path(ingestion_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
@@ -1,132 +1,358 @@
-import PyPDF2
 import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from io import BytesIO
-import re
-from typing import Dict, List
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
-class PDFService:
-    def __init__(self):
-        self.supported_formats = ['.pdf']
+from app.services.section_scanner import COURSE_FIELDS, SectionScanner, extract_list_items, scan_course_text
+
+PDF_MAGIC = b'%PDF-'
+PDF_HEADER_SEARCH = 1024  # PDF规范允许文件头前有少量字节，只在前1KB内查找
+DEFAULT_MAX_PDF_SIZE = 50 * 1024 * 1024
+SPOOL_CHUNK_SIZE = 1024 * 1024
+SPOOL_MEMORY_SIZE = 1024 * 1024  # 超过该大小的上传写入磁盘临时文件
+PARALLEL_MIN_PAGES = 32  # 页数不少于该值时才使用进程池并行提取
+# 文本提取或课程信息解析的结果发生变化时递增，解析缓存中旧版本的结果会重新计算
+EXTRACTOR_VERSION = 2
+
+PDFSource = Union[bytes, BinaryIO]
+
+
+class PageText(NamedTuple):
+    """一页的文本；offset为该页在全文（各页以换行连接）中的起始字符位置"""
+    index: int
+    offset: int
+    text: str
+
+
+class HashingSpooledFile(tempfile.SpooledTemporaryFile):
+    """写入的同时计算SHA-256的临时文件：Werkzeug解析multipart时写入上传的PDF，spool_upload复制不可随机读取的流"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+    
+    def write(self, data):
+        self.sha256.update(data)
+        return super().write(data)
+
+
+def upload_stream_factory(total_content_length, content_type, filename, content_length=None):
+    """Flask请求解析上传文件时使用的临时文件：PDF文件在写入时即计算内容哈希，其他文件与Werkzeug默认相同"""
+    if filename and filename.lower().endswith('.pdf'):
+        return HashingSpooledFile(max_size=SPOOL_MEMORY_SIZE, mode='w+b')
+    return tempfile.SpooledTemporaryFile(max_size=1024 * 500, mode='w+b')
+
+
+class PDFUploadError(Exception):
+    """上传的文件在解析前即被拒绝（格式或大小不符合要求）"""
+    
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PDFDocument:
+    """打开一次的PDF文件句柄
+    
+    构造时解析一次xref与对象表，验证结果、页数与元数据都来自同一个PdfReader，
+    各页文本在需要时再提取。文件对象由调用方持有，句柄使用期间不能关闭。
+    """
+    
+    METADATA_FIELDS = ('title', 'author', 'subject', 'creator', 'producer')
+    
+    def __init__(self, file_content: PDFSource):
+        self.error = None
+        self._source = file_content
+        self._reader = None
+        self._metadata = None
+        try:
+            import PyPDF2  # 路由模块在应用启动时导入本模块，PyPDF2在首次解析时再导入
+            self._reader = PyPDF2.PdfReader(_as_stream(file_content))
+            self.page_count = len(self._reader.pages)
+        except Exception as e:
+            self._reader = None
+            self.page_count = 0
+            self.error = str(e)
+    
+    @property
+    def is_valid(self) -> bool:
+        return self._reader is not None and self.page_count > 0
     
-    def extract_text_from_pdf(self, file_content: bytes) -> str:
-        """从PDF文件中提取文本"""
+    @property
+    def metadata(self) -> Dict[str, str]:
+        """文档信息字典中的标题、作者等字段（没有或无法读取时为空）"""
+        if self._metadata is None:
+            self._metadata = {}
+            try:
+                info = self._reader.metadata if self._reader is not None else None
+            except Exception:
+                info = None
+            for field in self.METADATA_FIELDS:
+                value = getattr(info, field, None) if info is not None else None
+                if value:
+                    self._metadata[field] = str(value)
+        return self._metadata
+    
+    def page_text(self, index: int) -> str:
+        """第index页（从0开始）的文本"""
+        if self._reader is None:
+            raise Exception(f"PDF解析失败: {self.error}")
         try:
-            pdf_file = BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            
-            return text.strip()
+            return self._reader.pages[index].extract_text()
         except Exception as e:
             raise Exception(f"PDF解析失败: {str(e)}")
     
-    def parse_course_description(self, text: str) -> Dict:
-        """解析课程描述文本，提取关键信息"""
-        course_info = {
-            'course_code': '',
-            'course_name': '',
-            'description': '',
-            'objectives': [],
-            'topics': [],
-            'prerequisites': [],
-            'assessment': [],
-            'textbooks': []
-        }
-        
-        # 提取课程代码和名称
-        course_pattern = r'([A-Z]{2,4}\d{4})\s*[-:]?\s*(.+?)(?:\n|$)'
-        course_match = re.search(course_pattern, text, re.IGNORECASE)
-        if course_match:
-            course_info['course_code'] = course_match.group(1).upper()
-            course_info['course_name'] = course_match.group(2).strip()
+    def text(self) -> str:
+        """全部页面的文本"""
+        return _join_pages(self.page_text(index) for index in range(self.page_count))
+    
+    def iter_pages(self) -> Iterator[PageText]:
+        """逐页提取文本，调用方停止迭代后不再提取后续页面"""
+        offset = 0
+        for index in range(self.page_count):
+            text = self.page_text(index)
+            yield PageText(index, offset, text)
+            offset += len(text) + 1
+    
+    @contextmanager
+    def file_path(self):
+        """供其他进程打开的文件路径：将文件按块复制到命名临时文件，使用结束后删除"""
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+            path = f.name
+            if isinstance(self._source, (bytes, bytearray, memoryview)):
+                f.write(self._source)
+            else:
+                self._source.seek(0)
+                shutil.copyfileobj(self._source, f, SPOOL_CHUNK_SIZE)
+        try:
+            yield path
+        finally:
+            os.unlink(path)
+    
+    def summary(self) -> Dict:
+        return {'page_count': self.page_count, 'metadata': self.metadata}
+
+
+class PDFService:
+    def __init__(self, max_file_size: int = DEFAULT_MAX_PDF_SIZE, extract_workers: int = None,
+                 parallel_min_pages: int = PARALLEL_MIN_PAGES):
+        self.supported_formats = ['.pdf']
+        self.max_file_size = max_file_size
+        self.extract_workers = extract_workers if extract_workers is not None else min(4, os.cpu_count() or 1)
+        self.parallel_min_pages = parallel_min_pages
+    
+    def check_upload_size(self, content_length) -> None:
+        """根据请求的Content-Length在读取请求体之前拒绝过大的上传"""
+        if content_length is not None and content_length > self.max_file_size:
+            raise PDFUploadError(self._too_large_message(), 413)
+    
+    def spool_upload(self, stream: BinaryIO) -> BinaryIO:
+        """将上传的文件流按块写入临时文件，返回定位在开头的可随机读取文件对象
         
-        # 提取课程描述
-        desc_patterns = [
-            r'(?:Course\s+Description|Description)[:\s]*\n?(.*?)(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))',
-            r'(?:课程描述|描述)[：:\s]*\n?(.*?)(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))'
-        ]
-        for pattern in desc_patterns:
-            desc_match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-            if desc_match:
-                course_info['description'] = desc_match.group(1).strip()
-                break
+        先读取文件头检查PDF魔数，写入过程中超过max_file_size立即停止，不符合要求的文件不会被完整读取和解析。
+        Werkzeug解析multipart时已将较大的文件写入临时文件，可随机读取的流直接检查后复用，不再复制。
+        内容哈希由content_sha256()获取：复制的流与upload_stream_factory创建的流在写入时已计算。
+        """
+        if _is_seekable(stream):
+            stream.seek(0, os.SEEK_END)
+            size = stream.tell()
+            if size > self.max_file_size:
+                raise PDFUploadError(self._too_large_message(), 413)
+            stream.seek(0)
+            self._check_header(stream.read(PDF_HEADER_SEARCH))
+            stream.seek(0)
+            return stream
         
-        # 提取学习目标
-        obj_patterns = [
-            r'(?:Learning\s+Objectives?|Objectives?)[:\s]*\n?(.*?)(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))',
-            r'(?:学习目标|目标)[：:\s]*\n?(.*?)(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))'
-        ]
-        for pattern in obj_patterns:
-            obj_match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-            if obj_match:
-                objectives_text = obj_match.group(1).strip()
-                course_info['objectives'] = self._extract_list_items(objectives_text)
-                break
+        spooled = HashingSpooledFile(max_size=SPOOL_MEMORY_SIZE, mode='w+b')
+        try:
+            header = stream.read(PDF_HEADER_SEARCH)
+            self._check_header(header)
+            spooled.write(header)
+            size = len(header)
+            while True:
+                chunk = stream.read(SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > self.max_file_size:
+                    raise PDFUploadError(self._too_large_message(), 413)
+                spooled.write(chunk)
+            spooled.seek(0)
+            return spooled
+        except Exception:
+            spooled.close()
+            raise
+    
+    def _check_header(self, header: bytes):
+        if PDF_MAGIC not in header:
+            raise PDFUploadError('PDF文件格式无效', 400)
+    
+    def _too_large_message(self) -> str:
+        if self.max_file_size >= 1024 * 1024:
+            return f"PDF文件超过大小限制（{self.max_file_size / (1024 * 1024):g}MB）"
+        return f"PDF文件超过大小限制（{self.max_file_size}字节）"
+    
+    def open_pdf(self, file_content: PDFSource) -> PDFDocument:
+        """打开PDF文件（只解析一次），无效的文件也返回句柄，由is_valid与error说明原因"""
+        return PDFDocument(file_content)
+    
+    def extract_text_from_pdf(self, file_content: Union[PDFSource, PDFDocument]) -> str:
+        """从PDF文件中提取文本（file_content为已打开的PDFDocument、字节串或可随机读取的文件对象）"""
+        document = file_content if isinstance(file_content, PDFDocument) else self.open_pdf(file_content)
+        if document.error is not None:
+            raise Exception(f"PDF解析失败: {document.error}")
         
-        # 提取课程主题
-        topic_patterns = [
-            r'(?:Topics?|Syllabus|Content)[:\s]*\n?(.*?)(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))',
-            r'(?:主题|大纲|内容)[：:\s]*\n?(.*?)(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))'
-        ]
-        for pattern in topic_patterns:
-            topic_match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-            if topic_match:
-                topics_text = topic_match.group(1).strip()
-                course_info['topics'] = self._extract_list_items(topics_text)
-                break
+        # 页数较多时按页范围分给进程池，避免在请求线程中长时间持有GIL；页数少时逐页提取
+        if self.extract_workers > 1 and document.page_count >= self.parallel_min_pages:
+            try:
+                return self._extract_parallel(document)
+            except Exception as e:
+                logging.warning(f"并行提取PDF文本失败，改为逐页提取: {e}")
+        return document.text()
+    
+    def iter_pages(self, file_content: Union[PDFSource, PDFDocument]) -> Iterator[PageText]:
+        """逐页产生PageText（页码、在全文中的字符偏移、文本）"""
+        document = file_content if isinstance(file_content, PDFDocument) else self.open_pdf(file_content)
+        if document.error is not None:
+            raise Exception(f"PDF解析失败: {document.error}")
+        return document.iter_pages()
+    
+    def iter_text(self, file_content: Union[PDFSource, PDFDocument]) -> Iterator[str]:
+        """逐页产生文本片段，各片段依次连接即为全文（页与页之间以换行分隔）"""
+        for page in self.iter_pages(file_content):
+            yield page.text if page.index == 0 else '\n' + page.text
+    
+    def _extract_parallel(self, document: PDFDocument) -> str:
+        executor = get_extract_executor(self.extract_workers)
+        # 每个进程打开一次文件处理一段连续的页，段数为进程数的2倍以平衡各页耗时的差异
+        ranges = _page_ranges(document.page_count, self.extract_workers * 2)
+        with document.file_path() as path:
+            futures = [executor.submit(_extract_page_range, path, start, stop) for start, stop in ranges]
+            pages = []
+            for future in futures:
+                pages.extend(future.result())
+        return _join_pages(pages)
+    
+    def parse_course_description(self, text: str) -> Dict:
+        """解析课程描述文本，提取关键信息"""
+        return scan_course_text(text).course_info()
+    
+    def parse_course_fields(self, pages: Iterable, fields: Optional[List[str]] = None) -> Tuple[Dict, int]:
+        """逐页解析课程信息，请求的字段都已确定后不再读取后续页面
         
-        # 提取先修课程
-        prereq_patterns = [
-            r'(?:Prerequisites?|Pre-requisites?)[:\s]*\n?(.*?)(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))',
-            r'(?:先修课程|前置课程)[：:\s]*\n?(.*?)(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))'
-        ]
-        for pattern in prereq_patterns:
-            prereq_match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-            if prereq_match:
-                prereq_text = prereq_match.group(1).strip()
-                course_info['prerequisites'] = self._extract_list_items(prereq_text)
-                break
+        pages为iter_pages()产生的PageText或页面文本，各页只扫描一次（见SectionScanner.is_final）。
+        返回(字段值, 读取的页数)，字段值与对全文调用parse_course_description的结果一致。
+        """
+        fields = list(fields) if fields else list(COURSE_FIELDS)
+        unknown = [field for field in fields if field not in COURSE_FIELDS]
+        if unknown:
+            raise ValueError(f"不支持的字段: {', '.join(unknown)}")
         
-        # 提取评估方式
-        assess_patterns = [
-            r'(?:Assessment|Evaluation|Grading)[:\s]*\n?(.*?)(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))',
-            r'(?:评估|考核|成绩评定)[：:\s]*\n?(.*?)(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))'
-        ]
-        for pattern in assess_patterns:
-            assess_match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-            if assess_match:
-                assess_text = assess_match.group(1).strip()
-                course_info['assessment'] = self._extract_list_items(assess_text)
+        scanner = SectionScanner()
+        pages_read = 0
+        for page in pages:
+            scanner.feed(page.text if isinstance(page, PageText) else page)
+            pages_read += 1
+            if all(scanner.is_final(field) for field in fields):
                 break
-        
-        return course_info
+        return {field: scanner.value(field) for field in fields}, pages_read
     
     def _extract_list_items(self, text: str) -> List[str]:
         """从文本中提取列表项"""
-        if not text:
-            return []
-        
-        # 按行分割并清理
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        
-        items = []
-        for line in lines:
-            # 移除列表标记
-            cleaned_line = re.sub(r'^[-•*]\s*', '', line)
-            cleaned_line = re.sub(r'^\d+\.\s*', '', cleaned_line)
-            
-            if cleaned_line and len(cleaned_line) > 3:
-                items.append(cleaned_line)
-        
-        return items[:10]  # 限制最多10个项目
+        return extract_list_items(text or '')
     
-    def validate_pdf_file(self, file_content: bytes) -> bool:
+    def validate_pdf_file(self, file_content: Union[PDFSource, PDFDocument]) -> bool:
         """验证PDF文件格式"""
-        try:
-            pdf_file = BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            return len(pdf_reader.pages) > 0
-        except:
-            return False
\ No newline at end of file
+        document = file_content if isinstance(file_content, PDFDocument) else self.open_pdf(file_content)
+        return document.is_valid
+
+
+_extract_executor = (None, None)  # (进程号, 进程池)
+_extract_executor_lock = threading.Lock()
+
+
+def get_extract_executor(max_workers: int) -> ProcessPoolExecutor:
+    """进程内共享的PDF文本提取进程池（fork后的子进程或进程池中有进程异常退出后会重新创建）"""
+    global _extract_executor
+    with _extract_executor_lock:
+        pid, executor = _extract_executor
+        if executor is None or pid != os.getpid() or getattr(executor, '_broken', False):
+            import multiprocessing
+            # 使用spawn避免在有多个线程的Flask进程中fork
+            executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+            _extract_executor = (os.getpid(), executor)
+        return executor
+
+
+def file_sha256(path: str) -> str:
+    """按块计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(SPOOL_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_sha256(pdf_file: BinaryIO) -> str:
+    """spool_upload返回的文件的SHA-256：写入时已计算的直接返回，否则从头按块读取计算，读取后回到开头"""
+    digest = getattr(pdf_file, 'sha256', None)
+    if digest is None:
+        digest = hashlib.sha256()
+        pdf_file.seek(0)
+        for chunk in iter(lambda: pdf_file.read(SPOOL_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        pdf_file.seek(0)
+    return digest.hexdigest()
+
+
+def parse_pdf_path(path: str, max_file_size: int = DEFAULT_MAX_PDF_SIZE) -> Dict:
+    """检查、提取并解析一个PDF文件，返回text、course_info与document（可在进程池中执行）"""
+    pdf_service = PDFService(max_file_size=max_file_size, extract_workers=1)
+    with open(path, 'rb') as f:
+        document = pdf_service.open_pdf(pdf_service.spool_upload(f))
+        if not document.is_valid:
+            raise PDFUploadError('PDF文件格式无效', 400)
+        text = pdf_service.extract_text_from_pdf(document)
+        return {
+            'text': text,
+            'course_info': pdf_service.parse_course_description(text),
+            'document': document.summary()
+        }
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """在进程池中执行：打开文件并提取[start, stop)页的文本"""
+    import PyPDF2
+    with open(path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        return [reader.pages[index].extract_text() for index in range(start, stop)]
+
+
+def _page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    size = -(-page_count // max(parts, 1))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def _join_pages(pages) -> str:
+    return "\n".join(pages).strip()
+
+
+def _as_stream(file_content: PDFSource) -> BinaryIO:
+    """字节串包装为BytesIO；文件对象回到开头直接交给PyPDF2按需读取，不复制到内存"""
+    if isinstance(file_content, (bytes, bytearray, memoryview)):
+        return BytesIO(file_content)
+    file_content.seek(0)
+    return file_content
+
+
+def _is_seekable(stream) -> bool:
+    try:
+        return stream.seekable()
+    except (AttributeError, ValueError):
+        return False
\ No newline at end of file
@@ -0,0 +1,247 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ProviderError(Exception):
+    """模型提供方返回的错误"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def is_retryable(error: Exception) -> bool:
+    """判断错误是否值得重试：超时、连接错误、限流和服务端错误"""
+    if isinstance(error, ProviderError):
+        return error.retryable
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    return getattr(error, 'code', None) in (429, 500, 502, 503, 504)
+
+
+class ProviderHealth:
+    """单个模型提供方的健康状态：滚动延迟/错误率统计与熔断器"""
+
+    def __init__(self, name: str, window: int = 50, failure_threshold: int = 3, open_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)  # (latency, ok)
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def acquire(self) -> bool:
+        """申请一次调用；熔断打开期间拒绝，半开状态只放行一个探测请求"""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def is_available(self) -> bool:
+        """不占用探测名额地判断当前是否可以调用"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                return time.monotonic() - self._opened_at >= self.open_seconds
+            return not self._probe_in_flight
+
+    def release(self):
+        """未实际发起调用时归还半开探测名额"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def can_retry(self) -> bool:
+        with self._lock:
+            return self._state == CLOSED
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self._samples.append((latency, True))
+            self._consecutive_failures = 0
+            self._state = CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self, latency: float):
+        with self._lock:
+            self._samples.append((latency, False))
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logging.warning(f"{self.name} 熔断打开（连续失败{self._consecutive_failures}次）")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def score(self, default_latency: float = 5.0) -> float:
+        """路由评分，越小越优先：成功调用的中位延迟按错误率加权"""
+        with self._lock:
+            samples = list(self._samples)
+        latencies = [latency for latency, ok in samples if ok]
+        latency = _percentile(latencies, 50) if latencies else default_latency
+        error_rate = sum(1 for _, ok in samples if not ok) / len(samples) if samples else 0.0
+        return latency * (1.0 + 4.0 * error_rate)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            samples = list(self._samples)
+            state = self._state
+            consecutive_failures = self._consecutive_failures
+            opened_at = self._opened_at
+        latencies = [latency for latency, ok in samples if ok]
+        failures = sum(1 for _, ok in samples if not ok)
+        return {
+            'name': self.name,
+            'state': state,
+            'samples': len(samples),
+            'error_rate': round(failures / len(samples), 4) if samples else 0.0,
+            'consecutive_failures': consecutive_failures,
+            'latency_p50': round(_percentile(latencies, 50), 3) if latencies else None,
+            'latency_p95': round(_percentile(latencies, 95), 3) if latencies else None,
+            'open_remaining': round(max(self.open_seconds - (time.monotonic() - opened_at), 0.0), 1)
+            if state == OPEN else 0.0
+        }
+
+
+class ProviderRegistry:
+    """模型提供方注册表：按健康状态排序路由，并为每次调用提供有界重试"""
+
+    def __init__(self, max_attempts: int = 2, backoff_base: float = 0.5, backoff_cap: float = 4.0,
+                 window: int = 50, failure_threshold: int = 3, open_seconds: float = 30.0):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._health_options = {
+            'window': window,
+            'failure_threshold': failure_threshold,
+            'open_seconds': open_seconds
+        }
+        self._lock = threading.Lock()
+        self._providers = {}
+
+    def get(self, name: str) -> ProviderHealth:
+        with self._lock:
+            if name not in self._providers:
+                self._providers[name] = ProviderHealth(name, **self._health_options)
+            return self._providers[name]
+
+    def rank(self, names: List[str]) -> List[str]:
+        """排除熔断中的提供方，其余按评分排序（评分相同时保持配置顺序）"""
+        available = [name for name in names if self.get(name).is_available()]
+        return sorted(available, key=lambda name: self.get(name).score())
+
+    def call(self, name: str, fn: Callable[[Optional[float]], str], timeout: Optional[float] = None) -> Optional[str]:
+        """在熔断器保护下调用fn(剩余时间)，可重试错误按抖动退避重试，失败返回None"""
+        health = self.get(name)
+        if not health.acquire():
+            logging.warning(f"{name} 熔断中，跳过调用")
+            return None
+
+        deadline = time.monotonic() + timeout if timeout else None
+        for attempt in range(self.max_attempts):
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                if attempt == 0:
+                    health.release()
+                break
+
+            start = time.monotonic()
+            try:
+                result = fn(remaining)
+                health.record_success(time.monotonic() - start)
+                return result
+            except Exception as e:
+                health.record_failure(time.monotonic() - start)
+                logging.error(f"{name} 调用失败（第{attempt + 1}次）: {e}")
+                if not is_retryable(e) or not health.can_retry() or attempt + 1 >= self.max_attempts:
+                    break
+
+            delay = self._backoff(attempt)
+            if deadline and time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+
+        return None
+
+    def stream(self, name: str, fn: Callable[[Optional[float]], Iterator[str]],
+               timeout: Optional[float] = None) -> Iterator[str]:
+        """流式调用：输出首个片段前的可重试错误按退避重试，失败时不产出任何内容；
+        开始输出后出错则记录失败并向调用方抛出异常
+        """
+        health = self.get(name)
+        if not health.acquire():
+            logging.warning(f"{name} 熔断中，跳过调用")
+            return
+
+        deadline = time.monotonic() + timeout if timeout else None
+        finished = False
+        try:
+            for attempt in range(self.max_attempts):
+                remaining = deadline - time.monotonic() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    break
+
+                start = time.monotonic()
+                emitted = False
+                try:
+                    for piece in fn(remaining):
+                        emitted = True
+                        yield piece
+                    health.record_success(time.monotonic() - start)
+                    finished = True
+                    return
+                except GeneratorExit:
+                    raise
+                except Exception as e:
+                    health.record_failure(time.monotonic() - start)
+                    finished = True
+                    logging.error(f"{name} 流式调用失败（第{attempt + 1}次）: {e}")
+                    if emitted:
+                        raise
+                    if not is_retryable(e) or not health.can_retry() or attempt + 1 >= self.max_attempts:
+                        return
+
+                delay = self._backoff(attempt)
+                if deadline and time.monotonic() + delay >= deadline:
+                    return
+                time.sleep(delay)
+        finally:
+            # 客户端断开或未实际发起调用时归还半开探测名额
+            if not finished:
+                health.release()
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            providers = list(self._providers.values())
+        return [provider.snapshot() for provider in providers]
+
+    def _backoff(self, attempt: int) -> float:
+        """指数退避加全抖动"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(percentile / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
@@ -1,54 +1,94 @@
-import requests
 import os
-from typing import List, Dict, Any
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
+import hashlib
+from concurrent.futures import as_completed
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import json
 import logging
-import google.generativeai as genai
+from app.services.llm_dispatch import HedgedDispatcher, get_shared_executor
+from app.services.provider_health import ProviderError, ProviderRegistry
+from app.services.http_client import get_provider_http_client
+from app.services.semantic_cache import SemanticAdviceCache, normalize_context
+from app.services.grade_stats import (
+    get_grade_stats, average_score, related_average, weighted_course_average, course_key
+)
+
+# 提示词模板变更时需要同步修改版本号，使旧的建议缓存失效
+PROMPT_TEMPLATE_VERSION = '2'
+
+ADVICE_PROMPT_TEMPLATE = """
+基于以下学生和课程信息，请生成个性化的学习建议：
+
+{context}
+
+请提供具体、实用的学习建议，包括：
+1. 学习重点和难点分析
+2. 学习方法建议
+3. 时间安排建议
+4. 注意事项
+
+请用中文回答，建议要具体且可操作。
+"""
 
 class RAGService:
     def __init__(self):
         # Gemini API配置（主要）
         self.gemini_api_key = os.getenv('GEMINI_API_KEY')
         if self.gemini_api_key:
+            # 仅在启用Gemini时导入SDK（导入耗时约1秒）
+            import google.generativeai as genai
             genai.configure(api_key=self.gemini_api_key)
             self.gemini_model = genai.GenerativeModel('gemini-pro')
         
         # 备用API配置
         self.deepseek_api_key = os.getenv('DEEPSEEK_API_KEY')
-        self.deepseek_base_url = "https://api.deepseek.com/v1"
+        self.deepseek_base_url = os.getenv('DEEPSEEK_BASE_URL', "https://api.deepseek.com/v1")
         self.qwen_api_key = os.getenv('QWEN_API_KEY')
-        self.qwen_base_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+        self.qwen_base_url = os.getenv(
+            'QWEN_BASE_URL',
+            "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+        )
+        
+        # 模型调用方式：serial为依次回退，hedged为对冲并发调用
+        self.dispatch_mode = os.getenv('LLM_DISPATCH_MODE', 'hedged')
+        self.dispatcher = HedgedDispatcher(
+            hedge_delay=float(os.getenv('LLM_HEDGE_DELAY', 3.0)),
+            deadline=float(os.getenv('LLM_REQUEST_DEADLINE', 25.0))
+        )
+        
+        # 提供方健康状态：熔断、延迟统计与重试
+        self.provider_registry = ProviderRegistry(
+            max_attempts=int(os.getenv('LLM_MAX_ATTEMPTS', 2)),
+            failure_threshold=int(os.getenv('LLM_CIRCUIT_FAILURES', 3)),
+            open_seconds=float(os.getenv('LLM_CIRCUIT_OPEN_SECONDS', 30.0))
+        )
+        
+        # DeepSeek和通义千问共用的keep-alive连接池
+        self.http_client = get_provider_http_client()
         
-        self.vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
+        # 检索配置：每次建议检索的块数量与写入提示词的字符预算
+        self.retrieval_top_k = int(os.getenv('RAG_RETRIEVAL_TOP_K', 5))
+        self.context_chunk_budget = int(os.getenv('RAG_CONTEXT_CHUNK_BUDGET', 2000))
+        
+        # 建议中推荐的后续课程数量
+        self.next_courses_count = int(os.getenv('NEXT_COURSES_COUNT', 5))
+        
+        # 语义近似缓存：相似学生在同一课程上复用建议，作为建议缓存的第二层（调用方启用建议缓存时生效）
+        self.semantic_cache = None
+        if os.getenv('SEMANTIC_CACHE_ENABLED', '1').lower() not in ('0', 'false'):
+            self.semantic_cache = SemanticAdviceCache(
+                threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.9)),
+                bucket_size=int(os.getenv('SEMANTIC_CACHE_BUCKET_SIZE', 5)),
+                ttl_seconds=int(os.getenv('SEMANTIC_CACHE_TTL', 600))
+            )
         
         print(f"RAG服务初始化完成，使用Gemini API")
     
-    def generate_learning_advice(self, student_data: Dict, course_data: Dict) -> Dict:
+    def generate_learning_advice(self, student_data: Dict, course_data: Dict, retrieval_index=None,
+                                 advice_cache=None, course_relations=None, course_similarity=None) -> Dict:
         """生成个性化学习建议"""
         try:
-            # 构建上下文信息
-            context = self._build_context(student_data, course_data)
-            
-            # 生成学习建议
-            advice = self._generate_advice_with_llm(context)
-            
-            # 生成学习计划
-            study_plan = self._generate_study_plan(student_data, course_data)
-            
-            # 推荐资源
-            resources = self._recommend_resources(course_data)
-            
-            return {
-                'advice': advice,
-                'study_plan': study_plan,
-                'recommended_resources': resources,
-                'difficulty_assessment': self._assess_difficulty(student_data, course_data),
-                'estimated_study_time': self._estimate_study_time(course_data),
-                'success_probability': self._calculate_success_probability(student_data, course_data)
-            }
+            context = self._prepare_context(student_data, course_data, retrieval_index, course_relations)
+            return self._advice_from_context(student_data, course_data, context, advice_cache, course_similarity)
         except Exception as e:
             logging.error(f"生成学习建议时出错: {str(e)}")
             return {
@@ -61,25 +101,257 @@ class RAGService:
                 'success_probability': 0.5
             }
     
-    def _build_context(self, student_data: Dict, course_data: Dict) -> str:
+    def generate_batch_advice(self, pairs: List[Tuple[Dict, Dict]], retrieval_index=None, advice_cache=None,
+                              executor=None, course_relations=None,
+                              course_similarity=None) -> Iterator[Tuple[List[int], Optional[Dict], Optional[str]]]:
+        """批量生成学习建议，按完成顺序产出 (pairs中的序号列表, 结果, 错误信息)
+
+        上下文完全相同的组合只生成一次，生成任务在有界线程池中并发执行。
+        """
+        executor = executor or get_shared_executor('advice-batch', int(os.getenv('ADVICE_BATCH_WORKERS', 4)))
+        
+        groups = {}  # 上下文哈希 -> [序号列表, 学生, 课程, 上下文]
+        for index, (student_data, course_data) in enumerate(pairs):
+            try:
+                context = self._prepare_context(student_data, course_data, retrieval_index, course_relations)
+            except Exception as e:
+                yield [index], None, f'构建上下文失败: {str(e)}'
+                continue
+            key = hashlib.sha256(context.encode('utf-8')).hexdigest()
+            if key in groups:
+                groups[key][0].append(index)
+            else:
+                groups[key] = [[index], student_data, course_data, context]
+        
+        futures = {
+            executor.submit(
+                self._advice_from_context, student_data, course_data, context, advice_cache, course_similarity
+            ): indices
+            for indices, student_data, course_data, context in groups.values()
+        }
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    logging.error(f"批量生成学习建议时出错: {str(e)}")
+                    yield futures[future], None, f'生成学习建议时出错: {str(e)}'
+        finally:
+            for future in futures:
+                future.cancel()
+    
+    def stream_learning_advice(self, student_data: Dict, course_data: Dict, retrieval_index=None,
+                               advice_cache=None, course_relations=None,
+                               course_similarity=None) -> Iterator[Tuple[str, Dict]]:
+        """流式生成学习建议，依次产出 (事件名, 数据)
+
+        meta事件立即给出学习计划、资源推荐等确定性内容，随后token事件逐段输出模型生成的建议，
+        最后以done事件结束；生成中断时产出error事件。
+        """
+        parts = self._build_deterministic_parts(student_data, course_data, course_similarity)
+        yield 'meta', parts
+        
+        try:
+            context = self._prepare_context(student_data, course_data, retrieval_index, course_relations)
+            
+            cache_key = None
+            if advice_cache is not None:
+                cache_key = advice_cache.make_key(context, self.provider_signature(), PROMPT_TEMPLATE_VERSION)
+                cached = advice_cache.get(cache_key)
+                if cached is not None:
+                    yield 'token', {'text': cached['advice']}
+                    yield 'done', {'provider': None, 'cached': True}
+                    return
+                
+                similar_advice = self._semantic_lookup(course_data, context)
+                if similar_advice is not None:
+                    yield 'token', {'text': similar_advice}
+                    yield 'done', {'provider': None, 'cached': True}
+                    return
+            
+            pieces = []
+            provider = None
+            for provider, piece in self._stream_llm_advice(self._llm_context(context)):
+                pieces.append(piece)
+                yield 'token', {'text': piece}
+            
+            if not pieces:
+                provider = 'fallback'
+                yield 'token', {'text': self._generate_fallback_advice(context)}
+            elif cache_key is not None:
+                result = {'advice': ''.join(pieces)}
+                result.update(parts)
+                advice_cache.set(
+                    cache_key,
+                    result,
+                    student_id=student_data.get('_id'),
+                    course_id=course_data.get('_id')
+                )
+                self._semantic_store(student_data, course_data, context, result['advice'])
+            
+            yield 'done', {'provider': provider, 'cached': False}
+        except Exception as e:
+            logging.error(f"流式生成学习建议时出错: {str(e)}")
+            yield 'error', {'error': f'生成学习建议时出错: {str(e)}'}
+    
+    def _prepare_context(self, student_data: Dict, course_data: Dict, retrieval_index=None,
+                         course_relations=None) -> str:
+        """检索课程资料片段、查询相关课程并构建上下文"""
+        retrieved_chunks = self._retrieve_chunks(student_data, course_data, retrieval_index)
+        related_courses = self._related_courses(course_data, course_relations)
+        return self._build_context(student_data, course_data, retrieved_chunks, related_courses)
+    
+    def _related_courses(self, course_data: Dict, course_relations=None) -> Optional[List[Tuple[str, float]]]:
+        """课程相关度索引中的相关课程，索引不可用或没有该课程时返回None"""
+        if course_relations is None:
+            return None
+        try:
+            return course_relations.neighbors(course_data.get('course_code', ''))
+        except Exception as e:
+            logging.error(f"查询相关课程失败: {e}")
+            return None
+    
+    def _advice_from_context(self, student_data: Dict, course_data: Dict, context: str, advice_cache=None,
+                             course_similarity=None) -> Dict:
+        """基于已构建的上下文生成建议（命中缓存时直接返回）"""
+        # 查询建议缓存
+        cache_key = None
+        if advice_cache is not None:
+            cache_key = advice_cache.make_key(context, self.provider_signature(), PROMPT_TEMPLATE_VERSION)
+            cached = advice_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        # 生成学习建议：先复用相似学生在同一课程上的建议，否则调用模型
+        advice = self._semantic_lookup(course_data, context) if cache_key is not None else None
+        from_cache = advice is not None
+        from_llm = False
+        if not from_cache:
+            advice = self._request_llm_advice(self._llm_context(context))
+            from_llm = advice is not None
+        if advice is None:
+            advice = self._generate_fallback_advice(context)
+        
+        result = {'advice': advice}
+        result.update(self._build_deterministic_parts(student_data, course_data, course_similarity))
+        
+        # 备用建议不写入缓存，以便模型恢复后重新生成
+        if cache_key is not None and (from_llm or from_cache):
+            advice_cache.set(
+                cache_key,
+                result,
+                student_id=student_data.get('_id'),
+                course_id=course_data.get('_id')
+            )
+        if cache_key is not None and from_llm:
+            self._semantic_store(student_data, course_data, context, advice)
+        
+        return result
+    
+    def _llm_context(self, context: str) -> str:
+        """发送给模型的上下文：启用语义缓存时平均分按区间给出，生成的建议只依赖复用它的学生共有的画像"""
+        if self.semantic_cache is None:
+            return context
+        return normalize_context(context, self.semantic_cache.bucket_size)
+    
+    def _semantic_namespace(self, course_data: Dict) -> Tuple:
+        course_id = course_data.get('_id') or course_data.get('course_code', '')
+        return str(course_id), self.provider_signature(), PROMPT_TEMPLATE_VERSION
+    
+    def _semantic_lookup(self, course_data: Dict, context: str) -> Optional[str]:
+        """在语义近似缓存中查找同一课程下足够相似的上下文，返回其建议文本"""
+        if self.semantic_cache is None:
+            return None
+        try:
+            value, _ = self.semantic_cache.lookup(self._semantic_namespace(course_data), context)
+        except Exception as e:
+            logging.error(f"查询语义缓存失败: {e}")
+            return None
+        return value['advice'] if value is not None else None
+    
+    def _semantic_store(self, student_data: Dict, course_data: Dict, context: str, advice: str):
+        if self.semantic_cache is None:
+            return
+        try:
+            student_id = student_data.get('_id')
+            self.semantic_cache.add(
+                self._semantic_namespace(course_data),
+                context,
+                {'advice': advice},
+                student_id=str(student_id) if student_id is not None else None
+            )
+        except Exception as e:
+            logging.error(f"写入语义缓存失败: {e}")
+    
+    def _build_deterministic_parts(self, student_data: Dict, course_data: Dict, course_similarity=None) -> Dict:
+        """不依赖模型的建议内容"""
+        return {
+            'study_plan': self._generate_study_plan(student_data, course_data),
+            'recommended_resources': self._recommend_resources(course_data),
+            'difficulty_assessment': self._assess_difficulty(student_data, course_data),
+            'estimated_study_time': self._estimate_study_time(course_data),
+            'success_probability': self._calculate_success_probability(student_data, course_data),
+            'next_courses': self._recommend_next_courses(student_data, course_data, course_similarity)
+        }
+    
+    def _recommend_next_courses(self, student_data: Dict, course_data: Dict, course_similarity=None) -> List[Dict]:
+        """与当前课程最相似、且学生尚未修过的课程"""
+        if course_similarity is None:
+            return []
+        try:
+            similar = course_similarity.similar(course_data.get('course_code', ''), k=course_similarity.k)
+        except Exception as e:
+            logging.error(f"查询相似课程失败: {e}")
+            return []
+        
+        taken = get_grade_stats(student_data).get('by_course', {})
+        return [course for course in similar if course_key(course['course_code']) not in taken][:self.next_courses_count]
+    
+    def _retrieve_chunks(self, student_data: Dict, course_data: Dict, retrieval_index=None) -> List[Dict]:
+        """从检索索引中获取与学生和课程相关的资料片段"""
+        if retrieval_index is None:
+            return []
+        
+        query_parts = [
+            course_data.get('course_name', ''),
+            course_data.get('description', ''),
+            ' '.join(course_data.get('objectives', [])),
+            ' '.join(course_data.get('topics', [])),
+            student_data.get('major', '')
+        ]
+        query = ' '.join(part for part in query_parts if part)
+        
+        try:
+            return retrieval_index.search(
+                query,
+                k=self.retrieval_top_k,
+                course_code=course_data.get('course_code') or None
+            )
+        except Exception as e:
+            logging.error(f"检索课程资料失败: {e}")
+            return []
+    
+    def _build_context(self, student_data: Dict, course_data: Dict, retrieved_chunks: List[Dict] = None,
+                       related_courses: Optional[List[Tuple[str, float]]] = None) -> str:
         """构建RAG上下文"""
         context_parts = []
         
-        # 学生信息
-        context_parts.append(f"学生姓名: {student_data.get('name', '未知')}")
+        # 学生信息（不含姓名：上下文会发送给外部模型，生成的建议也可能经语义缓存提供给其他学生）
         context_parts.append(f"专业: {student_data.get('major', '未知')}")
         context_parts.append(f"年级: {student_data.get('grade', '未知')}")
         
         # 历史成绩分析
-        grades = student_data.get('grades', [])
-        if grades:
-            avg_grade = sum([g.get('score', 0) for g in grades]) / len(grades)
+        stats = get_grade_stats(student_data)
+        avg_grade = average_score(stats)
+        if avg_grade is not None:
             context_parts.append(f"平均成绩: {avg_grade:.2f}")
             
-            # 相关课程成绩
-            related_grades = [g for g in grades if self._is_related_course(g.get('course', ''), course_data.get('course_code', ''))]
-            if related_grades:
-                related_avg = sum([g.get('score', 0) for g in related_grades]) / len(related_grades)
+            # 相关课程成绩：按相关度加权；相关度索引中没有该课程时退回到同前缀课程
+            if related_courses is not None:
+                related_avg = weighted_course_average(stats, related_courses)
+            else:
+                related_avg = related_average(stats, course_data.get('course_code', ''))
+            if related_avg is not None:
                 context_parts.append(f"相关课程平均成绩: {related_avg:.2f}")
         
         # 课程信息
@@ -96,170 +368,261 @@ class RAGService:
         if course_data.get('prerequisites'):
             context_parts.append(f"先修课程: {'; '.join(course_data['prerequisites'])}")
         
+        # 课程资料摘录（按相关度顺序写入，直到达到字符预算）
+        if retrieved_chunks:
+            excerpts = []
+            remaining = self.context_chunk_budget
+            for chunk in retrieved_chunks:
+                text = chunk['text']
+                if len(text) > remaining:
+                    if not excerpts:
+                        excerpts.append(text[:remaining])
+                    break
+                excerpts.append(text)
+                remaining -= len(text)
+            if excerpts:
+                context_parts.append("\n课程资料摘录:")
+                context_parts.extend(f"- {text}" for text in excerpts)
+        
         return '\n'.join(context_parts)
     
+    def provider_signature(self) -> str:
+        """当前启用的模型提供方及模型名称，用于区分缓存"""
+        providers = []
+        if self.gemini_api_key:
+            providers.append('gemini:gemini-pro')
+        if self.deepseek_api_key:
+            providers.append('deepseek:deepseek-chat')
+        if self.qwen_api_key:
+            providers.append('qwen:qwen-turbo')
+        return ','.join(providers) or 'fallback'
+    
+    def _build_prompt(self, context: str) -> str:
+        """构建学习建议提示词"""
+        return ADVICE_PROMPT_TEMPLATE.format(context=context)
+    
     def _generate_advice_with_llm(self, context: str) -> str:
         """使用LLM生成学习建议"""
-        # 首先尝试Gemini API
-        advice = self._try_gemini_api(context)
-        if advice:
-            return advice
-            
-        # 如果Gemini失败，尝试DeepSeek API
-        advice = self._try_deepseek_api(context)
-        if advice:
-            return advice
-            
-        # 如果DeepSeek失败，尝试通义千问
-        advice = self._try_qwen_api(context)
+        advice = self._request_llm_advice(context)
         if advice:
             return advice
             
         # 如果都失败，返回备用建议
         return self._generate_fallback_advice(context)
     
-    def _try_gemini_api(self, context: str) -> str:
-        """尝试使用Gemini API"""
-        if not self.gemini_api_key:
-            return None
-            
-        try:
-            prompt = f"""
-基于以下学生和课程信息，请生成个性化的学习建议：
-
-{context}
-
-请提供具体、实用的学习建议，包括：
-1. 学习重点和难点分析
-2. 学习方法建议
-3. 时间安排建议
-4. 注意事项
+    def _provider_calls(self, context: str) -> List:
+        """按健康评分返回可用的模型调用 [(名称, 调用函数)]，熔断中的提供方被跳过"""
+        configured = {}
+        if self.gemini_api_key:
+            configured['gemini'] = lambda timeout=None: self._try_gemini_api(context, timeout=timeout)
+        if self.deepseek_api_key:
+            configured['deepseek'] = lambda timeout=30: self._try_deepseek_api(context, timeout=timeout)
+        if self.qwen_api_key:
+            configured['qwen'] = lambda timeout=30: self._try_qwen_api(context, timeout=timeout)
+        
+        return [(name, configured[name]) for name in self.provider_registry.rank(list(configured))]
+    
+    def _request_llm_advice(self, context: str) -> Optional[str]:
+        """调用各模型提供方，全部失败时返回None"""
+        calls = self._provider_calls(context)
+        if self.dispatch_mode == 'hedged':
+            advice, provider = self.dispatcher.dispatch(calls)
+            return advice
+        
+        # 按健康评分依次尝试
+        for name, call in calls:
+            advice = call()
+            if advice:
+                return advice
+        
+        return None
+    
+    def _stream_llm_advice(self, context: str) -> Iterator[Tuple[str, str]]:
+        """按健康评分依次尝试各提供方的流式接口，产出 (提供方, 文本片段)
 
-请用中文回答，建议要具体且可操作。
-"""
-            
-            response = self.gemini_model.generate_content(prompt)
-            
-            if response.text:
-                return response.text
-            else:
-                logging.error("Gemini API返回空响应")
-                return None
-                
-        except Exception as e:
-            logging.error(f"Gemini API调用失败: {e}")
+        首个片段之前失败会切换到下一个提供方；已经开始输出后失败则抛出异常。
+        """
+        streams = {}
+        if self.gemini_api_key:
+            streams['gemini'] = lambda timeout: self._stream_gemini_api(context, timeout)
+        if self.deepseek_api_key:
+            streams['deepseek'] = lambda timeout: self._stream_deepseek_api(context, timeout)
+        if self.qwen_api_key:
+            streams['qwen'] = lambda timeout: self._stream_qwen_api(context, timeout)
+        
+        for name in self.provider_registry.rank(list(streams)):
+            emitted = False
+            for piece in self.provider_registry.stream(name, streams[name], self.dispatcher.deadline):
+                emitted = True
+                yield name, piece
+            if emitted:
+                return
+    
+    def _try_gemini_api(self, context: str, timeout: Optional[float] = None) -> str:
+        """尝试使用Gemini API，失败返回None"""
+        if not self.gemini_api_key:
             return None
+        return self.provider_registry.call(
+            'gemini', lambda remaining: self._call_gemini_api(context, remaining), timeout
+        )
     
-    def _try_deepseek_api(self, context: str) -> str:
-        """尝试使用DeepSeek API"""
+    def _try_deepseek_api(self, context: str, timeout: float = 30) -> str:
+        """尝试使用DeepSeek API，失败返回None"""
         if not self.deepseek_api_key:
             return None
-            
-        try:
-            prompt = f"""
-基于以下学生和课程信息，请生成个性化的学习建议：
-
-{context}
-
-请提供具体、实用的学习建议，包括：
-1. 学习重点和难点分析
-2. 学习方法建议
-3. 时间安排建议
-4. 注意事项
-
-请用中文回答，建议要具体且可操作。
-"""
-            
-            headers = {
-                "Authorization": f"Bearer {self.deepseek_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "system", "content": "你是一位经验丰富的学术顾问，专门为学生提供个性化的学习建议。请用中文回答。"},
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": 800,
-                "temperature": 0.7,
-                "stream": False
-            }
-            
-            response = requests.post(
-                f"{self.deepseek_base_url}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
-            else:
-                logging.error(f"DeepSeek API错误: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            logging.error(f"DeepSeek API调用失败: {e}")
-            return None
+        return self.provider_registry.call(
+            'deepseek', lambda remaining: self._call_deepseek_api(context, remaining), timeout
+        )
     
-    def _try_qwen_api(self, context: str) -> str:
-        """尝试使用通义千问API"""
+    def _try_qwen_api(self, context: str, timeout: float = 30) -> str:
+        """尝试使用通义千问API，失败返回None"""
         if not self.qwen_api_key:
             return None
-            
-        try:
-            prompt = f"""
-基于以下学生和课程信息，请生成个性化的学习建议：
-
-{context}
-
-请提供具体、实用的学习建议，包括：
-1. 学习重点和难点分析
-2. 学习方法建议
-3. 时间安排建议
-4. 注意事项
-
-请用中文回答，建议要具体且可操作。
-"""
-            
-            headers = {
-                "Authorization": f"Bearer {self.qwen_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "qwen-turbo",
-                "input": {
-                    "messages": [
-                        {"role": "system", "content": "你是一位经验丰富的学术顾问，专门为学生提供个性化的学习建议。"},
-                        {"role": "user", "content": prompt}
-                    ]
-                },
-                "parameters": {
-                    "max_tokens": 800,
-                    "temperature": 0.7
-                }
+        return self.provider_registry.call(
+            'qwen', lambda remaining: self._call_qwen_api(context, remaining), timeout
+        )
+    
+    def _call_gemini_api(self, context: str, timeout: Optional[float] = None) -> str:
+        """调用Gemini API（SDK不支持单次调用超时，由对冲调用的总时限约束）"""
+        prompt = self._build_prompt(context)
+        
+        response = self.gemini_model.generate_content(prompt)
+        
+        if not response.text:
+            raise ProviderError("Gemini API返回空响应")
+        return response.text
+    
+    def _call_deepseek_api(self, context: str, timeout: Optional[float] = 30) -> str:
+        """调用DeepSeek API"""
+        headers, data = self._deepseek_request(context, stream=False)
+        
+        response = self.http_client.post(
+            f"{self.deepseek_base_url}/chat/completions",
+            headers=headers,
+            json=data,
+            timeout=timeout
+        )
+        
+        self._check_response_status('DeepSeek', response)
+        result = response.json()
+        return result['choices'][0]['message']['content']
+    
+    def _call_qwen_api(self, context: str, timeout: Optional[float] = 30) -> str:
+        """调用通义千问API"""
+        headers, data = self._qwen_request(context, stream=False)
+        
+        response = self.http_client.post(
+            self.qwen_base_url,
+            headers=headers,
+            json=data,
+            timeout=timeout
+        )
+        
+        self._check_response_status('通义千问', response)
+        result = response.json()
+        return result['output']['text']
+    
+    def _stream_gemini_api(self, context: str, timeout: Optional[float] = None) -> Iterator[str]:
+        """Gemini流式生成"""
+        response = self.gemini_model.generate_content(self._build_prompt(context), stream=True)
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+    
+    def _stream_deepseek_api(self, context: str, timeout: Optional[float] = 30) -> Iterator[str]:
+        """DeepSeek流式生成（OpenAI兼容的SSE格式）"""
+        headers, data = self._deepseek_request(context, stream=True)
+        response = self.http_client.post(
+            f"{self.deepseek_base_url}/chat/completions",
+            headers=headers,
+            json=data,
+            timeout=timeout,
+            stream=True
+        )
+        with response:
+            self._check_response_status('DeepSeek', response)
+            for payload in self._iter_sse_data(response):
+                if payload == '[DONE]':
+                    break
+                delta = json.loads(payload)['choices'][0].get('delta', {}).get('content')
+                if delta:
+                    yield delta
+    
+    def _stream_qwen_api(self, context: str, timeout: Optional[float] = 30) -> Iterator[str]:
+        """通义千问流式生成（DashScope SSE，增量输出）"""
+        headers, data = self._qwen_request(context, stream=True)
+        response = self.http_client.post(
+            self.qwen_base_url,
+            headers=headers,
+            json=data,
+            timeout=timeout,
+            stream=True
+        )
+        with response:
+            self._check_response_status('通义千问', response)
+            for payload in self._iter_sse_data(response):
+                text = json.loads(payload).get('output', {}).get('text')
+                if text:
+                    yield text
+    
+    def _deepseek_request(self, context: str, stream: bool) -> Tuple[Dict, Dict]:
+        """DeepSeek请求头和请求体"""
+        headers = {
+            "Authorization": f"Bearer {self.deepseek_api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": "deepseek-chat",
+            "messages": [
+                {"role": "system", "content": "你是一位经验丰富的学术顾问，专门为学生提供个性化的学习建议。请用中文回答。"},
+                {"role": "user", "content": self._build_prompt(context)}
+            ],
+            "max_tokens": 800,
+            "temperature": 0.7,
+            "stream": stream
+        }
+        return headers, data
+    
+    def _qwen_request(self, context: str, stream: bool) -> Tuple[Dict, Dict]:
+        """通义千问请求头和请求体"""
+        headers = {
+            "Authorization": f"Bearer {self.qwen_api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": "qwen-turbo",
+            "input": {
+                "messages": [
+                    {"role": "system", "content": "你是一位经验丰富的学术顾问，专门为学生提供个性化的学习建议。"},
+                    {"role": "user", "content": self._build_prompt(context)}
+                ]
+            },
+            "parameters": {
+                "max_tokens": 800,
+                "temperature": 0.7
             }
-            
-            response = requests.post(
-                self.qwen_base_url,
-                headers=headers,
-                json=data,
-                timeout=30
+        }
+        
+        if stream:
+            headers["X-DashScope-SSE"] = "enable"
+            data["parameters"]["incremental_output"] = True
+        return headers, data
+    
+    def _check_response_status(self, name: str, response):
+        """非200响应转换为ProviderError，限流和服务端错误可重试"""
+        if response.status_code != 200:
+            raise ProviderError(
+                f"{name} API错误: {response.status_code} - {response.text}",
+                retryable=response.status_code == 429 or response.status_code >= 500
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['output']['text']
-            else:
-                logging.error(f"通义千问API错误: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            logging.error(f"通义千问API调用失败: {e}")
-            return None
+    
+    def _iter_sse_data(self, response) -> Iterator[str]:
+        """逐行读取SSE响应中的data字段"""
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith('data:'):
+                yield line[5:].strip()
     
     def _generate_fallback_advice(self, context: str) -> str:
         """生成备用学习建议"""
@@ -363,12 +726,10 @@ class RAGService:
     
     def _assess_difficulty(self, student_data: Dict, course_data: Dict) -> str:
         """评估课程难度"""
-        grades = student_data.get('grades', [])
-        if not grades:
+        avg_grade = average_score(get_grade_stats(student_data))
+        if avg_grade is None:
             return 'medium'
         
-        avg_grade = sum([g.get('score', 0) for g in grades]) / len(grades)
-        
         # 基于历史成绩评估难度
         if avg_grade >= 85:
             return 'easy'
@@ -390,12 +751,10 @@ class RAGService:
     
     def _calculate_success_probability(self, student_data: Dict, course_data: Dict) -> float:
         """计算成功概率"""
-        grades = student_data.get('grades', [])
-        if not grades:
+        avg_grade = average_score(get_grade_stats(student_data))
+        if avg_grade is None:
             return 0.7  # 默认概率
         
-        avg_grade = sum([g.get('score', 0) for g in grades]) / len(grades)
-        
         # 简单的概率计算
         if avg_grade >= 85:
             return 0.9
@@ -405,14 +764,4 @@ class RAGService:
             return 0.7
         else:
             return 0.6
-    
-    def _is_related_course(self, course1: str, course2: str) -> bool:
-        """判断两个课程是否相关"""
-        if not course1 or not course2:
-            return False
-        
-        # 简单的相关性判断：相同的课程前缀
-        prefix1 = course1[:2] if len(course1) >= 2 else ''
-        prefix2 = course2[:2] if len(course2) >= 2 else ''
-        
-        return prefix1 == prefix2
\ No newline at end of file
+
@@ -0,0 +1,40 @@
+import threading
+from typing import Any, Callable, Dict, List
+
+from flask import current_app
+
+
+class ServiceRegistry:
+    """应用级服务注册表：服务在首次使用时创建，每个应用实例只创建一次"""
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.RLock()  # 工厂可以通过get获取所依赖的其他服务
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        if name in self._instances:
+            return self._instances[name]
+
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def get_if_created(self, name: str) -> Any:
+        """仅返回已创建的服务，不触发创建"""
+        return self._instances.get(name)
+
+    def created(self) -> List[str]:
+        return list(self._instances)
+
+    def status(self) -> Dict[str, bool]:
+        return {name: name in self._instances for name in self._factories}
+
+
+def get_service(name: str) -> Any:
+    """获取当前应用的服务实例"""
+    return current_app.extensions['services'].get(name)
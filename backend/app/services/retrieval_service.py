@@ -0,0 +1,234 @@
+import re
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+
+class RetrievalIndex:
+    """课程资料分块检索索引
+
+    文本按段落切分为块，每个块以哈希特征的次线性词频(L2归一化)存入稀疏矩阵，
+    IDF由增量维护的文档频率在查询端计算，因此新增一份课程资料只需处理该资料本身，
+    不需要重新拟合整个语料。
+    """
+
+    def __init__(self, db=None, n_features: int = 2 ** 18, chunk_size: int = 500, chunk_overlap: int = 80):
+        self.collection = db.course_chunks if db is not None else None
+        self.n_features = n_features
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features,
+            alternate_sign=False,
+            norm=None,
+            stop_words='english'
+        )
+
+        self._lock = threading.RLock()
+        self._blocks = {}  # course_code -> {'matrix', 'chunks', 'df_cols', 'df_counts'}
+        self._doc_freq = np.zeros(n_features, dtype=np.int64)
+        self._n_chunks = 0
+        self._merged = None  # (matrix, [(course_code, chunk_index, text)])
+        self._loaded = self.collection is None
+        self._synced_at = None
+
+    def chunk_text(self, text: str) -> List[str]:
+        """按段落将文本切分为不超过chunk_size的块，超长段落按窗口切分并保留重叠"""
+        lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in (text or '').split('\n')]
+        lines = [line for line in lines if line]
+
+        chunks = []
+        current = ''
+        for line in lines:
+            while len(line) > self.chunk_size:
+                if current:
+                    chunks.append(current)
+                    current = ''
+                cut = line.rfind(' ', 0, self.chunk_size)
+                if cut <= self.chunk_overlap:
+                    cut = self.chunk_size
+                chunks.append(line[:cut].strip())
+                line = line[cut - self.chunk_overlap:].strip()
+
+            if current and len(current) + len(line) + 1 > self.chunk_size:
+                chunks.append(current)
+                current = ''
+            current = f"{current}\n{line}" if current else line
+
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def add_document(self, course_code: str, text: str, course_id: Optional[str] = None) -> int:
+        """索引（或替换）一门课程的全文，返回块数量"""
+        if not course_code:
+            return 0
+
+        chunks = self.chunk_text(text)
+        # MongoDB只保存毫秒精度，截断后与其他进程读到的时间戳可直接比较
+        now = datetime.utcnow()
+        indexed_at = now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+        if self.collection is not None:
+            self.collection.delete_many({'course_code': course_code})
+            if chunks:
+                self.collection.insert_many([
+                    {
+                        'course_code': course_code,
+                        'course_id': course_id,
+                        'chunk_index': i,
+                        'text': chunk,
+                        'indexed_at': indexed_at
+                    }
+                    for i, chunk in enumerate(chunks)
+                ])
+
+        # 不推进_synced_at：其他进程更早写入、本进程尚未同步的块仍需由_sync加载
+        with self._lock:
+            self._replace_block(course_code, chunks)
+        return len(chunks)
+
+    def remove_document(self, course_code: str):
+        """从索引中移除一门课程"""
+        if self.collection is not None:
+            self.collection.delete_many({'course_code': course_code})
+        with self._lock:
+            self._replace_block(course_code, [])
+
+    def search(self, query: str, k: int = 5, course_code: Optional[str] = None) -> List[Dict]:
+        """检索与查询最相关的k个文本块，可限定在某门课程内"""
+        if not query or k <= 0:
+            return []
+
+        with self._lock:
+            self._sync()
+            if course_code is not None:
+                block = self._blocks.get(course_code)
+                if not block:
+                    return []
+                matrix = block['matrix']
+                owners = [(course_code, i, chunk) for i, chunk in enumerate(block['chunks'])]
+            else:
+                matrix, owners = self._merged_matrix()
+            if matrix is None or matrix.shape[0] == 0:
+                return []
+            query_vector = self._weight_query(query)
+
+        if query_vector.nnz == 0:
+            return []
+
+        scores = np.asarray((matrix @ query_vector.T).todense()).ravel()
+        k = min(k, scores.shape[0])
+        if k < scores.shape[0]:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        results = []
+        for row in top:
+            score = float(scores[row])
+            if score <= 0:
+                break
+            owner_code, chunk_index, text = owners[row]
+            results.append({
+                'course_code': owner_code,
+                'chunk_index': chunk_index,
+                'text': text,
+                'score': round(score, 4)
+            })
+        return results
+
+    def stats(self) -> Dict:
+        """索引规模统计"""
+        with self._lock:
+            return {
+                'courses': len(self._blocks),
+                'chunks': self._n_chunks,
+                'synced_at': self._synced_at.isoformat() if self._synced_at else None
+            }
+
+    def _vectorize(self, texts: List[str]):
+        """哈希词频并做次线性缩放"""
+        counts = self.vectorizer.transform(texts).tocsr()
+        counts.data = 1.0 + np.log(counts.data)
+        return counts
+
+    def _weight_query(self, query: str):
+        """按当前文档频率计算查询向量的IDF权重（调用方持有锁）"""
+        query_vector = self._vectorize([query])
+        idf = np.log((1.0 + self._n_chunks) / (1.0 + self._doc_freq[query_vector.indices])) + 1.0
+        query_vector.data = query_vector.data * idf
+        return normalize(query_vector)
+
+    def _replace_block(self, course_code: str, chunks: List[str]):
+        """替换课程对应的矩阵块并增量更新文档频率（调用方持有锁）"""
+        old = self._blocks.pop(course_code, None)
+        if old:
+            np.subtract.at(self._doc_freq, old['df_cols'], old['df_counts'])
+            self._n_chunks -= len(old['chunks'])
+
+        if chunks:
+            matrix = self._vectorize(chunks)
+            df_cols, df_counts = np.unique(matrix.indices, return_counts=True)
+            np.add.at(self._doc_freq, df_cols, df_counts)
+            self._blocks[course_code] = {
+                'matrix': normalize(matrix),
+                'chunks': chunks,
+                'df_cols': df_cols,
+                'df_counts': df_counts
+            }
+            self._n_chunks += len(chunks)
+
+        self._merged = None
+
+    def _merged_matrix(self):
+        """拼接所有课程块（调用方持有锁，结果缓存到下次变更）"""
+        if self._merged is None:
+            if not self._blocks:
+                self._merged = (None, [])
+            else:
+                owners = []
+                for code, block in self._blocks.items():
+                    owners.extend((code, i, chunk) for i, chunk in enumerate(block['chunks']))
+                matrix = sp.vstack([block['matrix'] for block in self._blocks.values()], format='csr')
+                self._merged = (matrix, owners)
+        return self._merged
+
+    def _sync(self):
+        """从MongoDB加载其他进程写入的课程块（调用方持有锁）"""
+        if self.collection is None:
+            return
+
+        try:
+            if not self._loaded:
+                self.collection.create_index('course_code')
+                self.collection.create_index('indexed_at')
+                query = {}
+            elif self._synced_at is not None:
+                query = {'indexed_at': {'$gt': self._synced_at}}
+            else:
+                query = {}
+
+            changed = {}
+            for doc in self.collection.find(query, {'course_code': 1, 'indexed_at': 1}):
+                changed[doc['course_code']] = max(doc['indexed_at'], changed.get(doc['course_code'], doc['indexed_at']))
+
+            for code in changed:
+                docs = self.collection.find({'course_code': code}, {'text': 1, 'chunk_index': 1})
+                chunks = [doc['text'] for doc in sorted(docs, key=lambda d: d['chunk_index'])]
+                self._replace_block(code, chunks)
+
+            if changed:
+                latest = max(changed.values())
+                if self._synced_at is None or latest > self._synced_at:
+                    self._synced_at = latest
+            self._loaded = True
+        except Exception as e:
+            logging.error(f"检索索引同步失败: {e}")
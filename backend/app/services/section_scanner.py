@@ -0,0 +1,157 @@
+import re
+from bisect import bisect_right
+from typing import Dict, List
+
+# 各小节的英文与中文标题，同一字段先取英文标题
+SECTION_HEADINGS = {
+    'description': (r'Course[ \t]+Description|Description', r'课程描述|描述'),
+    'objectives': (r'Learning[ \t]+Objectives?|Objectives?', r'学习目标|目标'),
+    'topics': (r'Topics?|Syllabus|Content', r'主题|大纲|内容'),
+    'prerequisites': (r'Prerequisites?|Pre-requisites?', r'先修课程|前置课程'),
+    'assessment': (r'Assessment|Evaluation|Grading', r'评估|考核|成绩评定')
+}
+
+COURSE_FIELDS = ('course_code', 'course_name') + tuple(SECTION_HEADINGS)
+
+# 课程代码之后的名称可以在冒号或短横线之后，也可以在下一个非空行（名称不以冒号或短横线开头）
+COURSE_TITLE_RE = re.compile(r'([A-Z]{2,4}\d{4})\s*(?:[-:]\s*)?([^\s:-].*)', re.IGNORECASE)
+COURSE_CODE_RE = re.compile(r'[A-Z]{2,4}\d{4}', re.IGNORECASE)
+
+# 标题行：行首的小节标题（其后到冒号前最多40个字符，或标题单独成行），
+# 或者任意"单词:"/单独一个单词的行——后者不属于任何字段，只作为上一小节的结束位置
+HEADING_LINE_RE = re.compile(
+    r'^[ \t]*(?:'
+    + '|'.join(
+        f'(?P<{field}_{priority}>{pattern})'
+        for field, patterns in SECTION_HEADINGS.items()
+        for priority, pattern in enumerate(patterns)
+    )
+    + r')(?:[^\n:：]{0,40}[:：]|[ \t\r]*$)'
+    + r'|^[ \t]*[A-Za-z]{2,}[ \t]*(?:[:：]|\r?$)',
+    re.IGNORECASE | re.MULTILINE
+)
+
+LIST_MARKER_RE = re.compile(r'^(?:[-•*]\s*)?(?:\d+\.\s*)?')
+MAX_LIST_ITEMS = 10
+
+
+class SectionScanner:
+    """课程文本的单遍小节扫描器
+
+    小节标题只在行首识别，所有标题行由HEADING_LINE_RE一次遍历找出，
+    小节内容为标题之后到下一个标题行之前的文本，因此耗时与文本长度成线性关系，不会因回溯而变慢。
+    所有小节的英文标题都已找到且其后出现了下一个标题行时停止扫描。
+    文本可以按页多次feed()（各页之间视为换行），已扫描的部分不再重复扫描。
+    """
+
+    def __init__(self):
+        self._pages = []      # 已输入的各页文本
+        self._offsets = []    # 各页在全文中的起始位置
+        self.length = 0
+        self._title = None
+        self._title_tail = ''  # 课程代码之后只有空白时，保留代码所在的末尾文本与后续页面一起匹配
+        self._headings = {}   # (字段, 优先级) -> (标题行起始位置, 内容起始位置)
+        self._boundaries = []  # 所有标题行的起始位置（递增）
+        self._unresolved = set(SECTION_HEADINGS)  # 尚未确定的小节
+        self._open = []       # 已找到英文标题、尚未出现下一个标题行的小节
+
+    def feed(self, text: str):
+        """追加一页文本"""
+        offset = self.length + 1 if self._pages else 0
+        self._pages.append(text)
+        self._offsets.append(offset)
+        self.length = offset + len(text)
+
+        if self._title is None:
+            self._scan_title(text)
+
+        if not self._unresolved:
+            return
+        for match in HEADING_LINE_RE.finditer(text):
+            start = offset + match.start()
+            self._boundaries.append(start)
+            if self._open:
+                self._unresolved.difference_update(self._open)
+                self._open = []
+                if not self._unresolved:
+                    break
+            if match.lastgroup is None:
+                continue
+            field, priority = match.lastgroup.rsplit('_', 1)
+            key = (field, int(priority))
+            if key not in self._headings:
+                self._headings[key] = (start, offset + match.end())
+                if key[1] == 0:
+                    self._open.append(field)
+
+    def _scan_title(self, text: str):
+        segment = f"{self._title_tail}\n{text}" if self._title_tail else text
+        match = COURSE_TITLE_RE.search(segment)
+        if match:
+            self._title = (match.group(1).upper(), match.group(2).strip())
+            self._title_tail = ''
+            return
+        # 没有匹配时每个课程代码之后都只剩空白与分隔符，保留第一个代码起的文本（去掉末尾空白）
+        code = COURSE_CODE_RE.search(segment)
+        self._title_tail = segment[code.start():].rstrip() if code else ''
+
+    def is_final(self, field: str) -> bool:
+        """字段的值是否不会再因后续页面而改变
+
+        课程代码与名称在找到后即确定；小节需要找到英文标题且其后已出现下一个标题行。
+        只有中文标题时，后续页面中的英文标题仍会取代它，因此要到全文读完才能确定。
+        """
+        if field in ('course_code', 'course_name'):
+            return self._title is not None
+        return field not in self._unresolved
+
+    def value(self, field: str):
+        if field == 'course_code':
+            return self._title[0] if self._title else ''
+        if field == 'course_name':
+            return self._title[1] if self._title else ''
+
+        heading = self._headings.get((field, 0)) or self._headings.get((field, 1))
+        if heading is None:
+            return '' if field == 'description' else []
+        body = self._slice(heading[1], self._next_boundary(heading[1])).strip()
+        return body if field == 'description' else extract_list_items(body)
+
+    def course_info(self) -> Dict:
+        course_info = {field: self.value(field) for field in COURSE_FIELDS}
+        course_info['textbooks'] = []
+        return course_info
+
+    def _next_boundary(self, position: int) -> int:
+        """position之后第一个标题行的起始位置，没有时为全文末尾"""
+        index = bisect_right(self._boundaries, position)
+        return self._boundaries[index] if index < len(self._boundaries) else self.length
+
+    def _slice(self, start: int, stop: int) -> str:
+        """按全文位置截取文本，可以跨页"""
+        first = bisect_right(self._offsets, start) - 1
+        parts = []
+        for index in range(first, len(self._pages)):
+            offset = self._offsets[index]
+            if offset >= stop:
+                break
+            parts.append(self._pages[index][max(start - offset, 0):stop - offset])
+        return '\n'.join(parts)
+
+
+def scan_course_text(text: str) -> SectionScanner:
+    scanner = SectionScanner()
+    scanner.feed(text)
+    return scanner
+
+
+def extract_list_items(text: str, limit: int = MAX_LIST_ITEMS) -> List[str]:
+    """从文本中提取列表项（去掉行首的列表标记与编号），最多limit项"""
+    items = []
+    for line in text.split('\n'):
+        cleaned_line = LIST_MARKER_RE.sub('', line.strip(), count=1)
+        if len(cleaned_line) > 3:
+            items.append(cleaned_line)
+            if len(items) >= limit:
+                break
+    return items
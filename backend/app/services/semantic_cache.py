@@ -0,0 +1,208 @@
+import re
+import math
+import time
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.advice_cache import register_invalidation_listener
+
+# 上下文中需要分桶的平均分行
+_AVERAGE_LINE = re.compile(r'^(\s*(?:相关课程)?平均成绩\s*:\s*)(\d+(?:\.\d+)?)\s*$', re.MULTILINE)
+# 学生画像字段：整行作为特征，必须一致才会被视为相似
+_PROFILE_FIELDS = ('专业', '年级', '平均成绩', '相关课程平均成绩')
+
+
+def normalize_context(context: str, bucket_size: int = 5) -> str:
+    """将平均分归入bucket_size分宽的区间，使相似学生的上下文一致"""
+    def bucket(match):
+        low = int(math.floor(float(match.group(2)) / bucket_size) * bucket_size)
+        return f"{match.group(1)}{low}-{low + bucket_size}"
+
+    context = _AVERAGE_LINE.sub(bucket, context)
+    return '\n'.join(line.strip() for line in context.splitlines() if line.strip())
+
+
+def split_context(context: str, bucket_size: int = 5) -> Tuple[List[str], str]:
+    """将规范化后的上下文拆为学生画像行（专业、年级、分桶后的平均分）和其余的课程内容"""
+    profile, content = [], []
+    for line in normalize_context(context, bucket_size).splitlines():
+        field = line.split(':', 1)[0].strip()
+        (profile if field in _PROFILE_FIELDS else content).append(line)
+    return profile or ['<无学生画像>'], '\n'.join(content)
+
+
+class SemanticAdviceCache:
+    """语义近似建议缓存
+
+    相同课程（及相同模型提供方、提示词版本）下，上下文向量由两部分拼接：学生画像行整行作为特征，
+    课程内容取字符n-gram哈希特征，两部分各自L2归一化后按profile_weight加权，
+    因此余弦相似度 = profile_weight * 画像相似度 + (1 - profile_weight) * 内容相似度。
+    向量存入稀疏矩阵，查询时最高相似度不低于threshold则复用其建议文本。
+    仅保存在进程内，条目最多保留ttl_seconds秒。
+    """
+
+    def __init__(self, threshold: float = 0.9, bucket_size: int = 5, ttl_seconds: int = 600,
+                 max_entries_per_course: int = 256, profile_weight: float = 0.5, n_features: int = 2 ** 18):
+        self.threshold = threshold
+        self.bucket_size = bucket_size
+        self.profile_weight = profile_weight
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_course = max_entries_per_course
+        self.n_features = n_features
+
+        self._vectorizer = None
+        self._lock = threading.Lock()
+        self._namespaces = {}  # (course_id, provider, template_version) -> {'rows', 'entries', 'matrix'}
+        self._counters = {'lookups': 0, 'hits': 0, 'misses': 0, 'empty_lookups': 0, 'invalidations': 0}
+        self._hit_similarities = deque(maxlen=500)
+        self._miss_similarities = deque(maxlen=500)
+        register_invalidation_listener(self)
+
+    @property
+    def vectorizer(self):
+        """(画像向量器, 内容向量器)，首次使用时再导入sklearn"""
+        if self._vectorizer is None:
+            from sklearn.feature_extraction.text import HashingVectorizer
+            profile = HashingVectorizer(
+                n_features=self.n_features,
+                analyzer=lambda lines: lines,
+                alternate_sign=False,
+                norm='l2'
+            )
+            content = HashingVectorizer(
+                n_features=self.n_features,
+                analyzer='char_wb',
+                ngram_range=(2, 3),
+                alternate_sign=False,
+                norm='l2'
+            )
+            self._vectorizer = (profile, content)
+        return self._vectorizer
+
+    def lookup(self, namespace: Tuple, context: str) -> Tuple[Optional[Dict], float]:
+        """查找最相似的已存建议，返回(建议, 相似度)；未达到阈值时建议为None"""
+        vector = self._vectorize(context)
+        now = time.time()
+        with self._lock:
+            self._counters['lookups'] += 1
+            space = self._namespaces.get(namespace)
+            if not space or not space['entries']:
+                self._counters['empty_lookups'] += 1
+                self._counters['misses'] += 1
+                return None, 0.0
+
+            if space['matrix'] is None:
+                import scipy.sparse as sp
+                space['matrix'] = sp.vstack(space['rows'], format='csr')
+            similarities = space['matrix'].dot(vector.T).toarray().ravel()
+            expires = np.fromiter((entry[0] for entry in space['entries']), dtype=np.float64,
+                                  count=len(space['entries']))
+            similarities[expires <= now] = -1.0
+
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity >= self.threshold:
+                self._counters['hits'] += 1
+                self._hit_similarities.append(similarity)
+                return space['entries'][best][3], similarity
+
+            self._counters['misses'] += 1
+            if similarity >= 0:
+                self._miss_similarities.append(similarity)
+            return None, max(similarity, 0.0)
+
+    def add(self, namespace: Tuple, context: str, value: Dict, student_id: Optional[str] = None):
+        """保存模型生成的建议"""
+        vector = self._vectorize(context)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            space = self._namespaces.setdefault(namespace, {'rows': [], 'entries': [], 'matrix': None})
+            space['rows'].append(vector)
+            space['entries'].append((expires_at, student_id, namespace[0], value))
+
+            # 超出容量时先淘汰过期条目，再淘汰最早的条目
+            if len(space['entries']) > self.max_entries_per_course:
+                now = time.time()
+                keep = [i for i, entry in enumerate(space['entries']) if entry[0] > now]
+                keep = keep[-self.max_entries_per_course:]
+                space['rows'] = [space['rows'][i] for i in keep]
+                space['entries'] = [space['entries'][i] for i in keep]
+            space['matrix'] = None
+
+    def invalidate(self, student_id: Optional[str] = None, course_id: Optional[str] = None,
+                   local_only: bool = False, student_ids: Optional[Iterable[str]] = None) -> int:
+        """移除由这些学生生成或属于该课程的条目，返回移除的条目数"""
+        students = set(student_ids or ())
+        if student_id is not None:
+            students.add(student_id)
+        if not students and course_id is None:
+            return 0
+
+        removed = 0
+        with self._lock:
+            for namespace in list(self._namespaces):
+                space = self._namespaces[namespace]
+                keep = [
+                    i for i, (_, entry_student, entry_course, _) in enumerate(space['entries'])
+                    if not (entry_student in students
+                            or (course_id is not None and entry_course == course_id))
+                ]
+                if len(keep) == len(space['entries']):
+                    continue
+                removed += len(space['entries']) - len(keep)
+                if keep:
+                    space['rows'] = [space['rows'][i] for i in keep]
+                    space['entries'] = [space['entries'][i] for i in keep]
+                    space['matrix'] = None
+                else:
+                    del self._namespaces[namespace]
+            self._counters['invalidations'] += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._namespaces.clear()
+
+    def stats(self) -> Dict:
+        """命中率与相似度分布，用于调整阈值"""
+        with self._lock:
+            counters = dict(self._counters)
+            hit_similarities = list(self._hit_similarities)
+            miss_similarities = list(self._miss_similarities)
+            entries = sum(len(space['entries']) for space in self._namespaces.values())
+            namespaces = len(self._namespaces)
+
+        counters.update({
+            'hit_rate': round(counters['hits'] / counters['lookups'], 4) if counters['lookups'] else 0.0,
+            'threshold': self.threshold,
+            'entries': entries,
+            'courses': namespaces,
+            'hit_similarity': _distribution(hit_similarities),
+            'miss_similarity': _distribution(miss_similarities)
+        })
+        return counters
+
+    def _vectorize(self, context: str):
+        import scipy.sparse as sp
+        profile_vectorizer, content_vectorizer = self.vectorizer
+        profile, content = split_context(context, self.bucket_size)
+        return sp.hstack([
+            profile_vectorizer.transform([profile]) * math.sqrt(self.profile_weight),
+            content_vectorizer.transform([content]) * math.sqrt(1.0 - self.profile_weight)
+        ], format='csr')
+
+
+def _distribution(values) -> Dict:
+    if not values:
+        return {'count': 0}
+    array = np.asarray(values)
+    return {
+        'count': int(array.size),
+        'mean': round(float(array.mean()), 4),
+        'p10': round(float(np.percentile(array, 10)), 4),
+        'p50': round(float(np.percentile(array, 50)), 4),
+        'p90': round(float(np.percentile(array, 90)), 4)
+    }
\ No newline at end of file
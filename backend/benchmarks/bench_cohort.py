@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+群体成绩分析基准测试
+对比逐个学生分析（与analyze_performance相同的计算）和从聚合返回的列数组做向量化计算在不同规模下的耗时；
+可选地用mongomock测量包含数据库读取的端到端耗时
+
+用法: cd backend && python benchmarks/bench_cohort.py [--sizes 1000,10000,100000] [--mongomock 10000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.analytics_service import (  # noqa: E402
+    TREND_WINDOW, classify_trend, compute_cohort, recent_matrix, recommendations_for
+)
+from app.services.grade_stats import RECENT_WINDOW, average_score, recent_average  # noqa: E402
+
+
+def make_stats(n, seed=0):
+    """生成n个学生的grade_stats"""
+    rng = random.Random(seed)
+    all_stats = []
+    for _ in range(n):
+        count = rng.randint(0, 40)
+        scores = [rng.randint(35, 100) for _ in range(min(count, RECENT_WINDOW))]
+        total = sum(scores) + sum(rng.randint(35, 100) for _ in range(count - len(scores)))
+        all_stats.append({'count': count, 'sum': total, 'recent': scores})
+    return all_stats
+
+
+def loop_analysis(all_stats):
+    results = []
+    for stats in all_stats:
+        average = average_score(stats)
+        if average is None:
+            results.append(None)
+            continue
+        recent = recent_average(stats, TREND_WINDOW)
+        results.append((average, classify_trend(recent, average), recommendations_for(average)))
+    return results
+
+
+def make_columns(all_stats):
+    """CohortAnalytics的聚合返回的列数组（最近成绩已在数据库端截取）"""
+    return (
+        [s['count'] for s in all_stats],
+        [s['sum'] for s in all_stats],
+        [s['recent'][-TREND_WINDOW:] for s in all_stats]
+    )
+
+
+def vectorized_analysis(columns):
+    counts, sums, recent = columns
+    return compute_cohort(
+        np.asarray(counts, dtype=np.float64), np.asarray(sums, dtype=np.float64), recent_matrix(recent)
+    )
+
+
+def timed(fn, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_mongomock(n):
+    import mongomock
+    from app.services.analytics_service import CohortAnalytics
+
+    db = mongomock.MongoClient().db
+    db.students.insert_many([
+        {'name': f'学生{i}', 'student_id': str(i), 'major': 'CS', 'grade_stats': stats}
+        for i, stats in enumerate(make_stats(n))
+    ])
+    analytics = CohortAnalytics(db)
+    return timed(lambda: analytics.analyze(major='CS', include_students=False), repeat=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='群体成绩分析基准测试')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='学生数量，逗号分隔')
+    parser.add_argument('--mongomock', type=int, default=0, help='用mongomock测量端到端耗时的学生数量（0为跳过）')
+    args = parser.parse_args()
+
+    print(f"{'学生数':>10}{'逐个分析(ms)':>16}{'向量化(ms)':>14}{'加速比':>10}")
+    for n in [int(size) for size in args.sizes.split(',')]:
+        all_stats = make_stats(n)
+        loop_time = timed(loop_analysis, all_stats)
+        vector_time = timed(vectorized_analysis, make_columns(all_stats))
+        print(f"{n:>10}{loop_time * 1000:>16.1f}{vector_time * 1000:>14.1f}{loop_time / vector_time:>10.1f}x")
+
+    if args.mongomock:
+        elapsed = bench_mongomock(args.mongomock)
+        print(f"\nmongomock端到端（{args.mongomock}名学生，仅汇总）: {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+课程相似度矩阵基准测试
+生成n门合成课程，测量全量构建、单门课程增量更新（同一写入方连续更新，以及其他写入方更新之后），
+以及新进程（内存映射）中前k查询的耗时。相似度来自课程相关度索引，
+课程相关度索引默认使用mongomock，指定--mongodb-uri时使用独立的测试数据库（结束后删除）
+
+用法: cd backend && python benchmarks/bench_course_similarity.py [--courses 10000] [--queries 1000] [--mongodb-uri mongodb://localhost:27017]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.course_relations import CourseRelationIndex  # noqa: E402
+from app.services.course_similarity import CourseSimilarityMatrix  # noqa: E402
+
+WORDS = [
+    'learning', 'network', 'graph', 'tree', 'database', 'query', 'compiler', 'parser', 'security', 'crypto',
+    'vision', 'image', 'language', 'model', 'statistics', 'probability', 'algebra', 'calculus', 'system',
+    'kernel', 'memory', 'cache', 'distributed', 'cloud', 'web', 'design', 'software', 'testing', 'robot',
+    'control', 'signal', 'circuit', 'optimization', 'search', 'logic', 'theory', 'complexity', 'data'
+]
+
+
+def make_courses(n, seed=0):
+    rng = random.Random(seed)
+    courses = []
+    for i in range(n):
+        words = rng.sample(WORDS, 8) + [f'topic{rng.randint(0, n // 10)}' for _ in range(4)]
+        courses.append({
+            '_id': str(i),
+            'course_code': f'C{i:06d}',
+            'course_name': f'课程{i}',
+            'description': ' '.join(words),
+            'topics': words[:3],
+            'objectives': []
+        })
+    return courses
+
+
+def open_db(uri):
+    if uri is None:
+        import mongomock
+        return None, mongomock.MongoClient().db
+    from pymongo import MongoClient
+    client = MongoClient(uri, serverSelectionTimeoutMS=3000)
+    client.drop_database('bench_course_similarity')
+    return client, client['bench_course_similarity']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='课程相似度矩阵基准测试')
+    parser.add_argument('--courses', type=int, default=10000, help='课程数量')
+    parser.add_argument('--queries', type=int, default=1000, help='查询次数')
+    parser.add_argument('--mongodb-uri', default=None, help='MongoDB地址（不指定则使用mongomock）')
+    args = parser.parse_args()
+
+    courses = make_courses(args.courses)
+    client, db = open_db(args.mongodb_uri)
+    try:
+        db.courses.insert_many([dict(course) for course in courses])
+        relations = CourseRelationIndex(db, k=10)
+        start = time.perf_counter()
+        relations.rebuild()
+        print(f"课程相关度索引全量构建: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        with tempfile.TemporaryDirectory() as directory:
+            bench_matrix(directory, relations, courses, args.queries)
+    finally:
+        if client is not None:
+            client.drop_database(db.name)
+
+
+def bench_matrix(directory, relations, courses, queries):
+    matrix = CourseSimilarityMatrix(directory, relations, k=20)
+
+    start = time.perf_counter()
+    matrix.rebuild(courses)
+    print(f"全量构建 {len(courses)} 门课程: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    relation_times, update_times = [], []
+    for course in courses[:20]:
+        updated = dict(course, description='database query cache memory system kernel ' + course['description'])
+        start = time.perf_counter()
+        relations.update_course(updated)
+        relation_times.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        matrix.update_course(updated, course_id=updated['_id'])
+        update_times.append((time.perf_counter() - start) * 1000)
+    print(f"单门课程增量更新: 相关度索引 中位数 {statistics.median(relation_times):.0f} ms, "
+          f"相似度矩阵（复用相关度索引的加权矩阵，追加到log.jsonl） 中位数 {statistics.median(update_times):.0f} ms")
+
+    # 另一个写入方追加更新后，本实例需要重新读取版本目录并重放log.jsonl
+    other = CourseSimilarityMatrix(directory, relations, k=20)
+    changed = dict(courses[1], description='compiler parser')
+    relations.update_course(changed)
+    other.update_course(changed, course_id=courses[1]['_id'])
+    changed = dict(courses[2], description='robot control')
+    relations.update_course(changed)
+    start = time.perf_counter()
+    matrix.update_course(changed, course_id=courses[2]['_id'])
+    print(f"其他写入方更新后的增量更新: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    # 模拟另一个worker：新实例通过内存映射读取
+    reader = CourseSimilarityMatrix(directory, relations, k=20)
+    start = time.perf_counter()
+    reader.similar(courses[0]['course_code'])
+    print(f"新实例首次查询（含映射）: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    rng = random.Random(1)
+    latencies = []
+    for _ in range(queries):
+        code = courses[rng.randrange(len(courses))]['course_code']
+        start = time.perf_counter()
+        reader.similar(code, k=10)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(f"前10查询: 中位数 {statistics.median(latencies):.3f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+成绩批量导入基准测试
+测量CSV逐行读取与校验的吞吐量；指定MongoDB时对比逐条add_grade与GradeImporter批量导入的每秒行数
+（使用独立的测试数据库，结束后删除）
+
+用法: cd backend && python benchmarks/bench_grade_import.py [--rows 50000] [--students 5000] [--mongodb-uri mongodb://localhost:27017]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.grade_import import GradeImporter, parse_grade_row, read_grade_rows  # noqa: E402
+from app.services.grade_stats import compute_grade_stats  # noqa: E402
+
+COURSES = [f'CS{code}' for code in range(3001, 3041)] + [f'MA{code}' for code in range(2001, 2011)]
+
+
+def make_csv(rows, students, seed=0):
+    """生成rows行成绩，学号为 S000000 ~ S{students-1}"""
+    rng = random.Random(seed)
+    lines = ['student_id,course,score,semester,year']
+    for _ in range(rows):
+        year = rng.choice(('2023', '2024'))
+        lines.append(f"S{rng.randrange(students):06d},{rng.choice(COURSES)},{rng.randint(35, 100)},{year}秋,{year}")
+    return '\n'.join(lines).encode('utf-8')
+
+
+def bench_parse(content):
+    start = time.perf_counter()
+    count = 0
+    for _, row, _ in read_grade_rows(io.BytesIO(content), 'csv'):
+        parse_grade_row(row)
+        count += 1
+    return count, time.perf_counter() - start
+
+
+def bench_mongodb(uri, content, students, per_row_limit):
+    from pymongo import MongoClient
+    from app.models.student import Student
+
+    client = MongoClient(uri, serverSelectionTimeoutMS=3000)
+    db = client['bench_grade_import']
+    client.drop_database(db.name)
+    try:
+        student_model = Student(db)
+        student_model.grade_buckets.ensure_indexes()
+        db.students.create_index('student_id', unique=True)
+        result = db.students.insert_many([
+            {'student_id': f'S{i:06d}', 'name': f'学生{i}', 'grade_stats': compute_grade_stats([])}
+            for i in range(students)
+        ])
+        ids = dict(zip((f'S{i:06d}' for i in range(students)), result.inserted_ids))
+
+        rows = [parse_grade_row(row) for _, row, _ in read_grade_rows(io.BytesIO(content), 'csv')]
+        start = time.perf_counter()
+        for grade in rows[:per_row_limit]:
+            student_model.add_grade(str(ids[grade.pop('student_id')]), grade)
+        per_row = per_row_limit / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        lines = list(GradeImporter(db).import_file(io.BytesIO(content), 'csv'))
+        elapsed = time.perf_counter() - start
+        return per_row, lines[-1]['summary'], elapsed
+    finally:
+        client.drop_database(db.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='成绩批量导入基准测试')
+    parser.add_argument('--rows', type=int, default=50000, help='成绩行数')
+    parser.add_argument('--students', type=int, default=5000, help='学生数量')
+    parser.add_argument('--mongodb-uri', default=None, help='MongoDB地址（不指定则只测读取与校验）')
+    parser.add_argument('--per-row', type=int, default=2000, help='逐条add_grade写入的行数')
+    args = parser.parse_args()
+
+    content = make_csv(args.rows, args.students)
+    count, elapsed = bench_parse(content)
+    print(f"读取与校验: {count}行 {elapsed * 1000:.0f} ms（{count / elapsed:,.0f} 行/秒）")
+
+    if args.mongodb_uri:
+        per_row, summary, elapsed = bench_mongodb(args.mongodb_uri, content, args.students, args.per_row)
+        print(f"逐条add_grade: {per_row:,.0f} 行/秒（{args.per_row}行）")
+        print(f"GradeImporter: {summary['imported']}行 {elapsed * 1000:.0f} ms（{summary['imported'] / elapsed:,.0f} 行/秒）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+课程文本小节解析基准测试
+对比原先每个字段一次DOTALL惰性匹配re.search（最多十次，每次重新查找整篇文本）与SectionScanner单遍扫描，
+在1–10 MB的合成文本上的耗时：
+- handbook: 格式规范的课程手册（多门课程的小节依次重复），所有小节在开头即可确定
+- handbook-no-assessment: 同上但没有评估方式小节，两种实现都要查找整篇文本
+- messy: 格式混乱的文本（正文中频繁出现小节关键词，但没有可以结束小节的标题行），原实现在此类文本上出现大量回溯
+
+原实现的耗时随文本增长远快于线性，默认只在不超过--legacy-max-mb的输入上运行。
+
+用法: cd backend && python benchmarks/bench_section_scanner.py [--sizes 1,2,5,10] [--legacy-max-mb 0.1]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.pdf_service import PDFService  # noqa: E402
+
+LEGACY_TITLE_PATTERN = r'([A-Z]{2,4}\d{4})\s*[-:]?\s*(.+?)(?:\n|$)'
+LEGACY_END = r'(?=\n\s*(?:[A-Z][a-z]+\s*[:\n]|$))'
+LEGACY_SECTION_PATTERNS = {
+    'description': [r'(?:Course\s+Description|Description)[:\s]*\n?(.*?)' + LEGACY_END,
+                    r'(?:课程描述|描述)[：:\s]*\n?(.*?)' + LEGACY_END],
+    'objectives': [r'(?:Learning\s+Objectives?|Objectives?)[:\s]*\n?(.*?)' + LEGACY_END,
+                   r'(?:学习目标|目标)[：:\s]*\n?(.*?)' + LEGACY_END],
+    'topics': [r'(?:Topics?|Syllabus|Content)[:\s]*\n?(.*?)' + LEGACY_END,
+               r'(?:主题|大纲|内容)[：:\s]*\n?(.*?)' + LEGACY_END],
+    'prerequisites': [r'(?:Prerequisites?|Pre-requisites?)[:\s]*\n?(.*?)' + LEGACY_END,
+                      r'(?:先修课程|前置课程)[：:\s]*\n?(.*?)' + LEGACY_END],
+    'assessment': [r'(?:Assessment|Evaluation|Grading)[:\s]*\n?(.*?)' + LEGACY_END,
+                   r'(?:评估|考核|成绩评定)[：:\s]*\n?(.*?)' + LEGACY_END]
+}
+
+
+def legacy_parse(pdf_service, text):
+    # 原先的实现：标题一次re.search，每个字段依次尝试英文、中文模式
+    course_info = {}
+    match = re.search(LEGACY_TITLE_PATTERN, text, re.IGNORECASE)
+    if match:
+        course_info['course_code'] = match.group(1).upper()
+    for field, patterns in LEGACY_SECTION_PATTERNS.items():
+        for pattern in patterns:
+            match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+            if match:
+                value = match.group(1).strip()
+                course_info[field] = value if field == 'description' else pdf_service._extract_list_items(value)
+                break
+    return course_info
+
+
+def handbook_text(size, assessment=True):
+    course = (
+        "CS5187: Vision and Image\n"
+        "Course Description:\nThis course introduces algorithms in computer vision and image processing.\n"
+        "Learning Objectives:\n- Perform low-level image processing\n- Apply computer vision algorithms\n"
+        "Topics:\n1. Feature extraction\n2. Image segmentation\n3. Object recognition\n"
+        "Prerequisites:\n- CS3334 Data Structures\n"
+        "Assessment:\n- Assignments 30%\n- Project 20%\n- Final exam 50%\n"
+        "Textbooks:\n- Computer Vision: Algorithms and Applications\n\n"
+    )
+    if not assessment:
+        course = course.replace("Assessment:\n", "Marks:\n")
+    return (course * (size // len(course) + 1))[:size]
+
+
+def messy_text(size):
+    # 无换行的长行与小写关键词，没有能结束小节的"单词:"标题行
+    line = ("the content and description of each topic covers evaluation of objectives with "
+            "grading for assessment and prerequisites within the syllabus " * 4) + "\n"
+    return ("CS5187 Vision and Image\nDescription " + line * (size // len(line) + 1))[:size]
+
+
+def measure(function, pdf_service, text):
+    start = time.perf_counter()
+    result = function(pdf_service, text)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='课程文本小节解析基准测试')
+    parser.add_argument('--sizes', default='1,2,5,10', help='输入大小（MB，逗号分隔）')
+    parser.add_argument('--legacy-max-mb', type=float, default=0.1, help='原实现运行的最大输入大小（MB）')
+    args = parser.parse_args()
+
+    pdf_service = PDFService()
+    sizes = [float(size) for size in args.sizes.split(',')]
+    inputs = (
+        ('handbook', handbook_text),
+        ('handbook-no-assessment', lambda size: handbook_text(size, assessment=False)),
+        ('messy', messy_text)
+    )
+    for name, generate in inputs:
+        for size_mb in sizes:
+            text = generate(int(size_mb * 1024 * 1024))
+            scanner_time, _ = measure(lambda service, value: service.parse_course_description(value), pdf_service, text)
+            line = f"{name:22s} {size_mb:5.2f} MB: 单遍扫描 {scanner_time * 1000:8.1f} ms ({size_mb / scanner_time:6.1f} MB/s)"
+            if size_mb <= args.legacy_max_mb:
+                legacy_time, _ = measure(legacy_parse, pdf_service, text)
+                line += f", 原实现 {legacy_time * 1000:9.1f} ms"
+            print(line, flush=True)
+
+
+if __name__ == '__main__':
+    main()
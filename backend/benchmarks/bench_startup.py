@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+worker启动耗时基准测试
+每轮在新的Python进程中测量：导入app、create_app()、首个请求延迟，以及各服务首次创建的耗时
+
+用法: cd backend && python benchmarks/bench_startup.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import app as app_package
+t1 = time.perf_counter()
+application = app_package.create_app()
+t2 = time.perf_counter()
+client = application.test_client()
+client.get('/health')
+t3 = time.perf_counter()
+client.get('/api/rag/admin/providers')
+t4 = time.perf_counter()
+services = {}
+with application.app_context():
+    for name in ('pdf_service', 'retrieval_index', 'advice_cache'):
+        start = time.perf_counter()
+        application.extensions['services'].get(name)
+        services[name] = time.perf_counter() - start
+print(json.dumps({
+    'import_app': t1 - t0,
+    'create_app': t2 - t1,
+    'first_request_health': t3 - t2,
+    'first_request_rag_service': t4 - t3,
+    'service_pdf_service': services['pdf_service'],
+    'service_retrieval_index': services['retrieval_index'],
+    'service_advice_cache': services['advice_cache'],
+}))
+'''
+
+
+def run_probe():
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='worker启动耗时基准测试')
+    parser.add_argument('--runs', type=int, default=5, help='测量轮数')
+    args = parser.parse_args()
+
+    samples = [run_probe() for _ in range(args.runs)]
+
+    print(f"{'阶段':<28}{'中位数(ms)':>12}{'最大值(ms)':>12}")
+    for key in samples[0]:
+        values = [sample[key] * 1000 for sample in samples]
+        print(f"{key:<28}{statistics.median(values):>12.1f}{max(values):>12.1f}")
+
+    ready = [(s['import_app'] + s['create_app'] + s['first_request_health']) * 1000 for s in samples]
+    print(f"\n可以响应首个请求的耗时（中位数）: {statistics.median(ready):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
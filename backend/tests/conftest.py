@@ -1,6 +1,8 @@
+import inspect
 import pytest
 import tempfile
 import os
+from io import BytesIO
 from fastapi.testclient import TestClient
 from app.main import app
 
@@ -20,4 +22,54 @@ def temp_file():
     
     # 清理
     if os.path.exists(temp_path):
-        os.unlink(temp_path)
\ No newline at end of file
+        os.unlink(temp_path)
+
+@pytest.fixture
+def course_pdf():
+    """生成每行文本各占一行的单页PDF"""
+    def build(lines) -> bytes:
+        import PyPDF2
+        from PyPDF2 import PageObject
+        from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+        writer = PyPDF2.PdfWriter()
+        page = PageObject.create_blank_page(width=400, height=400)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): writer._add_object(DictionaryObject({
+                NameObject('/Type'): NameObject('/Font'),
+                NameObject('/Subtype'): NameObject('/Type1'),
+                NameObject('/BaseFont'): NameObject('/Helvetica')
+            }))})
+        })
+        commands = ['BT /F1 10 Tf 20 380 Td 14 TL']
+        commands.extend(f"({line}) Tj T*" for line in lines)
+        commands.append('ET')
+        content = DecodedStreamObject()
+        content.set_data('\n'.join(commands).encode())
+        page[NameObject('/Contents')] = writer._add_object(content)
+        writer.add_page(page)
+        output = BytesIO()
+        writer.write(output)
+        return output.getvalue()
+    
+    return build
+
+def _accept_bulk_sort():
+    """pymongo 4.9+的UpdateOne/ReplaceOne向bulk构造器传入sort参数，mongomock 4.3的构造器不接受该参数；
+    测试中的批量写入都不使用sort，为缺少该参数的构造器方法忽略它"""
+    try:
+        from mongomock.collection import BulkOperationBuilder
+    except ImportError:
+        return
+    for name in ('add_update', 'add_replace'):
+        original = getattr(BulkOperationBuilder, name)
+        if 'sort' in inspect.signature(original).parameters:
+            continue
+
+        def accept_sort(self, *args, _original=original, sort=None, **kwargs):
+            if sort is not None:
+                raise NotImplementedError('mongomock不支持批量写入中的sort')
+            return _original(self, *args, **kwargs)
+
+        setattr(BulkOperationBuilder, name, accept_sort)
+
+_accept_bulk_sort()
@@ -0,0 +1,66 @@
+import pytest
+from app.services.advice_cache import AdviceCache, invalidate_advice_cache
+from app.services.rag_service import RAGService
+
+class TestAdviceCache:
+    def setup_method(self):
+        self.cache = AdviceCache(maxsize=2)
+
+    def test_make_key_normalizes_whitespace(self):
+        """测试缓存键忽略空白差异"""
+        key1 = AdviceCache.make_key("专业: 计算机\n\n平均成绩:  85.00", 'gemini', '1')
+        key2 = AdviceCache.make_key("专业: 计算机\n平均成绩: 85.00  ", 'gemini', '1')
+        key3 = AdviceCache.make_key("专业: 计算机\n平均成绩: 85.00", 'gemini', '2')
+
+        assert key1 == key2
+        assert key1 != key3
+
+    def test_lru_eviction_and_counters(self):
+        """测试LRU淘汰和命中统计"""
+        self.cache.set('a', {'advice': 'A'})
+        self.cache.set('b', {'advice': 'B'})
+        assert self.cache.get('a') == {'advice': 'A'}
+
+        self.cache.set('c', {'advice': 'C'})
+        assert self.cache.get('b') is None
+        assert self.cache.get('c') == {'advice': 'C'}
+
+        stats = self.cache.stats()
+        assert stats['hits'] == 2
+        assert stats['misses'] == 1
+        assert stats['memory_entries'] == 2
+
+    def test_targeted_invalidation(self):
+        """测试仅失效受影响的学生或课程"""
+        self.cache.set('a', {'advice': 'A'}, student_id='s1', course_id='c1')
+        self.cache.set('b', {'advice': 'B'}, student_id='s2', course_id='c2')
+
+        invalidate_advice_cache(None, student_id='s1')
+        assert self.cache.get('a') is None
+        assert self.cache.get('b') is not None
+
+        invalidate_advice_cache(None, course_id='c2')
+        assert self.cache.get('b') is None
+
+    def test_generate_learning_advice_uses_cache(self):
+        """测试重复请求命中缓存，备用建议不缓存"""
+        rag_service = RAGService()
+        calls = []
+
+        def fake_llm(context):
+            calls.append(context)
+            return '建议'
+
+        rag_service._request_llm_advice = fake_llm
+        student = {'_id': 's1', 'name': '张三', 'grades': [{'course': 'CS3001', 'score': 80}]}
+        course = {'_id': 'c1', 'course_code': 'CS5187', 'topics': ['AI']}
+
+        first = rag_service.generate_learning_advice(student, course, advice_cache=self.cache)
+        second = rag_service.generate_learning_advice(student, course, advice_cache=self.cache)
+        assert first == second
+        assert len(calls) == 1
+
+        rag_service._request_llm_advice = lambda context: None
+        other_course = {'_id': 'c2', 'course_code': 'CS6000'}
+        rag_service.generate_learning_advice(student, other_course, advice_cache=self.cache)
+        assert self.cache.stats()['memory_entries'] == 1
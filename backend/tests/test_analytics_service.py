@@ -0,0 +1,68 @@
+import random
+import numpy as np
+import pytest
+from app.services.analytics_service import (
+    TREND_WINDOW, classify_trend, compute_cohort, recent_matrix, recommendations_for, trend_name,
+    RECOMMENDATION_BUCKETS
+)
+from app.services.grade_stats import compute_grade_stats, average_score, recent_average
+
+mongomock = pytest.importorskip('mongomock')
+
+from app.models.student import Student
+from app.services.analytics_service import CohortAnalytics
+
+
+class TestCohortAnalytics:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+        self.student_model = Student(self.db)
+
+    def test_vectorized_matches_single_student_analysis(self):
+        """测试向量化结果与逐个学生分析的结果一致"""
+        rng = random.Random(7)
+        all_stats = []
+        for _ in range(200):
+            grades = [{'course': 'CS1001', 'score': rng.randint(40, 100)} for _ in range(rng.randint(0, 8))]
+            all_stats.append(compute_grade_stats(grades))
+
+        counts = np.array([s['count'] for s in all_stats])
+        sums = np.array([s['sum'] for s in all_stats])
+        result = compute_cohort(counts, sums, recent_matrix([s['recent'] for s in all_stats]))
+
+        for i, stats in enumerate(all_stats):
+            average = average_score(stats)
+            if average is None:
+                assert trend_name(result['trend'][i]) == 'insufficient_data'
+                assert not result['at_risk'][i]
+                continue
+            assert result['average'][i] == pytest.approx(average)
+            assert trend_name(result['trend'][i]) == classify_trend(recent_average(stats, TREND_WINDOW), average)
+            assert RECOMMENDATION_BUCKETS[result['bucket'][i]][2] == recommendations_for(average)
+
+    def test_analyze_filters_by_major_and_backfills(self):
+        """测试按专业筛选，并处理没有聚合的旧文档"""
+        self.student_model.create_student({'name': '张三', 'major': 'CS', 'grades': [
+            {'course': 'CS1001', 'score': 90}, {'course': 'CS1002', 'score': 40}, {'course': 'CS1003', 'score': 45}
+        ]})
+        self.student_model.create_student({'name': '李四', 'major': 'CS', 'grades': []})
+        self.student_model.create_student({'name': '王五', 'major': 'EE', 'grades': [{'course': 'EE1001', 'score': 95}]})
+        self.db.students.insert_one({'name': '赵六', 'major': 'CS', 'grades': [{'course': 'CS1001', 'score': 88}]})
+
+        analysis = CohortAnalytics(self.db).analyze(major='CS')
+        summary = analysis['summary']
+        assert summary['total_students'] == 3
+        assert summary['students_with_grades'] == 2
+        assert summary['at_risk'] == 1
+        assert summary['trends']['insufficient_data'] == 1
+        assert summary['recommendation_buckets'] == {'needs_support': 1, 'on_track': 0, 'excellent': 1}
+
+        rows = {row['name']: row for row in analysis['students']}
+        assert rows['张三']['at_risk'] and rows['张三']['recommendation_bucket'] == 'needs_support'
+        assert rows['李四']['performance_trend'] == 'insufficient_data'
+        assert rows['赵六']['average_score'] == 88
+        assert rows['赵六']['percentile_rank'] == 100.0
+        assert 'grade_stats' in self.db.students.find_one({'name': '赵六'})
+
+        chunked = CohortAnalytics(self.db, chunk_size=2).analyze(major='CS')
+        assert chunked == analysis
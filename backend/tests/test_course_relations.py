@@ -0,0 +1,106 @@
+import pytest
+from app.services.course_relations import CourseRelationIndex, parse_prerequisite_codes
+from app.services.rag_service import RAGService
+
+mongomock = pytest.importorskip('mongomock')
+
+ML = {
+    'course_code': 'CS5187',
+    'course_name': 'Machine Learning',
+    'description': 'Supervised learning, neural networks and model evaluation',
+    'topics': ['Linear regression', 'Neural networks', 'Model evaluation'],
+    'prerequisites': ['CS3001 Data Structures']
+}
+DL = {
+    'course_code': 'CS6001',
+    'course_name': 'Deep Learning',
+    'description': 'Deep neural networks, convolutional networks and training',
+    'topics': ['Neural networks', 'Convolutional networks'],
+    'prerequisites': ['CS5187 Machine Learning']
+}
+DS = {
+    'course_code': 'CS3001',
+    'course_name': 'Data Structures',
+    'description': 'Lists, trees, graphs and hashing',
+    'topics': ['Trees', 'Graphs'],
+    'prerequisites': []
+}
+HISTORY = {
+    'course_code': 'HI1001',
+    'course_name': '中国近代史',
+    'description': '近代中国的社会变迁',
+    'topics': ['鸦片战争', '辛亥革命'],
+    'prerequisites': []
+}
+
+
+class TestCourseRelations:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+        self.index = CourseRelationIndex(self.db, k=2, min_score=0.1, cache_seconds=0)
+
+    def test_parse_prerequisite_codes(self):
+        """测试从先修课程条目中提取课程代码"""
+        assert parse_prerequisite_codes(['cs3001 Data Structures', 'MATH2001 或 CS3001', '无']) == ['CS3001', 'MATH2001']
+
+    def test_incremental_update_maintains_neighbors(self):
+        """测试新增课程时同时更新受影响课程的相关列表"""
+        for course in (ML, DS, HISTORY):
+            self.index.update_course(course)
+        neighbors = self.index.update_course(DL)
+
+        assert neighbors[0][0] == 'CS5187'
+        assert 'HI1001' not in [code for code, _ in neighbors]
+        assert self.index.neighbors('CS5187')[0][0] == 'CS6001'
+        assert self.index.neighbors('MA0000') is None
+
+        # 课程内容变更后，原本相关的课程列表随之更新
+        self.index.update_course(dict(DL, course_name='近代史专题', description='近代中国的社会变迁', topics=['辛亥革命'], prerequisites=[]))
+        assert 'CS6001' not in [code for code, _ in self.index.neighbors('CS5187')]
+
+        self.index.remove_course('CS3001')
+        assert 'CS3001' not in [code for code, _ in self.index.neighbors('CS5187')]
+
+    def test_rebuild_matches_incremental(self):
+        """测试全量构建与逐门增量构建得到相同的相关课程"""
+        for course in (ML, DL, DS, HISTORY):
+            self.db.courses.insert_one(dict(course))
+            self.index.update_course(course)
+        incremental = {code: [c for c, _ in self.index.neighbors(code)] for code in ('CS5187', 'CS6001', 'CS3001')}
+
+        self.db.course_relations.delete_many({})
+        self.index.ensure_built()
+        rebuilt = {code: [c for c, _ in self.index.neighbors(code)] for code in ('CS5187', 'CS6001', 'CS3001')}
+        assert rebuilt == incremental
+
+    def test_doc_freq_is_maintained_incrementally(self):
+        """测试文档频率聚合随课程新增、变更、移除用$inc更新，与全量统计一致，其他进程的变更会被同步"""
+        for course in (ML, DL, DS):
+            self.index.update_course(course)
+        self.index.update_course(dict(DS, description='Trees and heaps'))
+        other = CourseRelationIndex(self.db, k=2, min_score=0.1, cache_seconds=0)
+        other.update_course(HISTORY)
+        self.index.remove_course('CS6001')
+
+        incremental = self.db.course_relation_stats.find_one({'_id': 'doc_freq'})
+        self.db.course_relation_stats.delete_many({})
+        rebuilt = self.index._doc_freq()
+        assert incremental['courses'] == rebuilt['courses'] == 3
+        assert {key: count for key, count in incremental['df'].items() if count} == rebuilt['df']
+        assert sorted(self.index._load_rows()[0]) == ['CS3001', 'CS5187', 'HI1001']
+
+    def test_build_context_uses_weighted_related_average(self):
+        """测试相关课程平均分按相关度加权，且不再依赖课程前缀"""
+        rag_service = RAGService()
+        student = {'name': '张三', 'grades': [
+            {'course': 'CS5187', 'score': 90},
+            {'course': 'CS6001', 'score': 60},
+            {'course': 'CS9999', 'score': 10}
+        ]}
+        context = rag_service._build_context(
+            student, {'course_code': 'CS7000'}, related_courses=[('CS5187', 0.75), ('CS6001', 0.25)]
+        )
+        assert '相关课程平均成绩: 82.50' in context
+
+        fallback = rag_service._build_context(student, {'course_code': 'CS7000'})
+        assert '相关课程平均成绩: 53.33' in fallback
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+from app.services.course_similarity import CourseSimilarityMatrix
+from app.services.rag_service import RAGService
+
+mongomock = pytest.importorskip('mongomock')
+
+from app.services.course_relations import CourseRelationIndex
+
+COURSES = [
+    {'_id': 'c1', 'course_code': 'CS5187', 'course_name': 'Machine Learning',
+     'description': 'Supervised learning with neural networks and model evaluation',
+     'topics': ['regression', 'neural networks']},
+    {'_id': 'c2', 'course_code': 'CS6001', 'course_name': 'Deep Learning',
+     'description': 'Deep neural networks and convolutional networks',
+     'topics': ['neural networks', 'convolution']},
+    {'_id': 'c3', 'course_code': 'CS3001', 'course_name': 'Data Structures',
+     'description': 'Lists, trees, graphs and hashing', 'topics': ['trees', 'graphs']},
+    {'_id': 'c4', 'course_code': 'CS4002', 'course_name': 'Algorithms',
+     'description': 'Graph algorithms, trees and dynamic programming', 'topics': ['graphs', 'dynamic programming']},
+    {'_id': 'c5', 'course_code': 'CS5002', 'course_name': 'Pattern Recognition',
+     'description': 'Statistical learning and neural networks for pattern recognition', 'topics': ['classification']},
+]
+
+
+class TestCourseSimilarity:
+    def setup_method(self):
+        self.rag_service = RAGService()
+        self.db = mongomock.MongoClient().db
+        self.relations = CourseRelationIndex(self.db, cache_seconds=0)
+
+    def matrix(self, directory, **kwargs):
+        return CourseSimilarityMatrix(str(directory), self.relations, **kwargs)
+
+    def build(self, directory, courses, **kwargs):
+        """全量构建课程相关度索引和相似度矩阵"""
+        self.db.courses.delete_many({})
+        self.db.courses.insert_many([dict(course) for course in courses])
+        self.relations.rebuild()
+        matrix = self.matrix(directory, **kwargs)
+        matrix.rebuild(courses)
+        return matrix
+
+    def update(self, matrix, course):
+        """与上传课程时相同：先更新课程相关度索引，再更新相似度矩阵"""
+        self.relations.update_course(course)
+        return matrix.update_course(course, course_id=course.get('_id'))
+
+    def test_incremental_updates_match_rebuild(self, tmp_path):
+        """测试逐门增量更新与全量构建得到相同的相似课程"""
+        incremental = self.matrix(tmp_path / 'incremental', k=2)
+        for course in COURSES:
+            self.update(incremental, course)
+        rebuilt = self.build(tmp_path / 'rebuilt', COURSES, k=2)
+
+        for course in COURSES:
+            codes = [c['course_code'] for c in incremental.similar(course['course_code'])]
+            assert codes == [c['course_code'] for c in rebuilt.similar(course['course_code'])]
+            assert course['course_code'] not in codes
+
+        assert incremental.similar('CS5187')[0]['course_code'] == 'CS6001'
+        assert incremental.similar('CS5187')[0]['course_id'] == 'c2'
+        assert isinstance(incremental._neighbors, np.memmap)
+
+    def test_update_is_visible_to_other_workers(self, tmp_path):
+        """测试一个实例的更新对共享目录的其他实例可见，课程变更后修补邻居行"""
+        writer = self.build(tmp_path, COURSES, k=2)
+        reader = self.matrix(tmp_path, k=2)
+        assert reader.similar('CS6001')[0]['course_code'] == 'CS5187'
+
+        version = writer.stats()['version']
+        self.update(writer, dict(COURSES[1], course_name='Graph Theory', description='Trees and graph hashing', topics=['graphs']))
+        assert reader.similar('CS5187')[0]['course_code'] == 'CS5002'
+        assert reader.similar('CS6001')[0]['course_code'] == 'CS3001'
+        assert reader.stats() == {'version': version, 'courses': 5, 'k': 2}
+        assert (tmp_path / version / 'log.jsonl').read_text().count('\n') == 1
+
+    def test_appended_updates_match_rebuild(self, tmp_path):
+        """测试多个写入方交替追加更新、合并为新版本后，结果与全量构建一致"""
+        first = self.build(tmp_path / 'shared', COURSES[:2], k=2, compact_after=3)
+        second = self.matrix(tmp_path / 'shared', k=2, compact_after=3)
+        version = first.stats()['version']
+        for index, course in enumerate(COURSES[2:] + [COURSES[0]]):
+            self.update(first if index % 2 else second, course)
+        assert first.stats()['version'] != version
+        assert second.stats()['courses'] == 5
+
+        rebuilt = self.build(tmp_path / 'rebuilt', COURSES, k=2)
+        reader = self.matrix(tmp_path / 'shared', k=2)
+        for course in COURSES:
+            codes = [c['course_code'] for c in reader.similar(course['course_code'])]
+            assert codes == [c['course_code'] for c in rebuilt.similar(course['course_code'])]
+
+    def test_next_courses_skip_taken_courses(self, tmp_path):
+        """测试建议中的后续课程排除学生已修课程"""
+        course_similarity = self.build(tmp_path, COURSES, k=3)
+        student = {'name': '张三', 'grades': [{'course': 'CS6001', 'score': 80}]}
+
+        parts = self.rag_service._build_deterministic_parts(student, COURSES[0], course_similarity)
+        codes = [c['course_code'] for c in parts['next_courses']]
+        assert codes and 'CS6001' not in codes and 'CS5187' not in codes
+        assert self.rag_service._build_deterministic_parts(student, COURSES[0])['next_courses'] == []
+
+    def test_uses_relation_vectors(self, tmp_path):
+        """测试相似度与课程相关度索引的TF-IDF相似度一致，相关度索引中没有的课程不更新"""
+        matrix = self.build(tmp_path, COURSES, k=4)
+        codes, weighted = self.relations.weighted_rows()
+        rows = {code: row for row, code in enumerate(codes)}
+        expected = float(weighted[rows['CS5187']].multiply(weighted[rows['CS6001']]).sum())
+        assert matrix.similar('CS5187')[0]['score'] == pytest.approx(expected, abs=1e-4)
+
+        assert matrix.update_course({'course_code': 'CS9999', 'description': 'Not indexed'}) == 5
+        assert matrix.similar('CS9999') == []
+        assert self.relations.weighted_rows()[1] is weighted
+
+    def test_old_format_is_rebuilt(self, tmp_path):
+        """测试旧格式（自行向量化）的版本目录视为空，需要重新构建"""
+        (tmp_path / 'v1').mkdir()
+        (tmp_path / 'CURRENT').write_text('v1')
+        matrix = self.matrix(tmp_path, k=2)
+        assert matrix.is_empty()
+
+        self.build(tmp_path, COURSES, k=2)
+        assert not self.matrix(tmp_path, k=2).is_empty()
@@ -0,0 +1,81 @@
+import hashlib
+from io import BytesIO
+
+import pytest
+from app.services.extraction_cache import ExtractionCache
+from app.services.pdf_service import EXTRACTOR_VERSION, PDFService, content_sha256, upload_stream_factory
+
+mongomock = pytest.importorskip('mongomock')
+
+COURSE_INFO = {'course_code': 'CS5187', 'course_name': 'Machine Learning', 'topics': ['Neural networks']}
+
+
+class TestExtractionCache:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+        self.cache = ExtractionCache(self.db)
+
+    def test_put_and_get(self):
+        """测试按内容哈希保存并读取解析结果"""
+        self.cache.put('abc', 'text', dict(COURSE_INFO), document={'page_count': 2})
+
+        doc = self.cache.get('abc')
+
+        assert doc['text'] == 'text'
+        assert doc['course_info'] == COURSE_INFO
+        assert doc['document'] == {'page_count': 2}
+        assert doc['extractor_version'] == EXTRACTOR_VERSION
+        assert self.cache.get('missing') is None
+        assert self.db.pdf_extractions.find_one({'_id': 'abc'})['hits'] == 1
+        stats = self.cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+    def test_old_extractor_version_is_recomputed(self):
+        """测试解析逻辑版本变化后旧记录不再命中"""
+        ExtractionCache(self.db, extractor_version=EXTRACTOR_VERSION - 1).put('abc', 'old', dict(COURSE_INFO))
+
+        assert self.cache.get('abc') is None
+        assert self.cache.stats()['stale'] == 1
+
+        self.cache.put('abc', 'new', dict(COURSE_INFO))
+        assert self.cache.get('abc')['text'] == 'new'
+
+    def test_store_raw_pdf_in_gridfs(self):
+        """测试原始PDF按内容哈希存入GridFS且只保存一份"""
+        mongomock_gridfs = pytest.importorskip('mongomock.gridfs')
+        mongomock_gridfs.enable_gridfs_integration()
+        cache = ExtractionCache(self.db, store_raw=True)
+
+        cache.put('abc', 'text', dict(COURSE_INFO), pdf_file=BytesIO(b'%PDF-1.4 data'))
+        cache.put('abc', 'text', dict(COURSE_INFO), pdf_file=BytesIO(b'%PDF-1.4 data'))
+
+        assert self.db.pdf_files.files.count_documents({'sha256': 'abc'}) == 1
+        assert cache.get('abc')['gridfs_id'] is not None
+
+    def test_spool_upload_computes_sha256(self):
+        """测试上传流写入临时文件的同时计算内容哈希，Werkzeug写入的PDF不再重新读取"""
+        content = b'%PDF-1.4\n' + b'x' * (3 * 1024 * 1024)
+        expected = hashlib.sha256(content).hexdigest()
+        pdf_service = PDFService()
+
+        for stream in (BytesIO(content), _ChunkedStream(content)):
+            assert content_sha256(pdf_service.spool_upload(stream)) == expected
+
+        uploaded = upload_stream_factory(len(content), 'application/pdf', 'a.PDF')
+        for offset in range(0, len(content), 64 * 1024):
+            uploaded.write(content[offset:offset + 64 * 1024])
+        pdf_file = pdf_service.spool_upload(uploaded)
+        assert pdf_file is uploaded
+        assert pdf_file.sha256.hexdigest() == expected
+        assert content_sha256(pdf_file) == expected
+        assert not hasattr(upload_stream_factory(10, 'text/csv', 'grades.csv'), 'sha256')
+
+
+class _ChunkedStream:
+    """不可随机读取的上传流"""
+    def __init__(self, content: bytes):
+        self._buffer = BytesIO(content)
+
+    def read(self, size=-1):
+        return self._buffer.read(size)
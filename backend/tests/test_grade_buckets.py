@@ -0,0 +1,139 @@
+import pytest
+from bson import ObjectId
+from app.services.grade_stats import average_score
+
+mongomock = pytest.importorskip('mongomock')
+
+from app.models.student import Student
+
+
+class TestGradeBuckets:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+        self.student_model = Student(self.db)
+        self.student_model.grade_buckets.ensure_indexes()
+
+    def test_grades_are_bucketed_by_term(self):
+        """测试成绩按学生、学期分桶存储，学生文档不再内嵌成绩"""
+        student_id = self.student_model.create_student({
+            'name': '张三',
+            'grades': [
+                {'course': 'CS3001', 'score': 80, 'year': '2023', 'semester': '2023秋'},
+                {'course': 'CS2001', 'score': 70, 'year': '2022', 'semester': '2022秋'}
+            ]
+        })
+        assert self.student_model.add_grade(student_id, {'course': 'CS3002', 'score': 90, 'year': '2023', 'semester': '2023秋'})
+
+        assert 'grades' not in self.db.students.find_one({'_id': ObjectId(student_id)})
+        buckets = list(self.db.grade_buckets.find({'student_id': student_id}).sort('year', 1))
+        assert [(bucket['year'], bucket['count']) for bucket in buckets] == [('2022', 1), ('2023', 2)]
+
+        student = self.student_model.get_student(student_id)
+        assert [grade['course'] for grade in student['grades']] == ['CS3001', 'CS2001', 'CS3002']
+        assert student['grade_stats']['count'] == 3
+        assert 'grades' not in self.student_model.get_student(student_id, include_grades=False)
+        assert len(self.student_model.grade_buckets.get_grades(student_id, year_from='2023')) == 2
+
+        assert self.student_model.delete_student(student_id)
+        assert self.db.grade_buckets.count_documents({}) == 0
+
+    def test_legacy_grades_are_migrated(self):
+        """测试内嵌成绩的旧文档在读取时迁移，批量迁移只处理剩余的旧文档"""
+        legacy = [{'course': 'CS3001', 'score': 70, 'year': '2023', 'semester': '2023春'}]
+        first_id = str(self.db.students.insert_one({'name': '李四', 'grades': legacy}).inserted_id)
+        self.db.students.insert_one({'name': '王五', 'grades': legacy + [{'course': 'CS3002', 'score': 90}]})
+
+        student = self.student_model.get_student(first_id, include_grades=False)
+        assert average_score(student['grade_stats']) == 70
+        assert 'grades' not in self.db.students.find_one({'_id': ObjectId(first_id)})
+        assert self.student_model.grade_buckets.get_grades(first_id) == legacy
+
+        assert self.student_model.migrate_grades() == (1, 2)
+        assert self.student_model.migrate_grades() == (0, 0)
+        assert self.db.students.count_documents({'grades': {'$exists': True}}) == 0
+        assert self.db.grade_buckets.count_documents({}) == 3
+
+    def test_course_distribution(self):
+        """测试按课程统计成绩分布"""
+        for index, score in enumerate([55, 68, 72, 75, 100]):
+            self.student_model.create_student({'name': f'学生{index}', 'grades': [
+                {'course': 'CS3001', 'score': score, 'year': '2023', 'semester': '2023春'},
+                {'course': 'MA2001', 'score': 10, 'year': '2023', 'semester': '2023春'}
+            ]})
+
+        distribution = self.student_model.grade_distribution('cs3001', bin_width=10)
+
+        assert distribution['count'] == 5
+        assert distribution['students'] == 5
+        assert distribution['average'] == 74
+        assert (distribution['min'], distribution['max']) == (55, 100)
+        assert distribution['histogram'] == [
+            {'min': 50, 'max': 60, 'count': 1},
+            {'min': 60, 'max': 70, 'count': 1},
+            {'min': 70, 'max': 80, 'count': 2},
+            {'min': 100, 'max': 110, 'count': 1}
+        ]
+        assert self.student_model.grade_distribution('EE1001')['count'] == 0
+
+    def test_grades_keep_insertion_order(self):
+        """测试迁移与读取后成绩保持写入顺序，不按学年、学期的字符串排序"""
+        legacy = [
+            {'course': 'CS1001', 'score': 95, 'year': '2022', 'semester': 'Spring'},
+            {'course': 'CS1002', 'score': 90, 'year': '2022', 'semester': 'Fall'},
+            {'course': 'CS2001', 'score': 60},
+            {'course': 'CS2002', 'score': 55, 'year': '2023', 'semester': 'Spring'}
+        ]
+        legacy_id = str(self.db.students.insert_one({'name': '李四', 'grades': legacy}).inserted_id)
+
+        student = self.student_model.get_student(legacy_id, include_grades=False)
+        assert student['grade_stats']['recent'] == [95, 90, 60, 55]
+        assert self.student_model.add_grade(legacy_id, {'course': 'CS3001', 'score': 70, 'year': '2021', 'semester': 'Fall'})
+
+        grades = self.student_model.get_student(legacy_id)['grades']
+        assert [grade['score'] for grade in grades] == [95, 90, 60, 55, 70]
+        assert 'seq' not in grades[0]
+        stored = self.db.students.find_one({'_id': ObjectId(legacy_id)})['grade_stats']
+        assert stored['recent'] == [95, 90, 60, 55, 70]
+
+    def test_failed_stats_update_withdraws_grade(self):
+        """测试聚合更新失败时撤回已写入分桶的成绩，重试不会重复计入聚合"""
+        student_id = self.student_model.create_student({'name': '王五'})
+        students = self.db.students
+
+        class FailingStats:
+            def __getattr__(self, name):
+                return getattr(students, name)
+
+            def update_one(self, query, update, *args, **kwargs):
+                if '$inc' in update:
+                    raise RuntimeError('写入超时')
+                return students.update_one(query, update, *args, **kwargs)
+
+        self.student_model.collection = FailingStats()
+        assert not self.student_model.add_grade(student_id, {'course': 'CS3001', 'score': 80})
+        assert self.student_model.grade_buckets.get_grades(student_id) == []
+
+        self.student_model.collection = students
+        assert self.student_model.add_grade(student_id, {'course': 'CS3001', 'score': 80})
+        student = self.student_model.get_student(student_id)
+        assert [grade['score'] for grade in student['grades']] == [80]
+        assert student['grade_stats']['count'] == 1
+
+    def test_course_codes_are_normalized(self):
+        """测试各写入路径统一课程代码的大小写与空白，已有分桶可批量规范化"""
+        student_id = self.student_model.create_student({'name': '张三', 'grades': [{'course': 'cs3001', 'score': 80}]})
+        assert self.student_model.add_grade(student_id, {'course': ' CS3001 ', 'score': 90})
+        self.student_model.bulk_add_grades({student_id: [{'course': 'Cs3001', 'score': 70}]})
+
+        distribution = self.student_model.grade_distribution('cs3001 ')
+        assert (distribution['count'], distribution['students']) == (3, 1)
+        assert {grade['course'] for grade in self.student_model.get_student(student_id)['grades']} == {'CS3001'}
+
+        self.db.grade_buckets.insert_one({
+            'student_id': 'legacy', 'year': '2022', 'semester': '', 'count': 2,
+            'grades': [{'course': 'ma2001 ', 'score': 60, 'seq': 1}, {'course': 'CS3001', 'score': 65, 'seq': 2}]
+        })
+        assert self.student_model.grade_buckets.normalize_courses() == 1
+        assert self.student_model.grade_buckets.normalize_courses() == 0
+        assert self.student_model.grade_distribution('MA2001')['count'] == 1
+        assert self.student_model.grade_distribution('CS3001')['count'] == 4
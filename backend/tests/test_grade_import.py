@@ -0,0 +1,186 @@
+from io import BytesIO
+
+import pytest
+from bson import ObjectId
+from app.services.grade_import import GradeImporter, grade_format, parse_grade_row, parse_score, read_grade_rows
+from app.services.grade_stats import compute_grade_stats
+
+mongomock = pytest.importorskip('mongomock')
+
+from flask import Flask
+from app.models.student import Student
+from app.routes.student_routes import student_bp
+
+CSV_CONTENT = '''student_id,course,score,semester,year
+2021001,cs3001,85,2023秋,2023
+2021002,CS3001,92.5,2023秋,2023
+2021001,CS3002,abc,2023秋,2023
+2021999,CS3001,70,2023秋,2023
+2021001,MA2001,78,2024春,2024
+'''
+
+
+class TestGradeRows:
+    def test_read_csv_and_ndjson(self):
+        """测试逐行读取CSV与NDJSON，行号对应文件中的行"""
+        rows = list(read_grade_rows(BytesIO(b'\xef\xbb\xbf' + CSV_CONTENT.encode()), 'csv'))
+        assert [line for line, _, _ in rows] == [2, 3, 4, 5, 6]
+        assert rows[0][1]['student_id'] == '2021001'
+
+        ndjson = b'{"student_id": "2021001", "course": "CS3001", "score": 85}\n\nnot json\n'
+        rows = list(read_grade_rows(BytesIO(ndjson), 'ndjson'))
+        assert rows[0] == (1, {'student_id': '2021001', 'course': 'CS3001', 'score': 85}, None)
+        assert rows[1][0] == 3 and rows[1][2].startswith('JSON格式错误')
+
+        with pytest.raises(ValueError):
+            read_grade_rows(BytesIO(b'student_id,course\n1,CS3001\n'), 'csv')
+        with pytest.raises(ValueError):
+            read_grade_rows(BytesIO(b''), 'xlsx')
+        assert grade_format('grades.jsonl') == 'ndjson'
+        assert grade_format('grades') == 'csv'
+
+    def test_parse_grade_row(self):
+        """测试单行成绩校验与规范化"""
+        assert parse_grade_row({'student_id': 2021001, 'course': ' cs3001 ', 'score': '85.0'}) == {
+            'student_id': '2021001', 'course': 'CS3001', 'score': 85, 'semester': '', 'year': ''
+        }
+        for row in ({'course': 'CS3001', 'score': 80}, {'student_id': '1', 'score': 80},
+                    {'student_id': '1', 'course': 'CS3001', 'score': ''},
+                    {'student_id': '1', 'course': 'CS3001', 'score': 120}, ['1', 'CS3001', 80]):
+            with pytest.raises(ValueError):
+                parse_grade_row(row)
+        assert parse_score('92.5') == 92.5
+        with pytest.raises(ValueError):
+            parse_score('A')
+
+
+class TestGradeRoutes:
+    def setup_method(self):
+        app = Flask(__name__)
+        app.db = mongomock.MongoClient().db
+        app.register_blueprint(student_bp, url_prefix='/api/students')
+        self.db = app.db
+        self.client = app.test_client()
+
+    def test_non_numeric_scores_are_rejected(self):
+        """测试创建学生和添加成绩时分数不是数字返回400，且不写入数据"""
+        student = {'name': '张三', 'student_id': '2021001', 'major': '计算机'}
+        response = self.client.post('/api/students/', json=dict(student, grades=[{'course': 'CS3001', 'score': 'A'}]))
+        assert response.status_code == 400
+        assert 'A' in response.get_json()['error']
+        assert self.db.students.count_documents({}) == 0
+
+        response = self.client.post('/api/students/', json=dict(student, grades=[{'course': 'CS3001', 'score': '85'}]))
+        assert response.status_code == 201
+        student_id = response.get_json()['student_id']
+        assert Student(self.db).get_student(student_id)['grades'][0]['score'] == 85
+
+        response = self.client.post(f'/api/students/{student_id}/grades', json={'course': 'CS3002', 'score': 'B+'})
+        assert response.status_code == 400
+        assert self.db.students.find_one({'_id': ObjectId(student_id)})['grade_stats']['count'] == 1
+
+
+class TestGradeImporter:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+        self.student_model = Student(self.db)
+        self.first_id = self.student_model.create_student({
+            'name': '张三', 'student_id': '2021001', 'grades': [{'course': 'CS2001', 'score': 60, 'year': '2022'}]
+        })
+        self.second_id = self.student_model.create_student({'name': '李四', 'student_id': '2021002'})
+
+    def test_import_reports_failed_rows(self):
+        """测试按批写入成绩、逐行报告失败，并维护成绩聚合"""
+        lines = list(GradeImporter(self.db, batch_size=2).import_file(BytesIO(CSV_CONTENT.encode()), 'csv'))
+
+        errors = {line['line']: line['error'] for line in lines if line.get('status') == 'error'}
+        assert set(errors) == {4, 5}
+        assert '学号不存在' in errors[5]
+        assert lines[-1]['summary'] == {'total': 5, 'imported': 3, 'failed': 2, 'students': 2}
+
+        first = self.student_model.get_student(self.first_id)
+        assert [grade['course'] for grade in first['grades']] == ['CS2001', 'CS3001', 'MA2001']
+        stored = self.db.students.find_one({'_id': ObjectId(self.first_id)})['grade_stats']
+        assert stored == compute_grade_stats(first['grades'])
+        assert self.student_model.grade_distribution('CS3001')['average'] == pytest.approx(88.75)
+
+    def test_legacy_student_is_migrated_before_import(self):
+        """测试导入前迁移仍内嵌成绩的旧文档"""
+        legacy_id = self.db.students.insert_one({
+            'student_id': '2020001', 'grades': [{'course': 'CS1001', 'score': 90}]
+        }).inserted_id
+        rows = [(1, {'student_id': '2020001', 'course': 'CS1002', 'score': 70}, None)]
+
+        lines = list(GradeImporter(self.db).import_rows(rows))
+
+        assert lines[-1]['summary']['imported'] == 1
+        student = self.db.students.find_one({'_id': legacy_id})
+        assert 'grades' not in student
+        assert student['grade_stats']['count'] == 2
+        assert len(self.student_model.grade_buckets.get_grades(str(legacy_id))) == 2
+
+    def test_deleted_student_rows_are_reported(self):
+        """测试解析学号后被删除的学生：聚合更新未匹配，该学生的行报告为失败且不写入分桶"""
+        importer = GradeImporter(self.db)
+        importer._resolve({'2021001', '2021002'})
+        self.student_model.delete_student(self.second_id)
+        rows = [
+            (1, {'student_id': '2021001', 'course': 'CS3001', 'score': 85}, None),
+            (2, {'student_id': '2021002', 'course': 'CS3001', 'score': 92}, None)
+        ]
+
+        lines = list(importer.import_rows(rows))
+
+        assert lines[0] == {'line': 2, 'status': 'error', 'error': '学生不存在或已被删除'}
+        assert lines[-1]['summary'] == {'total': 2, 'imported': 1, 'failed': 1, 'students': 1}
+        assert self.db.grade_buckets.count_documents({'student_id': self.second_id}) == 0
+        assert self.db.students.find_one({'_id': ObjectId(self.first_id)})['grade_stats']['count'] == 2
+
+    def test_stale_stats_are_retried(self):
+        """测试批量更新时聚合仍为旧版本的学生：回填后重试，成绩只计入一次"""
+        self.db.students.update_one({'_id': ObjectId(self.second_id)}, {'$set': {'grade_stats.version': 0}})
+        backfill = self.student_model._backfill_grade_stats
+        calls = []
+
+        def backfill_on_retry(object_id):
+            # 跳过批量写入前的回填，使聚合更新不匹配
+            calls.append(object_id)
+            return backfill(object_id) if len(calls) > 1 else None
+
+        self.student_model._backfill_grade_stats = backfill_on_retry
+        written = self.student_model.bulk_add_grades({self.second_id: [{'course': 'CS3001', 'score': 70}]})
+
+        assert written == [ObjectId(self.second_id)]
+        assert len(calls) == 2
+        stats = self.db.students.find_one({'_id': ObjectId(self.second_id)})['grade_stats']
+        assert stats == compute_grade_stats(self.student_model.get_student(self.second_id)['grades'])
+        assert stats['count'] == 1
+
+    def test_failed_bucket_write_leaves_stats_unchanged(self):
+        """测试分桶写入失败（部分分桶已写入）时撤回成绩且不更新聚合，重新导入只计入一次"""
+        add_many = self.student_model.grade_buckets.add_many
+
+        def partial_add_many(grades_by_student):
+            first = next(iter(grades_by_student))
+            add_many({first: grades_by_student[first]})
+            raise RuntimeError('写入超时')
+
+        grades = {
+            self.first_id: [{'course': 'CS3001', 'score': 85, 'year': '2023', 'semester': '2023秋'}],
+            self.second_id: [{'course': 'CS3001', 'score': 92, 'year': '2023', 'semester': '2023秋'}]
+        }
+        before = {doc['_id']: doc['grade_stats'] for doc in self.db.students.find()}
+        self.student_model.grade_buckets.add_many = partial_add_many
+        with pytest.raises(RuntimeError):
+            self.student_model.bulk_add_grades(grades)
+
+        assert {doc['_id']: doc['grade_stats'] for doc in self.db.students.find()} == before
+        assert len(self.student_model.grade_buckets.get_grades(self.first_id)) == 1
+        assert self.db.grade_buckets.count_documents({'student_id': self.second_id}) == 0
+
+        self.student_model.grade_buckets.add_many = add_many
+        assert set(self.student_model.bulk_add_grades(grades)) == {ObjectId(self.first_id), ObjectId(self.second_id)}
+        for student_id in (self.first_id, self.second_id):
+            student = self.student_model.get_student(student_id)
+            assert self.db.students.find_one({'_id': ObjectId(student_id)})['grade_stats'] == compute_grade_stats(student['grades'])
+        assert self.student_model.get_student(self.first_id)['grade_stats']['count'] == 2
@@ -0,0 +1,68 @@
+import pytest
+from bson import ObjectId
+from app.services.grade_stats import (
+    RECENT_WINDOW, compute_grade_stats, average_score, related_average, recent_average, score_std
+)
+
+mongomock = pytest.importorskip('mongomock')
+
+from app.models.student import Student
+
+
+class TestGradeStats:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+        self.student_model = Student(self.db)
+
+    def test_compute_grade_stats(self):
+        """测试根据成绩列表计算聚合"""
+        stats = compute_grade_stats([
+            {'course': 'CS3001', 'score': 80},
+            {'course': 'CS4001', 'score': 90},
+            {'course': 'MA2001', 'score': '70'},
+            {'course': '', 'score': 60}
+        ])
+
+        assert stats['count'] == 4
+        assert average_score(stats) == 75
+        assert related_average(stats, 'CS5187') == 85
+        assert related_average(stats, 'EE1001') is None
+        assert recent_average(stats, 3) == pytest.approx((90 + 70 + 60) / 3)
+        assert score_std(stats) == pytest.approx(125 ** 0.5)
+        assert average_score(compute_grade_stats([])) is None
+
+    def test_add_grade_updates_aggregates_incrementally(self):
+        """测试添加成绩时增量维护的聚合与全量计算一致"""
+        student_id = self.student_model.create_student({'name': '张三', 'grades': [{'course': 'CS3001', 'score': 80}]})
+        grades = [{'course': 'CS3001', 'score': 80}]
+        for i in range(RECENT_WINDOW + 2):
+            grade = {'course': f'MA{i:04d}', 'score': 60 + i}
+            assert self.student_model.add_grade(student_id, dict(grade))
+            grades.append(grade)
+
+        stored = self.db.students.find_one({'_id': ObjectId(student_id)})['grade_stats']
+        assert stored == compute_grade_stats(grades)
+        assert len(stored['recent']) == RECENT_WINDOW
+
+    def test_legacy_student_is_backfilled(self):
+        """测试没有聚合的旧文档在首次添加成绩或读取时回填"""
+        legacy_id = str(self.db.students.insert_one({'name': '李四', 'grades': [{'course': 'CS3001', 'score': 70}]}).inserted_id)
+        assert self.student_model.add_grade(legacy_id, {'course': 'CS4001', 'score': 90})
+        stats = self.db.students.find_one({'_id': ObjectId(legacy_id)})['grade_stats']
+        assert stats['count'] == 2
+        assert stats['by_prefix']['CS'] == {'count': 2, 'sum': 160}
+
+        other_id = str(self.db.students.insert_one({'name': '王五', 'grades': [{'course': 'CS3001', 'score': 88}]}).inserted_id)
+        student = self.student_model.get_student(other_id, include_grades=False)
+        assert 'grades' not in student
+        assert average_score(student['grade_stats']) == 88
+        assert 'grade_stats' in self.db.students.find_one({'_id': ObjectId(other_id)})
+
+    def test_update_student_recomputes_aggregates(self):
+        """测试整体替换成绩时重新计算聚合"""
+        student_id = self.student_model.create_student({'name': '张三', 'grades': [{'course': 'CS3001', 'score': 80}]})
+        self.student_model.update_student(student_id, {'grades': [{'course': 'EE1001', 'score': 50}]})
+
+        stats = self.db.students.find_one({'_id': ObjectId(student_id)})['grade_stats']
+        assert stats['count'] == 1
+        assert list(stats['by_prefix']) == ['EE']
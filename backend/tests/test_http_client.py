@@ -0,0 +1,55 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from app.services.http_client import ProviderHTTPClient
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture(scope='module')
+def server_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+class TestProviderHTTPClient:
+    def test_connection_reuse(self, server_url):
+        """测试同一主机的请求复用keep-alive连接"""
+        client = ProviderHTTPClient(pool_size=4)
+        for _ in range(3):
+            assert client.post(f"{server_url}/chat", json={}, timeout=5).status_code == 200
+
+        stats = client.stats()
+        assert len(stats) == 1
+        assert stats[0]['connections_opened'] == 1
+        assert stats[0]['requests'] == 3
+        assert stats[0]['reused'] == 2
+
+    def test_session_recreated_in_new_process(self):
+        """测试进程号变化（fork）后重新创建Session"""
+        client = ProviderHTTPClient()
+        session = client.session
+        client._pid = -1
+        assert client.session is not session
+
+    def test_split_timeouts(self):
+        """测试连接与读取超时分别受剩余时间约束"""
+        client = ProviderHTTPClient(connect_timeout=3.0, read_timeout=30.0)
+        assert client._timeouts(None) == (3.0, 30.0)
+        assert client._timeouts(10.0) == (3.0, 10.0)
+        assert client._timeouts(1.0) == (1.0, 1.0)
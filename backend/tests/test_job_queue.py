@@ -0,0 +1,165 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from app.services.job_queue import JobQueue, QUEUED, RUNNING, DONE, FAILED, expire_advice_jobs
+
+mongomock = pytest.importorskip('mongomock')
+
+def wait_for(job_queue, job_id, status, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = job_queue.get(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'任务未在{timeout}秒内进入{status}状态')
+
+class TestJobQueue:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+
+    def test_submit_and_poll(self):
+        """测试提交任务并轮询结果"""
+        job_queue = JobQueue(self.db, lambda payload: {'echo': payload['value']}, name='test-jobs')
+        job = job_queue.submit('echo', {'value': 1})
+
+        assert job['status'] == QUEUED
+        done = wait_for(job_queue, job['job_id'], DONE)
+        assert done['result'] == {'echo': 1}
+        assert done['attempts'] == 1
+
+    def test_failed_job(self):
+        """测试任务失败时记录错误"""
+        def handler(payload):
+            raise ValueError('学生不存在')
+
+        job_queue = JobQueue(self.db, handler, name='test-jobs')
+        job = job_queue.submit('advice', {})
+        failed = wait_for(job_queue, job['job_id'], FAILED)
+        assert failed['error'] == '学生不存在'
+
+    def test_deduplication(self):
+        """测试相同任务在执行中和刚完成时都被去重"""
+        release = threading.Event()
+
+        def handler(payload):
+            release.wait(2)
+            return {'ok': True}
+
+        job_queue = JobQueue(self.db, handler, name='test-jobs')
+        first = job_queue.submit('advice', {}, dedupe_key='advice:s1:c1')
+        second = job_queue.submit('advice', {}, dedupe_key='advice:s1:c1')
+        assert second['deduplicated'] is True
+        assert second['job_id'] == first['job_id']
+
+        release.set()
+        wait_for(job_queue, first['job_id'], DONE)
+        third = job_queue.submit('advice', {}, dedupe_key='advice:s1:c1')
+        assert third == {'job_id': first['job_id'], 'status': DONE, 'deduplicated': True}
+
+    def test_invalidation_expires_deduplication(self):
+        """测试学生或课程数据变更后，已完成和执行中的建议任务都不再被复用"""
+        release = threading.Event()
+
+        def handler(payload):
+            release.wait(2)
+            return {'ok': True}
+
+        job_queue = JobQueue(self.db, handler, name='test-jobs')
+        payload = {'student_id': 's1', 'course_id': 'c1'}
+        first = job_queue.submit('advice', payload, dedupe_key='advice:s1:c1')
+        other = job_queue.submit('advice', {'student_id': 's2', 'course_id': 'c2'}, dedupe_key='advice:s2:c2')
+
+        # 执行中的任务读取的是变更前的数据
+        expire_advice_jobs(self.db, student_ids=['s1'])
+        second = job_queue.submit('advice', payload, dedupe_key='advice:s1:c1')
+        assert second['deduplicated'] is False
+        assert job_queue.submit('advice', {}, dedupe_key='advice:s2:c2')['job_id'] == other['job_id']
+
+        release.set()
+        wait_for(job_queue, first['job_id'], DONE)
+        wait_for(job_queue, second['job_id'], DONE)
+        assert job_queue.submit('advice', payload, dedupe_key='advice:s1:c1')['job_id'] == second['job_id']
+
+        expire_advice_jobs(self.db, course_id='c1')
+        third = job_queue.submit('advice', payload, dedupe_key='advice:s1:c1')
+        assert third['deduplicated'] is False
+        assert third['job_id'] not in (first['job_id'], second['job_id'])
+
+    def test_grade_write_expires_advice_jobs(self):
+        """测试模型层写入成绩后，该学生已完成的建议任务不再被复用"""
+        from app.models.student import Student
+
+        student_model = Student(self.db)
+        student_id = student_model.create_student({'name': '张三', 'grades': []})
+        job_queue = JobQueue(self.db, lambda payload: {'ok': True}, name='test-jobs')
+        payload = {'student_id': student_id, 'course_id': 'c1'}
+        first = job_queue.submit('advice', payload, dedupe_key=f'advice:{student_id}:c1')
+        wait_for(job_queue, first['job_id'], DONE)
+
+        assert student_model.add_grade(student_id, {'course': 'CS3001', 'score': 80})
+        assert job_queue.submit('advice', payload, dedupe_key=f'advice:{student_id}:c1')['deduplicated'] is False
+
+    def test_recover_stale_running_job(self):
+        """测试重启后恢复卡在running状态的任务"""
+        stale = datetime.utcnow() - timedelta(seconds=600)
+        job_id = self.db.jobs.insert_one({
+            'kind': 'echo',
+            'payload': {'value': 2},
+            'status': RUNNING,
+            'attempts': 1,
+            'created_at': stale,
+            'updated_at': stale
+        }).inserted_id
+
+        job_queue = JobQueue(self.db, lambda payload: {'echo': payload['value']}, name='test-jobs')
+        assert job_queue.recover_stale() == 1
+        done = wait_for(job_queue, str(job_id), DONE)
+        assert done['attempts'] == 2
+
+    def test_reclaimed_job_keeps_new_result(self):
+        """测试任务被重新认领后，原来的执行完成时不覆盖任务状态"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def handler(payload):
+            started.set()
+            release.wait(2)
+            return {'stale': True}
+
+        job_queue = JobQueue(self.db, handler, name='test-jobs')
+        job = job_queue.submit('echo', {}, dedupe_key='echo:1')
+        assert started.wait(2)
+
+        # 模拟任务超时后被其他进程重新认领
+        job_id = ObjectId(job['job_id'])
+        self.db.jobs.update_one({'_id': job_id}, {'$set': {'run_id': ObjectId(), 'worker': 'other'}})
+        release.set()
+
+        deadline = time.monotonic() + 2
+        while job_queue.stats()['running_in_process'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stored = self.db.jobs.find_one({'_id': job_id})
+        assert stored['status'] == RUNNING
+        assert 'result' not in stored
+        assert stored['active_key'] == 'echo:1'
+
+    def test_recover_stale_gives_up_after_max_attempts(self):
+        """测试多次中断的任务被标记为失败"""
+        stale = datetime.utcnow() - timedelta(seconds=600)
+        job_id = self.db.jobs.insert_one({
+            'kind': 'echo',
+            'payload': {},
+            'status': RUNNING,
+            'run_id': ObjectId(),
+            'attempts': 3,
+            'created_at': stale,
+            'updated_at': stale
+        }).inserted_id
+
+        job_queue = JobQueue(self.db, lambda payload: {}, name='test-jobs')
+        assert job_queue.recover_stale() == 0
+        assert job_queue.get(str(job_id))['status'] == FAILED
@@ -0,0 +1,80 @@
+import pytest
+from app.models.course import Course
+from app.models.student import Student
+from app.routes.listing import listing_args
+
+mongomock = pytest.importorskip('mongomock')
+
+
+class TestStudentListing:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+        self.student_model = Student(self.db)
+        for index in range(5):
+            self.student_model.create_student({
+                'name': f'学生{index}',
+                'student_id': f'20210{index}',
+                'major': '计算机科学' if index % 2 == 0 else '软件工程',
+                'grade': '大三',
+                'grades': [{'course': 'CS3001', 'score': 80 + index}]
+            })
+
+    def test_keyset_pagination(self):
+        """测试按_id分页依次取完所有学生，默认只返回精简字段"""
+        first, cursor = self.student_model.list_students(limit=2)
+        second, cursor = self.student_model.list_students(after=cursor, limit=2)
+        third, last_cursor = self.student_model.list_students(after=cursor, limit=2)
+
+        names = [student['name'] for student in first + second + third]
+        assert names == [f'学生{index}' for index in range(5)]
+        assert last_cursor is None
+        assert set(first[0]) == {'_id', 'name', 'student_id', 'major', 'grade'}
+
+    def test_filters_and_fields(self):
+        """测试按专业筛选与指定返回字段"""
+        students, cursor = self.student_model.list_students(major='软件工程', fields=['name', 'grades'])
+
+        assert [student['name'] for student in students] == ['学生1', '学生3']
+        assert cursor is None
+        assert students[0]['grades'][0]['score'] == 81
+        assert 'major' not in students[0]
+        assert 'grade_stats' in self.student_model.list_students(fields=['*'])[0][0]
+        with pytest.raises(ValueError):
+            self.student_model.list_students(fields=['password'])
+        with pytest.raises(ValueError):
+            self.student_model.list_students(after='not-an-id')
+
+    def test_iter_students(self):
+        """测试流式读取时从游标逐个产生学生"""
+        students = self.student_model.iter_students(grade='大三', limit=3)
+
+        assert not isinstance(students, list)
+        assert [student['student_id'] for student in students] == ['202100', '202101', '202102']
+
+
+class TestCourseListing:
+    def test_filter_by_course_codes(self):
+        """测试按课程代码（逗号分隔、不区分大小写）筛选课程"""
+        db = mongomock.MongoClient().db
+        course_model = Course(db)
+        for code in ('CS5187', 'CS6001', 'CS3334'):
+            course_model.create_course({'course_code': code, 'course_name': code, 'description': '...'})
+
+        courses, _ = course_model.list_courses(['cs5187', ' CS3334'])
+
+        assert [course['course_code'] for course in courses] == ['CS5187', 'CS3334']
+        assert 'description' not in courses[0]
+        assert len(list(course_model.iter_courses(fields=['description']))) == 3
+
+
+class TestListingArgs:
+    def test_listing_args(self):
+        """测试分页参数解析"""
+        assert listing_args({}) == {'fields': [], 'after': None, 'limit': 100, 'stream': False}
+        assert listing_args({'format': 'ndjson', 'fields': 'name, major'}) == {
+            'fields': ['name', 'major'], 'after': None, 'limit': None, 'stream': True
+        }
+        with pytest.raises(ValueError):
+            listing_args({'limit': '5000'})
+        with pytest.raises(ValueError):
+            listing_args({'limit': 'ten'})
@@ -0,0 +1,154 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from app.services.llm_dispatch import HedgedDispatcher
+from app.services.rag_service import RAGService
+
+# 路径 -> (延迟秒数, 状态码, 响应体)
+STUB_ROUTES = {
+    '/slow/chat/completions': (1.5, 200, {'choices': [{'message': {'content': 'deepseek建议'}}]}),
+    '/fast/chat/completions': (0.0, 200, {'choices': [{'message': {'content': 'deepseek建议'}}]}),
+    '/broken/chat/completions': (0.0, 500, {'error': 'boom'}),
+    '/qwen': (0.0, 200, {'output': {'text': '通义千问建议'}}),
+    '/qwen-slow': (1.5, 200, {'output': {'text': '通义千问建议'}}),
+    '/stream/chat/completions': (0.3, 200, [
+        {'choices': [{'delta': {'content': '第一段'}}]},
+        {'choices': [{'delta': {'content': '第二段'}}]},
+        '[DONE]'
+    ]),
+    '/qwen-stream': (0.0, 200, [
+        {'output': {'text': '千问'}},
+        {'output': {'text': '流式'}}
+    ]),
+}
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        delay, status, body = STUB_ROUTES[self.path]
+        time.sleep(delay)
+        if isinstance(body, list):
+            # SSE响应：每个元素一条data消息
+            lines = [item if isinstance(item, str) else json.dumps(item) for item in body]
+            payload = ''.join(f"data: {line}\n\n" for line in lines).encode('utf-8')
+            content_type = 'text/event-stream'
+        else:
+            payload = json.dumps(body).encode('utf-8')
+            content_type = 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 被放弃的调用会提前断开连接，忽略BrokenPipe
+        pass
+
+@pytest.fixture(scope='module')
+def stub_url():
+    """本地模型API桩服务"""
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def make_service(stub_url, deepseek_path, qwen_path, hedge_delay=0.2, deadline=5.0):
+    rag_service = RAGService()
+    rag_service.gemini_api_key = None
+    rag_service.deepseek_api_key = 'test'
+    rag_service.qwen_api_key = 'test'
+    rag_service.deepseek_base_url = f"{stub_url}/{deepseek_path}"
+    rag_service.qwen_base_url = f"{stub_url}/{qwen_path}"
+    rag_service.dispatch_mode = 'hedged'
+    rag_service.dispatcher = HedgedDispatcher(hedge_delay=hedge_delay, deadline=deadline)
+    return rag_service
+
+class TestHedgedDispatch:
+    def test_primary_answers_first(self, stub_url):
+        """测试首选提供方及时返回时不启动对冲调用"""
+        rag_service = make_service(stub_url, 'fast', 'qwen-slow')
+        assert rag_service._request_llm_advice('context') == 'deepseek建议'
+
+    def test_hedge_after_delay(self, stub_url):
+        """测试首选提供方过慢时由对冲调用先返回"""
+        rag_service = make_service(stub_url, 'slow', 'qwen')
+        start = time.monotonic()
+        assert rag_service._request_llm_advice('context') == '通义千问建议'
+        assert time.monotonic() - start < 1.0
+
+    def test_failure_launches_next_immediately(self, stub_url):
+        """测试首选提供方失败时立即启动下一个提供方"""
+        rag_service = make_service(stub_url, 'broken', 'qwen', hedge_delay=10.0)
+        start = time.monotonic()
+        assert rag_service._request_llm_advice('context') == '通义千问建议'
+        assert time.monotonic() - start < 1.0
+
+    def test_overall_deadline(self, stub_url):
+        """测试整体时限到达后返回备用建议"""
+        rag_service = make_service(stub_url, 'slow', 'qwen-slow', hedge_delay=0.1, deadline=0.4)
+        start = time.monotonic()
+        assert rag_service._request_llm_advice('context') is None
+        assert time.monotonic() - start < 1.0
+        assert rag_service._generate_advice_with_llm('context') == rag_service._generate_fallback_advice('context')
+
+    def test_dispatch_reports_provider(self):
+        """测试返回结果来自哪个提供方"""
+        dispatcher = HedgedDispatcher(hedge_delay=0.05, deadline=1.0)
+        calls = [
+            ('a', lambda timeout: None),
+            ('b', lambda timeout: 'ok')
+        ]
+        assert dispatcher.dispatch(calls) == ('ok', 'b')
+        assert dispatcher.dispatch([]) == (None, None)
+
+class TestStreamingAdvice:
+    student = {'_id': 's1', 'name': '张三', 'grades': [{'course': 'CS3001', 'score': 90}]}
+    course = {'_id': 'c1', 'course_code': 'CS5187', 'topics': ['Neural Networks', 'Deep Learning']}
+
+    def test_meta_before_tokens(self, stub_url):
+        """测试确定性内容先于模型输出发送，随后逐段输出建议"""
+        rag_service = make_service(stub_url, 'stream', 'qwen-stream')
+        rag_service.qwen_api_key = None
+        start = time.monotonic()
+        events = rag_service.stream_learning_advice(self.student, self.course)
+
+        event, payload = next(events)
+        assert event == 'meta'
+        assert time.monotonic() - start < 0.2
+        assert len(payload['study_plan']) == 2
+        assert payload['difficulty_assessment'] == 'easy'
+
+        rest = list(events)
+        assert [payload['text'] for event, payload in rest if event == 'token'] == ['第一段', '第二段']
+        assert rest[-1] == ('done', {'provider': 'deepseek', 'cached': False})
+
+    def test_stream_falls_back_to_next_provider(self, stub_url):
+        """测试首个片段前失败时切换提供方"""
+        rag_service = make_service(stub_url, 'broken', 'qwen-stream')
+        rag_service.provider_registry.max_attempts = 1
+        events = list(rag_service.stream_learning_advice(self.student, self.course))
+
+        assert [payload['text'] for event, payload in events if event == 'token'] == ['千问', '流式']
+        assert events[-1][1]['provider'] == 'qwen'
+
+    def test_stream_fallback_advice(self):
+        """测试未配置模型时输出备用建议"""
+        rag_service = RAGService()
+        rag_service.gemini_api_key = None
+        rag_service.deepseek_api_key = None
+        rag_service.qwen_api_key = None
+        events = list(rag_service.stream_learning_advice(self.student, self.course))
+
+        assert events[1][0] == 'token'
+        assert events[-1] == ('done', {'provider': 'fallback', 'cached': False})
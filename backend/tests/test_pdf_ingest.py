@@ -0,0 +1,123 @@
+import os
+import zipfile
+from io import BytesIO
+
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.cli import find_pdfs
+from app.routes.pdf_routes import BulkUploadTooLarge, _save_bulk_uploads
+from app.models.course import Course
+from app.services.extraction_cache import ExtractionCache
+from app.services.pdf_ingest import PDFIngestor
+from app.services.pdf_service import PDFService
+
+mongomock = pytest.importorskip('mongomock')
+
+
+class TestCourseBulkUpsert:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+        self.course_model = Course(self.db)
+
+    def test_bulk_upsert_by_course_code(self):
+        """测试按课程代码批量新增与更新，同批重复代码只保留最后一条"""
+        existing_id = self.course_model.create_course({'course_code': 'CS5187', 'course_name': '旧名称'})
+
+        course_ids = self.course_model.bulk_upsert([
+            {'course_code': 'CS5187', 'course_name': 'Machine Learning'},
+            {'course_code': 'CS6001', 'course_name': 'Deep Learning'},
+            {'course_code': 'CS6001', 'course_name': 'Deep Learning II'},
+            {'course_code': '', 'course_name': '无代码'}
+        ])
+
+        assert course_ids['CS5187'] == existing_id
+        assert set(course_ids) == {'CS5187', 'CS6001'}
+        assert self.db.courses.count_documents({}) == 2
+        assert self.course_model.get_course(existing_id)['course_name'] == 'Machine Learning'
+        new_course = self.course_model.get_course(course_ids['CS6001'])
+        assert new_course['course_name'] == 'Deep Learning II'
+        assert 'created_at' in new_course
+
+
+class TestPDFIngestor:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+        self.pdf_service = PDFService(extract_workers=1)
+
+    def _write(self, tmp_path, name, content):
+        path = tmp_path / name
+        path.write_bytes(content)
+        return name, str(path)
+
+    def test_ingest_reports_each_file(self, tmp_path, course_pdf):
+        """测试批量导入逐个返回结果，并在重复导入时使用解析缓存"""
+        files = [
+            self._write(tmp_path, 'a.pdf', course_pdf(['CS5187: Machine Learning', 'Description:', 'Neural networks', 'Topics:', '- Regression'])),
+            self._write(tmp_path, 'b.pdf', course_pdf(['CS6001: Deep Learning', 'Description:', 'Deep networks', 'Topics:', '- Convolution'])),
+            self._write(tmp_path, 'broken.pdf', b'%PDF-1.4 broken'),
+            self._write(tmp_path, 'blank.pdf', course_pdf(['No course code here']))
+        ]
+        ingestor = PDFIngestor(self.db, self.pdf_service, extraction_cache=ExtractionCache(self.db), batch_size=1)
+
+        lines = list(ingestor.ingest(files))
+
+        # 每个文件解析完成即产生进度行，写入结果在所在批次写入后产生
+        statuses = [(line['filename'], line['status']) for line in lines if 'filename' in line]
+        assert statuses.index(('a.pdf', 'parsed')) < statuses.index(('a.pdf', 'ok'))
+        assert ('broken.pdf', 'parsed') not in statuses
+        by_file = {line['filename']: line for line in lines if 'filename' in line}
+        assert by_file['a.pdf']['status'] == 'ok'
+        assert by_file['a.pdf']['course_code'] == 'CS5187'
+        assert by_file['b.pdf']['course_code'] == 'CS6001'
+        assert by_file['broken.pdf']['status'] == 'error'
+        assert by_file['blank.pdf']['error'] == '未识别到课程代码'
+        assert lines[-1]['summary'] == {'total': 4, 'succeeded': 2, 'failed': 2, 'cached': 0, 'courses': 2}
+        course = self.db.courses.find_one({'course_code': 'CS5187'})
+        assert course['description'] == 'Neural networks'
+        assert course['source_sha256']
+
+        lines = list(ingestor.ingest(files[:2]))
+
+        assert lines[-1]['summary']['cached'] == 2
+        assert self.db.courses.count_documents({}) == 2
+
+    def test_find_pdfs(self, tmp_path):
+        """测试命令行导入时查找目录中的PDF文件"""
+        (tmp_path / 'sub').mkdir()
+        for name in ('b.pdf', 'a.PDF', 'notes.txt', os.path.join('sub', 'c.pdf')):
+            (tmp_path / name).write_bytes(b'%PDF-1.4')
+
+        assert [name for name, _ in find_pdfs(str(tmp_path))] == ['a.PDF', 'b.pdf']
+        assert [name for name, _ in find_pdfs(str(tmp_path), recursive=True)] == ['a.PDF', 'b.pdf', os.path.join('sub', 'c.pdf')]
+
+
+class TestBulkUploads:
+    def _zip(self, entries):
+        output = BytesIO()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, content in entries:
+                archive.writestr(name, content)
+        output.seek(0)
+        return FileStorage(stream=output, filename='courses.zip')
+
+    def test_save_zip_entries(self, tmp_path):
+        """测试解压zip中的PDF，跳过目录与非PDF条目，超过单文件大小的条目被拒绝"""
+        upload = self._zip([('a.pdf', b'%PDF-1.4 a'), ('notes.txt', b'x'), ('__MACOSX/a.pdf', b'x'), ('big.pdf', b'%PDF' + b'0' * 100)])
+
+        files, rejected = _save_bulk_uploads([upload], str(tmp_path), 50, 1000, 10)
+
+        assert [name for name, _ in files] == ['a.pdf']
+        assert [line['filename'] for line in rejected] == ['big.pdf']
+
+    def test_zip_limits_checked_before_extracting(self, tmp_path):
+        """测试zip条目数与解压后的总大小在解压前检查"""
+        entries = [(f'{index}.pdf', b'0' * 400) for index in range(3)]
+
+        with pytest.raises(BulkUploadTooLarge):
+            _save_bulk_uploads([self._zip(entries)], str(tmp_path), 1000, 1000, 10)
+        with pytest.raises(BulkUploadTooLarge):
+            _save_bulk_uploads([self._zip(entries)], str(tmp_path), 1000, 10000, 2)
+        assert os.listdir(tmp_path) == []
+
+        files, _ = _save_bulk_uploads([self._zip(entries)], str(tmp_path), 1000, 1200, 3)
+        assert len(files) == 3
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import pytest
+from app.services.extraction_cache import ExtractionCache
+from app.services.pdf_pipeline import DONE, FAILED, RUNNING, SKIPPED, IngestionPipeline, IngestionQueueFull
+from app.services.pdf_service import PDFService
+
+mongomock = pytest.importorskip('mongomock')
+
+COURSE_LINES = ['CS5187: Machine Learning', 'Description:', 'Neural networks', 'Topics:', '- Regression']
+
+
+def wait_for(pipeline, ingestion_id, status, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ingestion = pipeline.get(ingestion_id)
+        if ingestion['status'] == status:
+            return ingestion
+        time.sleep(0.01)
+    raise AssertionError(f'导入未在{timeout}秒内进入{status}状态')
+
+
+class _RetrievalIndex:
+    """add_document在前failures次调用时失败，可以用gate阻塞"""
+    def __init__(self, failures=0, gate=None):
+        self.failures = failures
+        self.gate = gate
+        self.calls = []
+
+    def add_document(self, course_code, text, course_id=None):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.calls.append(course_code)
+        if len(self.calls) <= self.failures:
+            raise RuntimeError('索引不可用')
+
+
+class TestIngestionPipeline:
+    def setup_method(self):
+        self.db = mongomock.MongoClient().db
+        self.services = {
+            'pdf_service': PDFService(extract_workers=1),
+            'extraction_cache': ExtractionCache(self.db)
+        }
+
+    def _pipeline(self, tmp_path, **kwargs):
+        return IngestionPipeline(self.db, self.services.get, str(tmp_path), **kwargs)
+
+    def test_stages_run_in_background(self, tmp_path, course_pdf):
+        """测试导入在后台依次完成各阶段并记录耗时，重复上传时跳过解析"""
+        self.services['retrieval_index'] = _RetrievalIndex()
+        pipeline = self._pipeline(tmp_path)
+        content = course_pdf(COURSE_LINES)
+
+        ingestion = pipeline.submit('a.pdf', BytesIO(content))
+
+        done = wait_for(pipeline, ingestion['ingestion_id'], DONE)
+        assert [stage['name'] for stage in done['stages']] == ['spool', 'extract', 'parse', 'persist', 'index']
+        assert all(stage['status'] == DONE and stage['duration_ms'] >= 0 for stage in done['stages'])
+        assert done['result']['course_code'] == 'CS5187'
+        assert self.db.courses.find_one({'course_code': 'CS5187'})['description'] == 'Neural networks'
+        assert self.services['retrieval_index'].calls == ['CS5187']
+        assert os.listdir(tmp_path) == []
+
+        again = wait_for(pipeline, pipeline.submit('a.pdf', BytesIO(content))['ingestion_id'], DONE)
+        assert again['stages'][2]['status'] == SKIPPED
+        assert again['result']['cached'] is True
+        assert self.db.courses.count_documents({}) == 1
+
+    def test_retry_resumes_from_failed_stage(self, tmp_path, course_pdf):
+        """测试失败的阶段重试时不重新上传、不重复之前已完成的阶段"""
+        self.services['retrieval_index'] = _RetrievalIndex(failures=1)
+        pipeline = self._pipeline(tmp_path)
+        ingestion_id = pipeline.submit('a.pdf', BytesIO(course_pdf(COURSE_LINES)))['ingestion_id']
+
+        failed = wait_for(pipeline, ingestion_id, FAILED)
+        assert failed['stage'] == 'index'
+        assert failed['stages'][3]['status'] == DONE
+        assert '索引不可用' in failed['error']
+        self.db.pdf_extractions.delete_many({})
+
+        assert pipeline.retry(ingestion_id)['stage'] == 'index'
+        done = wait_for(pipeline, ingestion_id, DONE)
+        assert done['attempts'] == 2
+        assert self.services['retrieval_index'].calls == ['CS5187', 'CS5187']
+        assert self.db.pdf_extractions.count_documents({}) == 0
+        with pytest.raises(ValueError):
+            pipeline.retry(ingestion_id)
+        assert pipeline.retry('missing') is None
+
+    def test_queue_full(self, tmp_path, course_pdf):
+        """测试排队与执行中的导入达到上限时拒绝新的导入"""
+        gate = threading.Event()
+        self.services['retrieval_index'] = _RetrievalIndex(gate=gate)
+        pipeline = self._pipeline(tmp_path, max_pending=1)
+        content = course_pdf(COURSE_LINES)
+
+        ingestion_id = pipeline.submit('a.pdf', BytesIO(content))['ingestion_id']
+        try:
+            assert pipeline.is_full()
+            with pytest.raises(IngestionQueueFull):
+                pipeline.submit('b.pdf', BytesIO(content))
+        finally:
+            gate.set()
+
+        wait_for(pipeline, ingestion_id, DONE)
+        assert self.db.pdf_ingestions.count_documents({}) == 1
+        assert len(os.listdir(tmp_path)) == 0
+
+    def test_rejected_file_is_removed(self, tmp_path, course_pdf):
+        """测试文件内容无法导入时立即删除文件，且不允许重试"""
+        pipeline = self._pipeline(tmp_path)
+        ingestion_id = pipeline.submit('blank.pdf', BytesIO(course_pdf(['No course code here'])))['ingestion_id']
+
+        failed = wait_for(pipeline, ingestion_id, FAILED)
+        assert failed['error'] == '未识别到课程代码'
+        assert failed['retryable'] is False
+        assert os.listdir(tmp_path) == []
+        with pytest.raises(ValueError, match='无法导入'):
+            pipeline.retry(ingestion_id)
+
+    def test_cleanup_expired_failures(self, tmp_path, course_pdf):
+        """测试清理失败超过保留期的导入文件与没有记录的残留文件"""
+        self.services['retrieval_index'] = _RetrievalIndex(failures=1)
+        pipeline = self._pipeline(tmp_path, failed_ttl=60)
+        ingestion_id = pipeline.submit('a.pdf', BytesIO(course_pdf(COURSE_LINES)))['ingestion_id']
+        wait_for(pipeline, ingestion_id, FAILED)
+        orphan = tmp_path / '0123456789abcdef01234567.pdf'
+        orphan.write_bytes(b'%PDF-1.4')
+
+        assert pipeline.cleanup() == 0
+        assert len(os.listdir(tmp_path)) == 3
+
+        old = datetime.utcnow() - timedelta(seconds=120)
+        self.db.pdf_ingestions.update_many({}, {'$set': {'updated_at': old}})
+        os.utime(orphan, (old.timestamp() - 86400, old.timestamp() - 86400))
+        assert pipeline.cleanup() == 2
+        assert os.listdir(tmp_path) == []
+        assert pipeline.get(ingestion_id)['retryable'] is False
+        with pytest.raises(ValueError, match='重新上传'):
+            pipeline.retry(ingestion_id)
+
+    def test_heartbeat_keeps_long_stage_alive(self, tmp_path, course_pdf):
+        """测试长时间的阶段定期刷新updated_at，不会被当作中断重试；被重新认领后原来的执行不再写入"""
+        gate = threading.Event()
+        self.services['retrieval_index'] = _RetrievalIndex(gate=gate)
+        pipeline = self._pipeline(tmp_path, stale_after=0.2, heartbeat_interval=0.02)
+        ingestion_id = pipeline.submit('a.pdf', BytesIO(course_pdf(COURSE_LINES)))['ingestion_id']
+        try:
+            wait_for(pipeline, ingestion_id, RUNNING)
+            time.sleep(0.4)
+            with pytest.raises(ValueError, match='仍在进行中'):
+                pipeline.retry(ingestion_id)
+
+            # 模拟其他worker接管：原来的执行完成后不再写入状态
+            self.db.pdf_ingestions.update_one({}, {'$set': {'run_id': None}})
+        finally:
+            gate.set()
+        time.sleep(0.2)
+        assert pipeline.get(ingestion_id)['status'] == RUNNING
@@ -1,6 +1,56 @@
 import pytest
 import os
-from app.services.pdf_service import PDFService
+from io import BytesIO
+from app.services import pdf_service as pdf_service_module
+from app.services.pdf_service import PDFDocument, PDFService, PDFUploadError, PageText, _page_ranges
+
+
+def _sample_pdf(pages: int = 1, metadata: dict = None) -> bytes:
+    import PyPDF2
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    if metadata:
+        writer.add_metadata(metadata)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def _text_pdf(pages: int) -> bytes:
+    """每页一行文本"Page i"的PDF"""
+    import PyPDF2
+    from PyPDF2 import PageObject
+    from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+    writer = PyPDF2.PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica')
+    }))
+    for i in range(pages):
+        page = PageObject.create_blank_page(width=200, height=200)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})
+        })
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 20 100 Td (Page {i}) Tj ET".encode())
+        page[NameObject('/Contents')] = writer._add_object(content)
+        writer.add_page(page)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+class _ChunkedStream:
+    """不可随机读取的上传流"""
+    def __init__(self, content: bytes):
+        self._buffer = BytesIO(content)
+        self.reads = 0
+    
+    def read(self, size=-1):
+        self.reads += 1
+        return self._buffer.read(size)
 
 class TestPDFService:
     def setup_method(self):
@@ -68,4 +118,192 @@ class TestPDFService:
         
         result = self.pdf_service.validate_pdf_file(invalid_content)
         
-        assert result == False
\ No newline at end of file
+        assert result == False
+    
+    def test_spool_upload_from_stream(self):
+        """测试不可随机读取的流按块写入临时文件后可直接解析"""
+        content = _sample_pdf(pages=2)
+        
+        pdf_file = self.pdf_service.spool_upload(_ChunkedStream(content))
+        
+        assert pdf_file.read() == content
+        assert self.pdf_service.validate_pdf_file(pdf_file) is True
+        assert self.pdf_service.extract_text_from_pdf(pdf_file) == ''
+    
+    def test_spool_upload_reuses_seekable_stream(self):
+        """测试可随机读取的上传文件直接复用"""
+        stream = BytesIO(_sample_pdf())
+        stream.seek(10)
+        
+        assert self.pdf_service.spool_upload(stream) is stream
+        assert stream.tell() == 0
+    
+    def test_spool_upload_rejects_bad_magic(self):
+        """测试文件头不是PDF时只读取文件头即拒绝"""
+        stream = _ChunkedStream(b"GIF89a" + b"x" * 10 * 1024 * 1024)
+        
+        with pytest.raises(PDFUploadError) as error:
+            self.pdf_service.spool_upload(stream)
+        
+        assert error.value.status_code == 400
+        assert stream.reads == 1
+    
+    def test_spool_upload_rejects_oversized_file(self):
+        """测试超过大小限制的文件被拒绝"""
+        pdf_service = PDFService(max_file_size=1024)
+        content = b"%PDF-1.4\n" + b"x" * 4096
+        
+        for stream in (_ChunkedStream(content), BytesIO(content)):
+            with pytest.raises(PDFUploadError) as error:
+                pdf_service.spool_upload(stream)
+            assert error.value.status_code == 413
+        
+        with pytest.raises(PDFUploadError):
+            pdf_service.check_upload_size(2048)
+        pdf_service.check_upload_size(None)
+    
+    def test_open_pdf_once(self):
+        """测试打开后的句柄提供验证结果、页数、元数据与页面文本"""
+        content = _sample_pdf(pages=3, metadata={'/Title': 'CS5187', '/Author': 'Dept'})
+        
+        document = self.pdf_service.open_pdf(BytesIO(content))
+        
+        assert isinstance(document, PDFDocument)
+        assert document.is_valid is True
+        assert document.error is None
+        assert document.page_count == 3
+        assert document.metadata['title'] == 'CS5187'
+        assert document.metadata['author'] == 'Dept'
+        assert document.page_text(0) == ''
+        assert self.pdf_service.validate_pdf_file(document) is True
+        assert self.pdf_service.extract_text_from_pdf(document) == ''
+    
+    def test_open_pdf_invalid(self):
+        """测试无效文件返回带错误信息的句柄"""
+        document = self.pdf_service.open_pdf(b"This is not a PDF file")
+        
+        assert document.is_valid is False
+        assert document.page_count == 0
+        assert document.error
+        assert document.metadata == {}
+        with pytest.raises(Exception, match='PDF解析失败'):
+            self.pdf_service.extract_text_from_pdf(document)
+    
+    def test_page_ranges(self):
+        """测试页范围划分"""
+        assert _page_ranges(10, 4) == [(0, 3), (3, 6), (6, 9), (9, 10)]
+        assert _page_ranges(3, 8) == [(0, 1), (1, 2), (2, 3)]
+    
+    def test_small_document_extracts_serially(self, monkeypatch):
+        """测试页数少于阈值时不使用进程池"""
+        def fail(max_workers):
+            raise AssertionError('不应创建进程池')
+        monkeypatch.setattr(pdf_service_module, 'get_extract_executor', fail)
+        pdf_service = PDFService(extract_workers=2, parallel_min_pages=10)
+        
+        text = pdf_service.extract_text_from_pdf(_text_pdf(3))
+        
+        assert text.split('\n') == ['Page 0', 'Page 1', 'Page 2']
+    
+    def test_parallel_extraction_keeps_page_order(self):
+        """测试进程池并行提取的结果与逐页提取一致"""
+        content = _text_pdf(7)
+        serial = PDFService(extract_workers=1).extract_text_from_pdf(content)
+        
+        pdf_service = PDFService(extract_workers=2, parallel_min_pages=2)
+        document = pdf_service.open_pdf(BytesIO(content))
+        
+        assert pdf_service._extract_parallel(document) == serial
+        assert serial.split('\n') == [f'Page {i}' for i in range(7)]
+    
+    def test_iter_pages_offsets(self):
+        """测试逐页文本的字符偏移与全文一致"""
+        content = _text_pdf(3)
+        full_text = '\n'.join(page.text for page in self.pdf_service.iter_pages(content))
+        
+        pages = list(self.pdf_service.iter_pages(content))
+        
+        assert [page.index for page in pages] == [0, 1, 2]
+        for page in pages:
+            assert full_text[page.offset:page.offset + len(page.text)] == page.text
+        assert ''.join(self.pdf_service.iter_text(content)) == full_text
+    
+    def test_parse_course_fields_stops_early(self):
+        """测试请求的字段确定后不再读取后续页面"""
+        pages = [
+            "CS5187: Advanced Machine Learning\nCourse Description:\nDeep learning and more.\n",
+            "Topics:\n1. Neural Networks\n2. Deep Learning\nAssessment:\n- Exam 60%\n",
+            "Prerequisites:\n- CS3001: Data Structures\n"
+        ]
+        consumed = []
+        
+        def page_iter():
+            for index, text in enumerate(pages):
+                consumed.append(index)
+                yield PageText(index, 0, text)
+        
+        result, pages_read = self.pdf_service.parse_course_fields(page_iter(), ['course_code', 'course_name'])
+        
+        assert result == {'course_code': 'CS5187', 'course_name': 'Advanced Machine Learning'}
+        assert pages_read == 1
+        assert consumed == [0]
+        
+        # 描述在下一小节标题出现后才确定
+        result, pages_read = self.pdf_service.parse_course_fields(iter(pages), ['description', 'topics'])
+        full = self.pdf_service.parse_course_description('\n'.join(pages))
+        assert pages_read == 2
+        assert result == {'description': full['description'], 'topics': full['topics']}
+    
+    def test_parse_course_fields_matches_full_parse(self):
+        """测试读完全部页面后的结果与全文解析一致"""
+        pages = ["课程描述：\n中文描述\nObjectives:\n- Learn things well\n", "Description:\nEnglish text\nTopics:\n- Graphs and trees\n"]
+        
+        result, pages_read = self.pdf_service.parse_course_fields(iter(pages))
+        
+        full = self.pdf_service.parse_course_description('\n'.join(pages).strip())
+        assert pages_read == 2
+        assert result == {field: full[field] for field in result}
+        assert result['description'] == 'English text'
+        with pytest.raises(ValueError):
+            self.pdf_service.parse_course_fields(iter(pages), ['textbooks'])
+    def test_parse_course_description_heading_lines(self):
+        """测试小节标题只在行首识别，英文标题优先于中文标题，小节内容到下一个标题行为止"""
+        text = (
+            "课程描述：\n中文描述\n"
+            "The course description is covered below.\n"
+            "Course Description:\nComputer vision basics.\n"
+            "Assessment Methods:\n- Final exam 60%\n- Project 40%\n"
+            "Note:\nSubject to change\n"
+            "先修课程：\n- CS3334 Data Structures\n"
+        )
+        
+        result = self.pdf_service.parse_course_description(text)
+        
+        assert result['description'] == 'Computer vision basics.'
+        assert result['assessment'] == ['Final exam 60%', 'Project 40%']
+        assert result['prerequisites'] == ['CS3334 Data Structures']
+        assert result['topics'] == []
+        
+    def test_parse_course_fields_across_pages(self):
+        """测试课程名称与小节内容跨页时，逐页解析与全文解析一致"""
+        pages = ["Intro\nCS5187:  ", "Vision and Image\nTopics:\n- Image filtering", "- Segmentation\nPrerequisites:\n- CS3334"]
+        
+        result, pages_read = self.pdf_service.parse_course_fields(iter(pages))
+        
+        assert pages_read == 3
+        assert result == {field: value for field, value in self.pdf_service.parse_course_description('\n'.join(pages)).items() if field in result}
+        assert result['course_name'] == 'Vision and Image'
+        assert result['topics'] == ['Image filtering', 'Segmentation']
+        
+    def test_parse_course_description_is_linear(self):
+        """测试格式混乱、没有结束标题行的长文本不会因回溯而变慢"""
+        import time
+        line = "the content and description of each topic covers evaluation of objectives " * 4 + "\n"
+        text = "CS5187 Vision\nDescription:\n" + line * 4000
+        
+        start = time.perf_counter()
+        result = self.pdf_service.parse_course_description(text)
+        
+        assert time.perf_counter() - start < 1
+        assert result['course_code'] == 'CS5187'
+        assert result['description'].startswith('the content')
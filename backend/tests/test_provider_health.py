@@ -0,0 +1,61 @@
+import time
+
+import pytest
+from app.services.provider_health import ProviderError, ProviderRegistry, CLOSED, OPEN, HALF_OPEN
+
+class TestProviderRegistry:
+    def setup_method(self):
+        self.registry = ProviderRegistry(max_attempts=3, backoff_base=0.01, failure_threshold=2, open_seconds=0.1)
+
+    def test_retry_then_success(self):
+        """测试可重试错误按退避重试"""
+        attempts = []
+
+        def flaky(remaining):
+            attempts.append(remaining)
+            if len(attempts) < 2:
+                raise ProviderError('503', retryable=True)
+            return 'ok'
+
+        assert self.registry.call('deepseek', flaky, timeout=5) == 'ok'
+        assert len(attempts) == 2
+
+    def test_non_retryable_error(self):
+        """测试不可重试错误只调用一次"""
+        attempts = []
+
+        def unauthorized(remaining):
+            attempts.append(remaining)
+            raise ProviderError('401')
+
+        assert self.registry.call('qwen', unauthorized) is None
+        assert len(attempts) == 1
+
+    def test_circuit_opens_and_half_open_probe(self):
+        """测试连续失败后熔断，冷却后只放行一个探测请求"""
+        def failing(remaining):
+            raise ProviderError('500', retryable=True)
+
+        assert self.registry.call('gemini', failing) is None
+        health = self.registry.get('gemini')
+        assert health.snapshot()['state'] == OPEN
+        assert self.registry.rank(['gemini', 'qwen']) == ['qwen']
+        assert self.registry.call('gemini', lambda remaining: 'ok') is None
+
+        time.sleep(0.15)
+        assert self.registry.rank(['gemini']) == ['gemini']
+        assert health.acquire() is True
+        assert health.snapshot()['state'] == HALF_OPEN
+        assert health.acquire() is False
+
+        health.record_success(0.2)
+        assert health.snapshot()['state'] == CLOSED
+
+    def test_rank_prefers_fast_and_healthy(self):
+        """测试按延迟和错误率排序"""
+        self.registry.get('gemini').record_success(3.0)
+        self.registry.get('deepseek').record_success(0.5)
+        self.registry.get('qwen').record_success(0.4)
+        self.registry.get('qwen').record_failure(0.4)
+
+        assert self.registry.rank(['gemini', 'deepseek', 'qwen']) == ['deepseek', 'qwen', 'gemini']
@@ -1,4 +1,5 @@
 import pytest
+import json
 from app.services.rag_service import RAGService
 
 class TestRAGService:
@@ -82,8 +83,67 @@ class TestRAGService:
         assert any(r['type'] == 'textbook' for r in resources)
         assert any(r['priority'] == 'high' for r in resources)
     
-    def test_is_related_course(self):
-        """测试相关课程判断"""
-        assert self.rag_service._is_related_course('CS3001', 'CS5187') == True
-        assert self.rag_service._is_related_course('MATH2001', 'CS5187') == False
-        assert self.rag_service._is_related_course('', 'CS5187') == False
\ No newline at end of file
+    def test_build_context_with_retrieved_chunks(self):
+        """测试检索片段按预算写入上下文"""
+        self.rag_service.context_chunk_budget = 50
+        chunks = [
+            {'text': 'a' * 30, 'score': 0.9},
+            {'text': 'b' * 30, 'score': 0.5}
+        ]
+        
+        context = self.rag_service._build_context({'name': '张三'}, {'course_code': 'CS5187'}, chunks)
+        
+        assert '课程资料摘录' in context
+        assert 'a' * 30 in context
+        assert 'b' * 30 not in context
+    
+    def test_generate_batch_advice_dedupes_contexts(self):
+        """测试批量生成时相同上下文只生成一次，单项错误不影响其他项"""
+        calls = []
+        
+        def fake_llm(context):
+            calls.append(context)
+            return '建议'
+        
+        self.rag_service._request_llm_advice = fake_llm
+        student = {'_id': 's1', 'name': '张三', 'grades': [{'course': 'CS3001', 'score': 80}]}
+        course = {'_id': 'c1', 'course_code': 'CS5187', 'topics': ['AI']}
+        other_course = {'_id': 'c2', 'course_code': 'CS6000', 'topics': ['DB']}
+        broken_course = {'_id': 'c3', 'course_code': 'CS7000', 'topics': None}
+        
+        pairs = [(student, course), (student, other_course), (student, course), (student, broken_course)]
+        results = list(self.rag_service.generate_batch_advice(pairs))
+        
+        # 重复的(student, course)组合只调用一次模型
+        assert len(calls) == 3
+        indices = sorted(i for item_indices, result, error in results if error is None for i in item_indices)
+        assert indices == [0, 1, 2]
+        errors = [item_indices for item_indices, result, error in results if error]
+        assert errors == [[3]]
+
+class TestBatchAdviceRoute:
+    def setup_method(self):
+        mongomock = pytest.importorskip('mongomock')
+        from flask import Flask
+        from app.routes.rag_routes import rag_bp
+
+        app = Flask(__name__)
+        app.db = mongomock.MongoClient().db
+        app.extensions['services'] = {'rag_service': RAGService()}
+        app.register_blueprint(rag_bp, url_prefix='/api/rag')
+        self.client = app.test_client()
+
+    def test_non_string_ids_are_rejected(self):
+        """测试组合中的ID不是字符串时在开始流式返回前返回400"""
+        for pairs in ([{'student_id': {'$ne': None}, 'course_id': 'c1'}], [['s1', ['c1']]], [['s1', 1]]):
+            response = self.client.post('/api/rag/advice/batch', json={'pairs': pairs})
+            assert response.status_code == 400
+            assert '字符串' in response.get_json()['error']
+
+    def test_missing_ids_are_reported_per_line(self):
+        """测试缺失的ID仍在结果中逐行报错"""
+        response = self.client.post('/api/rag/advice/batch', json={'pairs': [{'student_id': 's1'}]})
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert lines[0]['error'] == '缺少学生ID或课程ID'
+        assert lines[-1]['summary']['failed'] == 1
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from flask import Flask
+from app.services.registry import ServiceRegistry, get_service
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestServiceRegistry:
+    def test_lazy_single_instance(self):
+        """测试服务在首次使用时创建且只创建一次"""
+        created = []
+        registry = ServiceRegistry()
+        registry.register('demo', lambda: created.append(1) or object())
+
+        assert registry.status() == {'demo': False}
+        assert registry.get_if_created('demo') is None
+
+        app = Flask(__name__)
+        app.extensions['services'] = registry
+        with app.app_context():
+            first = get_service('demo')
+            second = get_service('demo')
+
+        assert first is second
+        assert created == [1]
+        assert registry.created() == ['demo']
+
+    def test_create_app_skips_heavy_imports(self):
+        """测试create_app不导入numpy、scipy、sklearn、google.generativeai和PyPDF2"""
+        probe = (
+            "import sys; from app import create_app; create_app(); "
+            "print('loaded:' + ','.join(m for m in ('numpy', 'scipy', 'sklearn', 'google.generativeai', 'PyPDF2') if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, '-c', probe], cwd=BACKEND_DIR, capture_output=True, text=True)
+
+        assert result.returncode == 0
+        assert result.stdout.strip().splitlines()[-1] == 'loaded:'
+
+    def test_spawned_worker_does_not_create_app(self):
+        """测试进程池的spawn子进程以__mp_main__重新导入app.py时不创建Flask应用"""
+        probe = (
+            "import runpy, app; calls = []; app.create_app = lambda: calls.append(1); "
+            "runpy.run_path('app.py', run_name='__mp_main__'); print('calls:%d' % len(calls))"
+        )
+        result = subprocess.run([sys.executable, '-c', probe], cwd=BACKEND_DIR, capture_output=True, text=True)
+
+        assert result.returncode == 0
+        assert result.stdout.strip().splitlines()[-1] == 'calls:0'
+
+    def test_wsgi_import_creates_app(self):
+        """测试按模块导入app.py（flask --app app.py）和wsgi.py（gunicorn wsgi:app）时得到模块级的app"""
+        probe = (
+            "import runpy, app; app.create_app = lambda: 'wsgi-app'; "
+            "print('app.py:%s' % runpy.run_path('app.py', run_name='app_module').get('app')); "
+            "import wsgi; print('wsgi:%s' % wsgi.app)"
+        )
+        result = subprocess.run([sys.executable, '-c', probe], cwd=BACKEND_DIR, capture_output=True, text=True)
+
+        assert result.returncode == 0
+        assert result.stdout.strip().splitlines()[-2:] == ['app.py:wsgi-app', 'wsgi:wsgi-app']
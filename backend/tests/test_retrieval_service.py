@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from app.services.retrieval_service import RetrievalIndex
+
+mongomock = pytest.importorskip('mongomock')
+
+class TestRetrievalIndex:
+    def setup_method(self):
+        self.index = RetrievalIndex(chunk_size=200, chunk_overlap=20)
+
+    def test_chunk_text(self):
+        """测试文本分块"""
+        text = "\n".join([f"Line {i} about neural networks and training" for i in range(30)])
+        chunks = self.index.chunk_text(text)
+
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 200 for chunk in chunks)
+
+        long_line = "word " * 200
+        chunks = self.index.chunk_text(long_line)
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 200 for chunk in chunks)
+
+    def test_search_top_k(self):
+        """测试检索返回最相关的块"""
+        self.index.add_document('CS5187', "Reinforcement learning with policy gradients.\n\nConvolutional networks for vision.")
+        self.index.add_document('MA2001', "Linear algebra: matrices, eigenvalues and vector spaces.")
+
+        results = self.index.search('policy gradient reinforcement', k=1)
+        assert len(results) == 1
+        assert results[0]['course_code'] == 'CS5187'
+        assert 'policy' in results[0]['text']
+
+        results = self.index.search('eigenvalues', k=3, course_code='CS5187')
+        assert results == []
+
+    def test_incremental_replace(self):
+        """测试重新上传课程时替换旧的块"""
+        self.index.add_document('CS5187', "Old syllabus about compilers")
+        self.index.add_document('CS5187', "New syllabus about databases")
+
+        assert self.index.stats()['courses'] == 1
+        assert self.index.search('compilers') == []
+        assert self.index.search('databases')[0]['course_code'] == 'CS5187'
+
+        self.index.remove_document('CS5187')
+        assert self.index.stats()['chunks'] == 0
+
+    def test_local_write_does_not_skip_other_workers(self):
+        """测试本进程写入后，其他进程更早写入但尚未同步的课程仍会被加载"""
+        db = mongomock.MongoClient().db
+        first = RetrievalIndex(db, chunk_size=200, chunk_overlap=20)
+        second = RetrievalIndex(db, chunk_size=200, chunk_overlap=20)
+
+        first.add_document('CS5187', "Reinforcement learning with policy gradients.")
+        assert second.search('policy gradients')[0]['course_code'] == 'CS5187'
+
+        time.sleep(0.002)
+        first.add_document('MA2001', "Linear algebra: matrices and eigenvalues.")
+        time.sleep(0.002)
+        second.add_document('CS3001', "Operating systems: processes and scheduling.")
+
+        assert second.search('eigenvalues')[0]['course_code'] == 'MA2001'
+        assert second.search('scheduling')[0]['course_code'] == 'CS3001'
+        assert first.search('scheduling')[0]['course_code'] == 'CS3001'
+        assert second.stats()['courses'] == 3
@@ -0,0 +1,95 @@
+import pytest
+from app.services.advice_cache import AdviceCache, invalidate_advice_cache
+from app.services.rag_service import RAGService
+from app.services.semantic_cache import SemanticAdviceCache, normalize_context
+
+COURSE = {
+    '_id': 'c1',
+    'course_code': 'CS5187',
+    'course_name': '机器学习',
+    'description': '介绍机器学习基本方法',
+    'topics': ['回归', '分类', '聚类']
+}
+
+
+def make_student(student_id, name, major, scores):
+    return {
+        '_id': student_id,
+        'name': name,
+        'major': major,
+        'grade': '2023',
+        'grades': [{'course': 'CS3001', 'score': score} for score in scores]
+    }
+
+
+class TestSemanticCache:
+    def setup_method(self):
+        self.rag_service = RAGService()
+        self.calls = []
+
+        def fake_llm(context):
+            self.calls.append(context)
+            return f'建议{len(self.calls)}'
+
+        self.rag_service._request_llm_advice = fake_llm
+
+    def test_normalize_context_buckets_averages(self):
+        """测试上下文不含姓名，规范化将平均分分桶"""
+        context = self.rag_service._build_context(make_student('s1', '张三', '计算机', [81, 82]), COURSE)
+        normalized = normalize_context(context)
+
+        assert '张三' not in normalized
+        assert '平均成绩: 80-85' in normalized
+        assert normalized == normalize_context(
+            self.rag_service._build_context(make_student('s2', '李四', '计算机', [83, 84]), COURSE)
+        )
+
+    def test_similar_students_reuse_advice(self):
+        """测试同专业、同分数段的学生复用建议，不同分数段或不同课程重新生成"""
+        cache = AdviceCache()
+        first = self.rag_service.generate_learning_advice(
+            make_student('s1', '张三', '计算机', [81, 82]), COURSE, advice_cache=cache)
+        similar = self.rag_service.generate_learning_advice(
+            make_student('s2', '李四', '计算机', [83, 84]), COURSE, advice_cache=cache)
+        assert similar['advice'] == first['advice']
+        assert len(self.calls) == 1
+
+        self.rag_service.generate_learning_advice(
+            make_student('s3', '王五', '计算机', [91, 92]), COURSE, advice_cache=cache)
+        self.rag_service.generate_learning_advice(
+            make_student('s4', '赵六', '计算机', [81, 82]), dict(COURSE, _id='c2', course_code='CS5188'), advice_cache=cache)
+        assert len(self.calls) == 3
+
+        stats = self.rag_service.semantic_cache.stats()
+        assert stats['hits'] == 1
+        assert stats['hit_similarity']['mean'] == pytest.approx(1.0)
+        assert stats['miss_similarity']['count'] == 1
+
+    def test_reused_advice_does_not_describe_other_student(self):
+        """测试模型看到的上下文不含姓名和精确平均分，复用给学生B的建议不会出现学生A的信息"""
+        self.rag_service._request_llm_advice = lambda context: f'根据以下信息：{context}'
+        cache = AdviceCache()
+        first = self.rag_service.generate_learning_advice(
+            make_student('s1', '张三', '计算机', [81, 82]), COURSE, advice_cache=cache)
+        second = self.rag_service.generate_learning_advice(
+            make_student('s2', '李四', '计算机', [83, 84]), COURSE, advice_cache=cache)
+
+        assert second['advice'] == first['advice']
+        assert '张三' not in second['advice']
+        assert '81.50' not in second['advice']
+        assert '平均成绩: 80-85' in second['advice']
+
+    def test_course_invalidation_and_threshold(self):
+        """测试课程失效清除条目，阈值控制复用"""
+        semantic_cache = SemanticAdviceCache(threshold=0.99)
+        namespace = ('c1', 'gemini', '1')
+        context = self.rag_service._build_context(make_student('s1', '张三', '计算机', [81]), COURSE)
+        other_year = context.replace('年级: 2023', '年级: 2022')
+        semantic_cache.add(namespace, context, {'advice': 'A'}, student_id='s1')
+
+        advice, similarity = semantic_cache.lookup(namespace, other_year)
+        assert advice is None and 0.5 < similarity < 0.99
+        assert semantic_cache.lookup(namespace, context)[0] == {'advice': 'A'}
+
+        invalidate_advice_cache(None, course_id='c1')
+        assert semantic_cache.lookup(namespace, context)[0] is None
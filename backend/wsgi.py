@@ -0,0 +1,4 @@
+from app import create_app
+
+# WSGI入口：gunicorn wsgi:app（backend/app.py与app包同名，app:app会解析到包而不是该文件）
+app = create_app()
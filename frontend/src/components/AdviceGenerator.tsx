@@ -30,8 +30,8 @@ const AdviceGenerator: React.FC = () => {
   const loadData = async () => {
     try {
       const [studentsRes, coursesRes] = await Promise.all([
-        getStudents(),
-        getCourses()
+        getStudents('name,student_id,major'),
+        getCourses('course_code,course_name')
       ]);
       setStudents(studentsRes.data.students || []);
       setCourses(coursesRes.data.courses || []);
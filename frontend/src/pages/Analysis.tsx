@@ -29,7 +29,7 @@ const Analysis: React.FC = () => {
 
   const loadStudents = async () => {
     try {
-      const response = await getStudents();
+      const response = await getStudents('name,student_id,major');
       setStudents(response.data.students || []);
     } catch (error) {
       console.error('加载学生数据失败:', error);
@@ -30,13 +30,29 @@ export const extractText = (file: File) => {
   });
 };
 
+// 列表接口按_id分页：依次请求各页直到没有next_cursor
+const getAllPages = async (url: string, key: string, fields: string) => {
+  const items: any[] = [];
+  let after: string | null = null;
+  do {
+    const params: Record<string, string | number> = { fields, limit: 1000 };
+    if (after) {
+      params.after = after;
+    }
+    const response: any = await api.get(url, { params });
+    items.push(...(response.data[key] || []));
+    after = response.data.next_cursor;
+  } while (after);
+  return { data: { [key]: items } };
+};
+
 // 学生相关API
 export const createStudent = (studentData: any) => {
   return api.post('/api/students/', studentData);
 };
 
-export const getStudents = () => {
-  return api.get('/api/students/');
+export const getStudents = (fields: string = 'name,student_id,major,grade,grades') => {
+  return getAllPages('/api/students/', 'students', fields);
 };
 
 export const getStudent = (studentId: string) => {
@@ -60,8 +76,8 @@ export const searchStudents = (query: string) => {
 };
 
 // 课程相关API
-export const getCourses = () => {
-  return api.get('/api/rag/courses');
+export const getCourses = (fields: string = 'course_code,course_name,description,objectives,topics,prerequisites,assessment') => {
+  return getAllPages('/api/rag/courses', 'courses', fields);
 };
 
 export const getCourse = (courseId: string) => {
@@ -16,24 +16,52 @@ db.createUser({
 // 创建集合和索引
 db.createCollection('students');
 db.createCollection('courses');
+db.createCollection('grade_buckets');
 
 // 学生集合索引
 db.students.createIndex({ "student_id": 1 }, { unique: true });
 db.students.createIndex({ "name": 1 });
 db.students.createIndex({ "major": 1 });
+// 学生列表按专业/年级筛选并按_id分页
+db.students.createIndex({ "major": 1, "_id": 1 });
+db.students.createIndex({ "grade": 1, "_id": 1 });
+
+// 成绩分桶集合索引（每个学生每个学期一个文档）
+db.grade_buckets.createIndex({ "student_id": 1, "year": 1, "semester": 1 }, { unique: true });
+db.grade_buckets.createIndex({ "grades.course": 1, "grades.score": 1 });
 
 // 课程集合索引
 db.courses.createIndex({ "course_code": 1 }, { unique: true });
 db.courses.createIndex({ "course_name": 1 });
 
 // 插入示例数据
-db.students.insertMany([
+var students = db.students.insertMany([
   {
     name: "张三",
     student_id: "2021001",
     major: "计算机科学",
     grade: "大三",
     email: "zhangsan@example.com",
+    created_at: new Date(),
+    updated_at: new Date()
+  },
+  {
+    name: "李四",
+    student_id: "2021002",
+    major: "软件工程",
+    grade: "大三",
+    email: "lisi@example.com",
+    created_at: new Date(),
+    updated_at: new Date()
+  }
+]);
+
+// 成绩明细按学期分桶存储，student_id为学生文档的_id
+db.grade_buckets.insertMany([
+  {
+    student_id: students.insertedIds[0].toHexString(),
+    year: "2023",
+    semester: "2023春",
     grades: [
       {
         course: "CS3001",
@@ -48,15 +76,14 @@ db.students.insertMany([
         year: "2023"
       }
     ],
+    count: 2,
     created_at: new Date(),
     updated_at: new Date()
   },
   {
-    name: "李四",
-    student_id: "2021002",
-    major: "软件工程",
-    grade: "大三",
-    email: "lisi@example.com",
+    student_id: students.insertedIds[1].toHexString(),
+    year: "2023",
+    semester: "2023春",
     grades: [
       {
         course: "CS3001",
@@ -65,6 +92,7 @@ db.students.insertMany([
         year: "2023"
       }
     ],
+    count: 1,
     created_at: new Date(),
     updated_at: new Date()
   }